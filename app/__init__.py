@@ -1,27 +1,14 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.routes import base_routes, kvk_bevoegdheid_rest_api, mini_suomi, well_known_routes, rdw_niscy
+"""
+KvK issuance service. The FastAPI application is built in app.main and exposed
+here as `app` (uvicorn app:app) on first access, so processes that only need a
+service module, such as the signing workers, do not build the app and open its
+stores when they import the package.
+"""
 
-app = FastAPI()
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",  # Local development
-        "https://mijn-kvk-portal.nieuwlaar.com",
-        "https://kvk-issuance-ui.nieuwlaar.com"
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods
-    allow_headers=["*"],  # Allows all headers
-)
+def __getattr__(name):
+    if name == "app":
+        from app.main import app
 
-# Mount well-known routes at root level
-app.include_router(well_known_routes.router)
-
-# Mount other routes with their prefixes
-app.include_router(base_routes.router)
-app.include_router(mini_suomi.router, prefix="/mini-suomi")
-app.include_router(rdw_niscy.router, prefix="/rdw-niscy")
-app.include_router(kvk_bevoegdheid_rest_api.router, prefix="/bevoegdheid")
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
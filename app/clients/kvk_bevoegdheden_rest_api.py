@@ -1,82 +1,339 @@
-import requests
+import asyncio
+import importlib.util
+import os
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+import httpx
+
+from app.clients.kvk_mirror import kvk_mirror
+from app.clients.kvk_person_cache import (
+    NATURAL_PERSON_COMPANY_CERTIFICATE,
+    SIGNATORY_RIGHTS,
+    kvk_person_cache,
+    natural_person_key,
+    signatory_rights_key,
+)
+from app.clients.kvk_response_cache import COMPANY_CERTIFICATE, LPID, kvk_response_cache
+from app.clients.kvk_upstream_policy import CircuitOpenError, UpstreamPolicy
 
 # Base URL for the KVK Bevoegdheden API
-BASE_URL = "http://localhost:3333/api"
+BASE_URL = os.getenv("KVK_API_BASE_URL", "http://localhost:3333/api")
+
+# Default timeouts for upstream calls; every method also takes a per-call `timeout`
+KVK_API_TIMEOUT_SECONDS = float(os.getenv("KVK_API_TIMEOUT_SECONDS", "10"))
+KVK_API_CONNECT_TIMEOUT_SECONDS = float(os.getenv("KVK_API_CONNECT_TIMEOUT_SECONDS", "3"))
+KVK_API_READ_TIMEOUT_SECONDS = float(os.getenv("KVK_API_READ_TIMEOUT_SECONDS", str(KVK_API_TIMEOUT_SECONDS)))
+# Upper bound on concurrent upstream requests per client (more wait for a free connection)
+KVK_API_MAX_CONNECTIONS = int(os.getenv("KVK_API_MAX_CONNECTIONS", "32"))
+KVK_API_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("KVK_API_MAX_KEEPALIVE_CONNECTIONS", "16"))
+# Concurrent upstream lookups per batch request
+KVK_BATCH_CONCURRENCY = int(os.getenv("KVK_BATCH_CONCURRENCY", "8"))
+# HTTP/2 is negotiated (over TLS) when the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def client_options() -> Dict[str, Any]:
+    return {
+        "base_url": BASE_URL,
+        "timeout": httpx.Timeout(
+            KVK_API_TIMEOUT_SECONDS, connect=KVK_API_CONNECT_TIMEOUT_SECONDS, read=KVK_API_READ_TIMEOUT_SECONDS
+        ),
+        "limits": httpx.Limits(
+            max_connections=KVK_API_MAX_CONNECTIONS,
+            max_keepalive_connections=KVK_API_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        "http2": HTTP2_AVAILABLE,
+    }
+
+
+def _request_timeout(timeout: Optional[float]):
+    # httpx.USE_CLIENT_DEFAULT keeps the client's timeouts
+    return httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+
+
+# Upstream paths of the records kept in the response cache and the local mirror
+RECORD_PATHS = {LPID: "/lpid/{}", COMPANY_CERTIFICATE: "/company-certificate/{}"}
+
+
+def _mirrored(kind: str, kvk_nummer) -> Any:
+    # None when the mirror is disabled or has no record confirmed within its freshness bound
+    return None if kvk_mirror is None else kvk_mirror.get(kind, str(kvk_nummer))
+
+
+def _mirror_put(kind: str, kvk_nummer, value: Any) -> Any:
+    if kvk_mirror is not None:
+        kvk_mirror.put(kind, str(kvk_nummer), value)
+    return value
+
+
+def _mirrored_companies(error: CircuitOpenError, given_name, family_name, birthdate) -> Any:
+    # The upstream searches every company, the mirror only the ones it holds: its person
+    # index is a fallback while the breaker is open, once a sync pass is fresh
+    if kvk_mirror is None or not kvk_mirror.complete():
+        raise error
+    return kvk_mirror.companies_for_person(given_name, family_name, birthdate)
+
+
+# Retries, hedging and circuit breaking per endpoint, below the caches
+kvk_upstream = UpstreamPolicy([LPID, COMPANY_CERTIFICATE, SIGNATORY_RIGHTS, NATURAL_PERSON_COMPANY_CERTIFICATE])
+
+
+def _signatory_rights_payload(geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam):
+    return {
+        "geslachtsnaam": geslachtsnaam,
+        "voornamen": voornamen,
+        "geboortedatum": geboortedatum,
+        "voorvoegselGeslachtsnaam": voorvoegselGeslachtsnaam
+    }
+
+
+def _natural_person_payload(given_name, family_name, birthdate):
+    return {
+        "givenName": given_name,
+        "familyName": family_name,
+        "birthdate": birthdate
+    }
+
+
+class AsyncKVKBevoegdhedenAPI:
+    """
+    Async client for the KVK Bevoegdheden REST API, for use from `async def` routes.
+
+    Connections are pooled and kept alive. An httpx.AsyncClient belongs to the
+    event loop it was first used on, so one is created per running loop.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(**client_options())
+            self._loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    async def _get(self, endpoint: str, path: str, timeout: Optional[float]) -> Any:
+        async def send():
+            response = await self.client().get(path, timeout=_request_timeout(timeout))
+            response.raise_for_status()  # Raises an exception for HTTP errors
+            return response.json()
+        return await kvk_upstream.acall(endpoint, send, idempotent=True)
+
+    async def _post(self, endpoint: str, path: str, payload: Dict[str, Any], timeout: Optional[float]) -> Any:
+        async def send():
+            response = await self.client().post(path, json=payload, timeout=_request_timeout(timeout))
+            response.raise_for_status()
+            return response.json()
+        return await kvk_upstream.acall(endpoint, send)
+
+    async def fetch_record(self, kind: str, kvk_nummer, timeout: Optional[float] = None) -> Any:
+        """LPID (kind LPID) or company certificate from the upstream, past the mirror and the cache."""
+        return await self._get(kind, RECORD_PATHS[kind].format(kvk_nummer), timeout)
+
+    async def _get_record(self, kind: str, kvk_nummer, timeout: Optional[float]) -> Any:
+        if kvk_mirror is None:
+            return await kvk_response_cache.aget(kind, str(kvk_nummer), lambda: self.fetch_record(kind, kvk_nummer, timeout))
+        # The mirror blocks on SQLite (and on the sync pass's writes): keep it off the event loop
+        mirrored = await asyncio.to_thread(_mirrored, kind, kvk_nummer)
+        if mirrored is not None:
+            return mirrored
+
+        async def fetch():
+            return await asyncio.to_thread(_mirror_put, kind, kvk_nummer, await self.fetch_record(kind, kvk_nummer, timeout))
+        return await kvk_response_cache.aget(kind, str(kvk_nummer), fetch)
+
+    async def get_lpid(self, kvk_nummer, timeout: Optional[float] = None):
+        """LPID details for the KVK number, mirrored and cached (see KVKBevoegdhedenAPI.get_lpid)."""
+        return await self._get_record(LPID, kvk_nummer, timeout)
+
+    async def get_company_certificate(self, kvk_nummer, timeout: Optional[float] = None):
+        """Company certificate for the KVK number, mirrored and cached (see KVKBevoegdhedenAPI.get_company_certificate)."""
+        return await self._get_record(COMPANY_CERTIFICATE, kvk_nummer, timeout)
+
+    async def check_signatory_right(
+        self, kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam="", timeout: Optional[float] = None
+    ):
+        """Signatory rights of a natural person, cached (see KVKBevoegdhedenAPI.check_signatory_right)."""
+        payload = _signatory_rights_payload(geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam)
+        return await kvk_person_cache.aget(
+            SIGNATORY_RIGHTS,
+            signatory_rights_key(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam),
+            lambda: self._post(SIGNATORY_RIGHTS, f"/signatory-rights/{kvk_nummer}", payload, timeout),
+        )
+
+    async def get_natural_person_company_certificate(self, given_name, family_name, birthdate, timeout: Optional[float] = None):
+        """Company certificates of a natural person, cached (see KVKBevoegdhedenAPI.get_natural_person_company_certificate)."""
+        payload = _natural_person_payload(given_name, family_name, birthdate)
+        try:
+            return await kvk_person_cache.aget(
+                NATURAL_PERSON_COMPANY_CERTIFICATE,
+                natural_person_key(given_name, family_name, birthdate),
+                lambda: self._post(NATURAL_PERSON_COMPANY_CERTIFICATE, "/natural-person/company-certificate", payload, timeout),
+            )
+        except CircuitOpenError as e:
+            return await asyncio.to_thread(_mirrored_companies, e, given_name, family_name, birthdate)
+
+    async def lookup_many(
+        self,
+        lookup: Callable[[str], Awaitable[Any]],
+        kvk_nummers: Iterable[str],
+        concurrency: int = KVK_BATCH_CONCURRENCY,
+    ) -> AsyncIterator[Tuple[str, Any, Optional[Exception]]]:
+        """
+        Run `lookup` (e.g. self.get_lpid) for each distinct KVK number, at most
+        `concurrency` at a time. Yields (kvk_nummer, result, error) as lookups finish.
+        """
+        pending = list(dict.fromkeys(kvk_nummers))
+        numbers = iter(pending)
+        finished: "asyncio.Queue[Tuple[str, Any, Optional[Exception]]]" = asyncio.Queue()
+
+        async def worker():
+            # The workers share one iterator, so every number is looked up once
+            for kvk_nummer in numbers:
+                try:
+                    finished.put_nowait((kvk_nummer, await lookup(kvk_nummer), None))
+                except Exception as e:
+                    finished.put_nowait((kvk_nummer, None, e))
+
+        loop = asyncio.get_running_loop()
+        workers = [loop.create_task(worker()) for _ in range(min(concurrency, len(pending)))]
+        try:
+            for _ in pending:
+                yield await finished.get()
+        finally:
+            # The consumer may stop early (a streaming client disconnecting)
+            for task in workers:
+                task.cancel()
+
+
+kvk_api = AsyncKVKBevoegdhedenAPI()
+
+# Pooled client shared by the synchronous facade (httpx.Client is thread-safe)
+_sync_client: Optional[httpx.Client] = None
+_sync_client_lock = threading.Lock()
+
+
+def sync_client() -> httpx.Client:
+    global _sync_client
+    if _sync_client is None:
+        with _sync_client_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(**client_options())
+    return _sync_client
+
+
+def _get_json(endpoint: str, path: str, timeout: Optional[float]) -> Any:
+    def send():
+        response = sync_client().get(path, timeout=_request_timeout(timeout))
+        response.raise_for_status()  # Raises an exception for HTTP errors
+        return response.json()
+    return kvk_upstream.call(endpoint, send, idempotent=True)
+
+
+def _post_json(endpoint: str, path: str, payload: Dict[str, Any], timeout: Optional[float]) -> Any:
+    def send():
+        response = sync_client().post(path, json=payload, timeout=_request_timeout(timeout))
+        response.raise_for_status()
+        return response.json()
+    return kvk_upstream.call(endpoint, send)
+
+
+def _get_record(kind: str, kvk_nummer, timeout: Optional[float]) -> Any:
+    mirrored = _mirrored(kind, kvk_nummer)
+    if mirrored is not None:
+        return mirrored
+    return kvk_response_cache.get(
+        kind, str(kvk_nummer), lambda: _mirror_put(kind, kvk_nummer, _get_json(kind, RECORD_PATHS[kind].format(kvk_nummer), timeout))
+    )
+
 
 class KVKBevoegdhedenAPI:
     """
     Client for interacting with the KVK Bevoegdheden REST API.
+
+    Synchronous facade for callers running in threads (credential issuance);
+    async routes use `kvk_api` instead.
     """
 
     @staticmethod
-    def get_lpid(kvk_nummer):
+    def get_lpid(kvk_nummer, timeout: Optional[float] = None):
         """
         Fetches the Legal Person Identification Data (LPID) details for the specified KVK number.
-        
+        Served from the local mirror while fresh (see kvk_mirror), otherwise cached (see kvk_response_cache).
+
         :param kvk_nummer: The KVK number of the entity.
+        :param timeout: Seconds to wait for the upstream (default KVK_API_TIMEOUT_SECONDS).
         :return: JSON response with LPID details.
-        :raises: HTTPError if the request fails.
+        :raises: HTTPStatusError or TransportError if the request fails, CircuitOpenError if the breaker is open.
         """
-        url = f"{BASE_URL}/lpid/{kvk_nummer}"
-        response = requests.get(url)
-        response.raise_for_status()  # Raises an exception for HTTP errors
-        return response.json()
+        return _get_record(LPID, kvk_nummer, timeout)
 
     @staticmethod
-    def get_company_certificate(kvk_nummer):
+    def get_company_certificate(kvk_nummer, timeout: Optional[float] = None):
         """
         Fetches the company certificate details for the specified KVK number.
-        
+        Served from the local mirror while fresh (see kvk_mirror), otherwise cached (see kvk_response_cache).
+
         :param kvk_nummer: The KVK number of the entity.
+        :param timeout: Seconds to wait for the upstream (default KVK_API_TIMEOUT_SECONDS).
         :return: JSON response with company certificate details.
-        :raises: HTTPError if the request fails.
+        :raises: HTTPStatusError or TransportError if the request fails, CircuitOpenError if the breaker is open.
         """
-        url = f"{BASE_URL}/company-certificate/{kvk_nummer}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
+        return _get_record(COMPANY_CERTIFICATE, kvk_nummer, timeout)
 
     @staticmethod
-    def check_signatory_right(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam=""):
+    def check_signatory_right(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam="", timeout: Optional[float] = None):
         """
         Checks if a natural person has signatory rights for the specified KVK number.
+        Results are cached under a salted digest of the fields (see kvk_person_cache).
 
         :param kvk_nummer: The KVK number of the entity.
         :param geslachtsnaam: Surname of the person.
         :param voornamen: First names of the person.
         :param geboortedatum: Date of birth of the person (format: "DD-MM-YYYY").
         :param voorvoegselGeslachtsnaam: Prefix of the surname (optional).
+        :param timeout: Seconds to wait for the upstream (default KVK_API_TIMEOUT_SECONDS).
         :return: JSON response indicating if the person has signatory rights.
-        :raises: HTTPError if the request fails.
+        :raises: HTTPStatusError or TransportError if the request fails, CircuitOpenError if the breaker is open.
         """
-        url = f"{BASE_URL}/signatory-rights/{kvk_nummer}"
-        payload = {
-            "geslachtsnaam": geslachtsnaam,
-            "voornamen": voornamen,
-            "geboortedatum": geboortedatum,
-            "voorvoegselGeslachtsnaam": voorvoegselGeslachtsnaam
-        }
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        return response.json()
+        payload = _signatory_rights_payload(geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam)
+        return kvk_person_cache.get(
+            SIGNATORY_RIGHTS,
+            signatory_rights_key(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam),
+            lambda: _post_json(SIGNATORY_RIGHTS, f"/signatory-rights/{kvk_nummer}", payload, timeout),
+        )
 
     @staticmethod
-    def get_natural_person_company_certificate(given_name, family_name, birthdate):
+    def get_natural_person_company_certificate(given_name, family_name, birthdate, timeout: Optional[float] = None):
         """
         Fetches company certificates associated with a natural person.
-        
+        Results are cached under a salted digest of the fields (see kvk_person_cache).
+        While the upstream's breaker is open, the person index of the local mirror
+        answers instead, once a sync pass is fresh: a list of the mirrored company
+        certificates, which covers only the companies in the mirror (see kvk_mirror).
+
         :param given_name: First name(s) of the person.
         :param family_name: Last name of the person.
         :param birthdate: Date of birth in ISO format (YYYY-MM-DD).
+        :param timeout: Seconds to wait for the upstream (default KVK_API_TIMEOUT_SECONDS).
         :return: JSON response with company certificates where the person has authorization.
-        :raises: HTTPError if the request fails.
+        :raises: HTTPStatusError or TransportError if the request fails, CircuitOpenError if the breaker is open.
         """
-        url = f"{BASE_URL}/natural-person/company-certificate"
-        payload = {
-            "givenName": given_name,
-            "familyName": family_name,
-            "birthdate": birthdate
-        }
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        return response.json()
+        payload = _natural_person_payload(given_name, family_name, birthdate)
+        try:
+            return kvk_person_cache.get(
+                NATURAL_PERSON_COMPANY_CERTIFICATE,
+                natural_person_key(given_name, family_name, birthdate),
+                lambda: _post_json(NATURAL_PERSON_COMPANY_CERTIFICATE, "/natural-person/company-certificate", payload, timeout),
+            )
+        except CircuitOpenError as e:
+            return _mirrored_companies(e, given_name, family_name, birthdate)
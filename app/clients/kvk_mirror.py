@@ -0,0 +1,205 @@
+"""
+Optional local mirror of KvK data: LPID and company certificate records in
+SQLite, indexed by KvK number, plus the authorised persons of every mirrored
+company certificate indexed by person key.
+
+The mirror is enabled by KVK_MIRROR_DB_PATH. It is filled by the sync job
+(app.services.kvk_mirror_sync) and by every answer KVKBevoegdhedenAPI gets from
+the upstream. Writes are deltas: a record whose content digest did not change
+only has its `synced_at` moved, and the person index of a company is only
+rewritten when its certificate changed.
+
+Reads are served from the mirror while a record was confirmed by the upstream
+within KVK_MIRROR_MAX_AGE_SECONDS. Natural-person lookups still go to the
+upstream, which searches every company while the mirror only holds the
+configured numbers and those read through it. The person index answers them
+only while the upstream's circuit breaker is open, and only once a sync pass
+over the configured KvK numbers completed within that bound.
+
+The person key is a SHA-256 digest of the case-folded full name and the ISO
+birth date, so the index itself holds no names or birth dates (the mirrored
+certificates do, as the upstream returns them).
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.clients.kvk_response_cache import COMPANY_CERTIFICATE
+from app.services import json_codec
+
+logger = logging.getLogger(__name__)
+
+KVK_MIRROR_DB_PATH = os.getenv("KVK_MIRROR_DB_PATH")
+# How long a mirrored record may be served after the upstream last confirmed it
+KVK_MIRROR_MAX_AGE_SECONDS = int(os.getenv("KVK_MIRROR_MAX_AGE_SECONDS", "900"))
+# KvK numbers the sync job keeps mirrored (comma separated), besides the ones read through the mirror
+KVK_MIRROR_KVK_NUMBERS = [number.strip() for number in os.getenv("KVK_MIRROR_KVK_NUMBERS", "").split(",") if number.strip()]
+
+# Record states returned by put()
+ADDED = "added"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+
+def iso_date(value: str) -> str:
+    """KvK `dd-mm-yyyy` dates as `yyyy-mm-dd`; other values unchanged."""
+    match = re.fullmatch(r"(\d{1,2})-(\d{1,2})-(\d{4})", value)
+    if match is None:
+        return value
+    return f"{match.group(3)}-{int(match.group(2)):02d}-{int(match.group(1)):02d}"
+
+
+def person_key(full_name: str, birthdate: str) -> bytes:
+    name = " ".join(full_name.split()).casefold()
+    return hashlib.sha256(f"{name}\n{iso_date(birthdate)}".encode()).digest()
+
+
+class KVKMirror:
+    def __init__(self, db_path: str, max_age_seconds: int = KVK_MIRROR_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only risks the latest commits on power loss; the sync job restores them
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "kind TEXT NOT NULL, kvk_nummer TEXT NOT NULL, body BLOB NOT NULL, digest BLOB NOT NULL, "
+            "synced_at REAL NOT NULL, changed_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, kvk_nummer)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS authorized_persons ("
+            "person_key BLOB NOT NULL, kvk_nummer TEXT NOT NULL, "
+            "PRIMARY KEY (person_key, kvk_nummer)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS authorized_persons_kvk ON authorized_persons (kvk_nummer)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.person_queries = 0
+
+    def get(self, kind: str, kvk_nummer: str) -> Optional[Any]:
+        """The mirrored record, if the upstream confirmed it within the freshness bound."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, synced_at FROM records WHERE kind = ? AND kvk_nummer = ?", (kind, kvk_nummer)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[1] < time.time() - self.max_age_seconds:
+                self.stale += 1
+                return None
+            self.hits += 1
+        return json_codec.loads(row[0])
+
+    def put(self, kind: str, kvk_nummer: str, value: Any, synced_at: Optional[float] = None) -> str:
+        """Store an upstream answer; returns ADDED, CHANGED or UNCHANGED."""
+        synced_at = time.time() if synced_at is None else synced_at
+        body = json_codec.dumps(value)
+        digest = hashlib.sha256(body).digest()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM records WHERE kind = ? AND kvk_nummer = ?", (kind, kvk_nummer)
+            ).fetchone()
+            if row is not None and bytes(row[0]) == digest:
+                self._db.execute(
+                    "UPDATE records SET synced_at = max(synced_at, ?) WHERE kind = ? AND kvk_nummer = ?",
+                    (synced_at, kind, kvk_nummer),
+                )
+                return UNCHANGED
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO records (kind, kvk_nummer, body, digest, synced_at, changed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, kvk_nummer, body, digest, synced_at, synced_at),
+                )
+                if kind == COMPANY_CERTIFICATE:
+                    self._index_persons(kvk_nummer, value)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return ADDED if row is None else CHANGED
+
+    def _index_persons(self, kvk_nummer: str, certificate: Any) -> None:
+        # Called with the lock held, inside a transaction
+        self._db.execute("DELETE FROM authorized_persons WHERE kvk_nummer = ?", (kvk_nummer,))
+        persons = ((certificate or {}).get("data") or {}).get("authorized_persons") or []
+        self._db.executemany(
+            "INSERT OR IGNORE INTO authorized_persons (person_key, kvk_nummer) VALUES (?, ?)",
+            [
+                (person_key(person["full_name"], person["date_of_birth"]), kvk_nummer)
+                for person in persons
+                if person.get("full_name") and person.get("date_of_birth")
+            ],
+        )
+
+    def delete(self, kind: str, kvk_nummer: str) -> bool:
+        """Drop a record the upstream no longer has."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            deleted = self._db.execute(
+                "DELETE FROM records WHERE kind = ? AND kvk_nummer = ?", (kind, kvk_nummer)
+            ).rowcount
+            if kind == COMPANY_CERTIFICATE:
+                self._db.execute("DELETE FROM authorized_persons WHERE kvk_nummer = ?", (kvk_nummer,))
+            self._db.execute("COMMIT")
+        return deleted > 0
+
+    def kvk_numbers(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT DISTINCT kvk_nummer FROM records")]
+
+    def mark_complete(self, synced_at: float) -> None:
+        """Record a finished sync pass over every configured KvK number."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES ('complete_sync_at', ?)", (synced_at,))
+
+    def complete(self) -> bool:
+        """Whether the person index may stand in for the upstream (a sync pass is fresh)."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE name = 'complete_sync_at'").fetchone()
+        return row is not None and row[0] >= time.time() - self.max_age_seconds
+
+    def companies_for_person(self, given_name: str, family_name: str, birthdate: str) -> List[Any]:
+        """Mirrored company certificates listing the person as authorised, by KvK number."""
+        key = person_key(f"{given_name} {family_name}", birthdate)
+        with self._lock:
+            self.person_queries += 1
+            rows = self._db.execute(
+                "SELECT records.body FROM authorized_persons "
+                "JOIN records ON records.kind = ? AND records.kvk_nummer = authorized_persons.kvk_nummer "
+                "WHERE authorized_persons.person_key = ? ORDER BY authorized_persons.kvk_nummer",
+                (COMPANY_CERTIFICATE, key),
+            ).fetchall()
+        return [json_codec.loads(row[0]) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            records = dict(self._db.execute("SELECT kind, count(*) FROM records GROUP BY kind").fetchall())
+            persons = self._db.execute("SELECT count(*) FROM authorized_persons").fetchone()[0]
+            row = self._db.execute("SELECT value FROM sync_state WHERE name = 'complete_sync_at'").fetchone()
+            lookups = self.hits + self.stale + self.misses
+            return {
+                "records": records,
+                "authorized_persons": persons,
+                "max_age_seconds": self.max_age_seconds,
+                "complete_sync_age_seconds": None if row is None else round(time.time() - row[0], 1),
+                "hits": self.hits,
+                "stale": self.stale,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "person_queries": self.person_queries,
+            }
+
+
+kvk_mirror = KVKMirror(KVK_MIRROR_DB_PATH) if KVK_MIRROR_DB_PATH else None
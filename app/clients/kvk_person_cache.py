@@ -0,0 +1,81 @@
+"""
+Short-lived cache for the KvK lookups that send personal data: signatory rights
+of a person for a company and the company certificates of a natural person.
+
+Cache keys are an HMAC-SHA256 of the request fields under a random salt drawn
+at startup, so names and birth dates are never kept as keys and the keys cannot
+be recomputed from outside the process (or after a restart). Values are the
+upstream responses, held for KVK_PERSON_CACHE_TTL_SECONDS. Negative results (an
+upstream 404, or an empty response) are held for
+KVK_PERSON_NEGATIVE_CACHE_TTL_SECONDS. Entries are never served stale, and they
+can be invalidated with the same fields they were looked up with.
+"""
+import hashlib
+import hmac
+import json
+import os
+import secrets
+from typing import Any, Optional
+
+import httpx
+
+from app.clients.kvk_response_cache import KVKResponseCache
+
+# Maximum number of cached personal-data lookups (0 disables the cache)
+KVK_PERSON_CACHE_MAX_ENTRIES = int(os.getenv("KVK_PERSON_CACHE_MAX_ENTRIES", "4096"))
+KVK_PERSON_CACHE_TTL_SECONDS = int(os.getenv("KVK_PERSON_CACHE_TTL_SECONDS", "120"))
+KVK_PERSON_NEGATIVE_CACHE_TTL_SECONDS = int(os.getenv("KVK_PERSON_NEGATIVE_CACHE_TTL_SECONDS", "30"))
+
+SIGNATORY_RIGHTS = "signatory-rights"
+NATURAL_PERSON_COMPANY_CERTIFICATE = "natural-person-company-certificate"
+
+_salt = secrets.token_bytes(32)
+
+
+def person_key(*fields: Any) -> str:
+    """Salted digest of the request fields of a personal-data lookup."""
+    # A JSON array keeps the field boundaries unambiguous
+    message = json.dumps([str(field) for field in fields], ensure_ascii=False).encode()
+    return hmac.new(_salt, message, hashlib.sha256).hexdigest()
+
+
+def signatory_rights_key(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam="") -> str:
+    return person_key(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam)
+
+
+def natural_person_key(given_name, family_name, birthdate) -> str:
+    return person_key(given_name, family_name, birthdate)
+
+
+def is_negative_result(value: Any, error: Optional[BaseException]) -> bool:
+    if error is not None:
+        return isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 404
+    return value is None or value == {} or value == []
+
+
+kvk_person_cache = KVKResponseCache(
+    ttl_seconds={
+        SIGNATORY_RIGHTS: KVK_PERSON_CACHE_TTL_SECONDS,
+        NATURAL_PERSON_COMPANY_CERTIFICATE: KVK_PERSON_CACHE_TTL_SECONDS,
+    },
+    negative_ttl_seconds={
+        SIGNATORY_RIGHTS: KVK_PERSON_NEGATIVE_CACHE_TTL_SECONDS,
+        NATURAL_PERSON_COMPANY_CERTIFICATE: KVK_PERSON_NEGATIVE_CACHE_TTL_SECONDS,
+    },
+    is_negative=is_negative_result,
+    stale_seconds=0,
+    max_entries=KVK_PERSON_CACHE_MAX_ENTRIES,
+    refresh_workers=1,
+)
+
+
+def invalidate_signatory_right(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam="") -> None:
+    """Drop the cached signatory rights check for these fields."""
+    kvk_person_cache.invalidate(
+        SIGNATORY_RIGHTS, signatory_rights_key(kvk_nummer, geslachtsnaam, voornamen, geboortedatum, voorvoegselGeslachtsnaam)
+    )
+
+
+def invalidate_natural_person_company_certificate(given_name, family_name, birthdate) -> None:
+    """Drop the cached company certificates of the natural person with these fields."""
+    kvk_person_cache.invalidate(NATURAL_PERSON_COMPANY_CERTIFICATE, natural_person_key(given_name, family_name, birthdate))
@@ -0,0 +1,268 @@
+"""
+Response cache for the KvK lookups keyed by KvK number (LPID and company
+certificate), shared by the sync facade and the async client.
+
+An entry is fresh for the endpoint's TTL and may then be served stale for
+KVK_CACHE_STALE_SECONDS more while one background refresh fetches a new copy
+(stale-while-revalidate). Concurrent misses for the same key are coalesced into
+one upstream request (single-flight); a failed fetch is not cached and its
+error goes to every waiting caller. A failed refresh keeps the stale copy until
+its stale window runs out and is retried after KVK_CACHE_REFRESH_RETRY_SECONDS.
+
+Endpoints given a negative TTL also cache negative results (as decided by the
+`is_negative` predicate, e.g. an upstream 404) for that TTL; they are never
+served stale. Only error responses (httpx.HTTPStatusError) are cached as negative
+results, and only by status code, method and URL without its query: the request
+(whose body may carry personal data) is not kept. Every hit raises a rebuilt
+HTTPStatusError.
+
+The cache is an LRU bounded by KVK_CACHE_MAX_ENTRIES. Cached values are shared
+between requests and must be treated as read-only.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of cached KvK responses (0 disables the cache)
+KVK_CACHE_MAX_ENTRIES = int(os.getenv("KVK_CACHE_MAX_ENTRIES", "4096"))
+KVK_LPID_CACHE_TTL_SECONDS = int(os.getenv("KVK_LPID_CACHE_TTL_SECONDS", "300"))
+KVK_COMPANY_CERTIFICATE_CACHE_TTL_SECONDS = int(os.getenv("KVK_COMPANY_CERTIFICATE_CACHE_TTL_SECONDS", "300"))
+# How long an expired entry may still be served while it is being refreshed
+KVK_CACHE_STALE_SECONDS = int(os.getenv("KVK_CACHE_STALE_SECONDS", "600"))
+# Delay before refreshing again after a failed refresh
+KVK_CACHE_REFRESH_RETRY_SECONDS = int(os.getenv("KVK_CACHE_REFRESH_RETRY_SECONDS", "10"))
+# Threads refreshing stale entries for the sync facade
+KVK_CACHE_REFRESH_WORKERS = int(os.getenv("KVK_CACHE_REFRESH_WORKERS", "4"))
+
+LPID = "lpid"
+COMPANY_CERTIFICATE = "company-certificate"
+
+CacheKey = Tuple[str, str]
+COUNTERS = ("hits", "negative_hits", "stale_hits", "misses", "coalesced", "refreshes", "refresh_failures")
+
+
+class _CachedError:
+    """An upstream error response kept as a negative result, without its request."""
+
+    __slots__ = ("status_code", "method", "url")
+
+    def __init__(self, error: httpx.HTTPStatusError):
+        self.status_code = error.response.status_code
+        self.method = error.request.method
+        self.url = str(error.request.url.copy_with(query=None))
+
+    def error(self) -> httpx.HTTPStatusError:
+        request = httpx.Request(self.method, self.url)
+        return httpx.HTTPStatusError(
+            f"{self.status_code} {httpx.codes.get_reason_phrase(self.status_code)} for url '{self.url}' (cached)",
+            request=request,
+            response=httpx.Response(self.status_code, request=request),
+        )
+
+
+class KVKResponseCache:
+    def __init__(
+        self,
+        ttl_seconds: Optional[Dict[str, int]] = None,
+        stale_seconds: int = KVK_CACHE_STALE_SECONDS,
+        max_entries: int = KVK_CACHE_MAX_ENTRIES,
+        refresh_retry_seconds: int = KVK_CACHE_REFRESH_RETRY_SECONDS,
+        refresh_workers: int = KVK_CACHE_REFRESH_WORKERS,
+        negative_ttl_seconds: Optional[Dict[str, int]] = None,
+        is_negative: Optional[Callable[[Any, Optional[BaseException]], bool]] = None,
+    ):
+        self.ttl_seconds = ttl_seconds or {
+            LPID: KVK_LPID_CACHE_TTL_SECONDS,
+            COMPANY_CERTIFICATE: KVK_COMPANY_CERTIFICATE_CACHE_TTL_SECONDS,
+        }
+        self.negative_ttl_seconds = negative_ttl_seconds or {}
+        # Called with (value, None) after a fetch and (None, error) after a failed fetch
+        self.is_negative = is_negative
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.refresh_retry_seconds = refresh_retry_seconds
+        self._lock = threading.Lock()
+        # (endpoint, key) -> (fresh_until, stale_until, value, refresh_after, negative)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, float, Any, float, bool]]" = OrderedDict()
+        # Fetches in progress; a concurrent.futures.Future can be waited on from threads and event loops
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="kvk-cache-refresh")
+        self._tasks: Set[asyncio.Task] = set()
+        self._counters: Dict[str, Dict[str, int]] = {endpoint: dict.fromkeys(COUNTERS, 0) for endpoint in self.ttl_seconds}
+        self.evictions = 0
+
+    # --- Public API ---
+    def get(self, endpoint: str, key: str, fetch: Callable[[], Any]) -> Any:
+        """Cached value for a sync caller; `fetch` performs the upstream request."""
+        if not self.max_entries:
+            return fetch()
+        cache_key = (endpoint, key)
+        value, future, leader = self._lookup(cache_key)
+        if future is None:
+            return self._result(value)
+        if leader == "refresh":
+            self._executor.submit(self._fill, cache_key, future, fetch)
+            return value
+        if leader == "fetch":
+            self._fill(cache_key, future, fetch)
+        return future.result()
+
+    async def aget(self, endpoint: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached value for an async caller; `fetch` is a coroutine function performing the upstream request."""
+        if not self.max_entries:
+            return await fetch()
+        cache_key = (endpoint, key)
+        value, future, leader = self._lookup(cache_key)
+        if future is None:
+            return self._result(value)
+        if leader is not None:
+            # Fetch in a task of its own, so a caller going away does not fail the other waiters
+            task = asyncio.get_running_loop().create_task(self._afill(cache_key, future, fetch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            if leader == "refresh":
+                return value
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def invalidate(self, endpoint: str, key: str) -> None:
+        with self._lock:
+            self._entries.pop((endpoint, key), None)
+            # A fetch already in progress still answers its waiters but is not stored
+            self._inflight.pop((endpoint, key), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            for endpoint, counters in self._counters.items():
+                served = counters["hits"] + counters["stale_hits"]
+                lookups = served + counters["misses"] + counters["coalesced"]
+                endpoints[endpoint] = {
+                    **counters,
+                    "ttl_seconds": self.ttl_seconds[endpoint],
+                    "negative_ttl_seconds": self.negative_ttl_seconds.get(endpoint),
+                    "hit_ratio": (served / lookups) if lookups else 0.0,
+                }
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "stale_seconds": self.stale_seconds,
+                "inflight": len(self._inflight),
+                "evictions": self.evictions,
+                "endpoints": endpoints,
+            }
+
+    # --- Internals ---
+    def _lookup(self, cache_key: CacheKey) -> Tuple[Any, Optional[Future], Optional[str]]:
+        """
+        Returns (value, None, None) for a hit, (stale value, future, "refresh") for
+        the stale hit that has to start the refresh, and (None, future, "fetch" or
+        None) for a miss. The caller that gets "fetch" or "refresh" must fill the future.
+        """
+        now = time.monotonic()
+        counters = self._counters[cache_key[0]]
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[cache_key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                if entry[0] > now:
+                    counters["hits"] += 1
+                    if entry[4]:
+                        counters["negative_hits"] += 1
+                    return entry[2], None, None
+                counters["stale_hits"] += 1
+                if cache_key in self._inflight or entry[3] > now:
+                    return entry[2], None, None
+                counters["refreshes"] += 1
+                future = self._inflight[cache_key] = Future()
+                return entry[2], future, "refresh"
+            if cache_key in self._inflight:
+                counters["coalesced"] += 1
+                return None, self._inflight[cache_key], None
+            counters["misses"] += 1
+            future = self._inflight[cache_key] = Future()
+            return None, future, "fetch"
+
+    @staticmethod
+    def _result(value: Any) -> Any:
+        if isinstance(value, _CachedError):
+            raise value.error()
+        return value
+
+    def _negative(self, endpoint: str, value: Any, error: Optional[BaseException]) -> bool:
+        return endpoint in self.negative_ttl_seconds and self.is_negative is not None and self.is_negative(value, error)
+
+    def _fill(self, cache_key: CacheKey, future: Future, fetch: Callable[[], Any]) -> None:
+        try:
+            value = fetch()
+        except Exception as e:
+            self._failed(cache_key, future, e)
+        else:
+            self._store(cache_key, future, value)
+
+    async def _afill(self, cache_key: CacheKey, future: Future, fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            value = await fetch()
+        except BaseException as e:
+            self._failed(cache_key, future, e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self._store(cache_key, future, value)
+
+    def _put(self, cache_key: CacheKey, value: Any, negative: bool) -> None:
+        # Called with the lock held
+        if negative:
+            fresh_until = stale_until = time.monotonic() + self.negative_ttl_seconds[cache_key[0]]
+        else:
+            fresh_until = time.monotonic() + self.ttl_seconds[cache_key[0]]
+            stale_until = fresh_until + self.stale_seconds
+        self._entries[cache_key] = (fresh_until, stale_until, value, fresh_until, negative)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _store(self, cache_key: CacheKey, future: Future, value: Any) -> None:
+        negative = self._negative(cache_key[0], value, None)
+        with self._lock:
+            if self._inflight.get(cache_key) is future:
+                del self._inflight[cache_key]
+                self._put(cache_key, value, negative)
+        future.set_result(value)
+
+    def _failed(self, cache_key: CacheKey, future: Future, error: BaseException) -> None:
+        negative = isinstance(error, httpx.HTTPStatusError) and self._negative(cache_key[0], None, error)
+        with self._lock:
+            current = self._inflight.get(cache_key) is future
+            if current:
+                del self._inflight[cache_key]
+            entry = self._entries.get(cache_key)
+            if negative:
+                if current:
+                    self._put(cache_key, _CachedError(error), True)
+            elif entry is not None:
+                # A background refresh: keep serving the stale copy for now
+                self._entries[cache_key] = entry[:3] + (time.monotonic() + self.refresh_retry_seconds, entry[4])
+                self._counters[cache_key[0]]["refresh_failures"] += 1
+                logger.warning(f"Refreshing KvK {cache_key[0]} for {cache_key[1]} failed: {str(error)}")
+        future.set_exception(error)
+
+
+kvk_response_cache = KVKResponseCache()
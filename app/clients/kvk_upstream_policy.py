@@ -0,0 +1,382 @@
+"""
+Failure handling for calls to the KvK Bevoegdheden API, kept per endpoint.
+
+Retries: transport errors (connect and read timeouts, refused or dropped
+connections) and 502/503/504 answers are retried up to KVK_RETRY_ATTEMPTS
+times, after a full-jitter exponential backoff. Retries come out of a retry
+budget: every request adds KVK_RETRY_BUDGET_RATIO tokens (and the budget refills
+at KVK_RETRY_BUDGET_MIN_PER_SECOND), every retry or hedge takes one. An
+unhealthy upstream therefore sees about KVK_RETRY_BUDGET_RATIO extra load
+instead of a multiple of its traffic.
+
+Hedging (KVK_HEDGE_REQUESTS, idempotent GETs only): when a request has not been
+answered within the endpoint's recent p95 latency, a second one is sent and the
+first successful answer wins.
+
+Circuit breaker: when at least KVK_BREAKER_FAILURE_RATIO of the endpoint's last
+KVK_BREAKER_WINDOW requests failed (counting once KVK_BREAKER_MIN_REQUESTS are in
+the window), it fails fast with CircuitOpenError for KVK_BREAKER_RESET_SECONDS,
+after which a single probe request decides whether it closes again (a probe
+that never reports back, e.g. because its caller was cancelled, gives up its
+slot; so does one still pending after KVK_BREAKER_RESET_SECONDS). A failure
+rate rather than a run of failures, so a merely flaky upstream keeps being
+retried instead of cut off. Client errors (4xx) come from a healthy upstream
+and do not count as failures.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+KVK_RETRY_ATTEMPTS = int(os.getenv("KVK_RETRY_ATTEMPTS", "2"))
+KVK_RETRY_BASE_DELAY_MS = float(os.getenv("KVK_RETRY_BASE_DELAY_MS", "50"))
+KVK_RETRY_MAX_DELAY_MS = float(os.getenv("KVK_RETRY_MAX_DELAY_MS", "1000"))
+# Retries (and hedges) allowed per request, plus a small steady allowance
+KVK_RETRY_BUDGET_RATIO = float(os.getenv("KVK_RETRY_BUDGET_RATIO", "0.1"))
+KVK_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("KVK_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+KVK_HEDGE_REQUESTS = os.getenv("KVK_HEDGE_REQUESTS", "false").lower() == "true"
+KVK_HEDGE_MIN_DELAY_MS = float(os.getenv("KVK_HEDGE_MIN_DELAY_MS", "5"))
+# Threads running hedged requests for the sync facade
+KVK_HEDGE_WORKERS = int(os.getenv("KVK_HEDGE_WORKERS", "32"))
+KVK_BREAKER_FAILURE_RATIO = float(os.getenv("KVK_BREAKER_FAILURE_RATIO", "0.5"))
+KVK_BREAKER_WINDOW = int(os.getenv("KVK_BREAKER_WINDOW", "50"))
+KVK_BREAKER_MIN_REQUESTS = int(os.getenv("KVK_BREAKER_MIN_REQUESTS", "20"))
+KVK_BREAKER_RESET_SECONDS = float(os.getenv("KVK_BREAKER_RESET_SECONDS", "30"))
+
+# Latest response times per endpoint used for the hedge delay, and how many are needed first
+LATENCY_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+# Tokens the retry budget can save up
+RETRY_BUDGET_MAX_TOKENS = 10.0
+RETRYABLE_STATUS_CODES = (502, 503, 504)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+COUNTERS = (
+    "requests", "successes", "failures", "retries", "retries_denied",
+    "hedges", "hedge_wins", "breaker_opened", "breaker_rejections",
+)
+
+
+class CircuitOpenError(Exception):
+    """The endpoint's circuit breaker is open; the upstream was not called."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+def is_failure(error: BaseException) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class RetryBudget:
+    """Token bucket: requests deposit `ratio` tokens, retries and hedges withdraw one."""
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = RETRY_BUDGET_MAX_TOKENS):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class EndpointPolicy:
+    """Retry budget, latency window, circuit breaker and counters of one endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        breaker_failure_ratio: float = KVK_BREAKER_FAILURE_RATIO,
+        breaker_window: int = KVK_BREAKER_WINDOW,
+        breaker_min_requests: int = KVK_BREAKER_MIN_REQUESTS,
+        breaker_reset_seconds: float = KVK_BREAKER_RESET_SECONDS,
+    ):
+        self.name = name
+        self.budget = RetryBudget(KVK_RETRY_BUDGET_RATIO, KVK_RETRY_BUDGET_MIN_PER_SECOND)
+        self.breaker_failure_ratio = breaker_failure_ratio
+        self.breaker_min_requests = breaker_min_requests
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._sorted_latencies = []
+        self._new_samples = 0
+        self.state = CLOSED
+        # Outcomes of the latest requests (True: failed)
+        self._outcomes: Deque[bool] = deque(maxlen=breaker_window)
+        self._window_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def allow(self) -> bool:
+        """Whether the circuit breaker lets a request through."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.breaker_reset_seconds:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and (not self._probing or now - self._probe_started >= self.breaker_reset_seconds):
+                self._probing = True
+                self._probe_started = now
+                return True
+            self.counters["breaker_rejections"] += 1
+            return False
+
+    def record(self, latency: Optional[float], failed: bool) -> None:
+        """Outcome of one upstream request; `latency` is None when it got no answer."""
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+                self._new_samples += 1
+            if len(self._outcomes) == self._outcomes.maxlen and self._outcomes[0]:
+                self._window_failures -= 1
+            self._outcomes.append(failed)
+            if failed:
+                self.counters["failures"] += 1
+                self._window_failures += 1
+                tripped = len(self._outcomes) >= self.breaker_min_requests \
+                    and self._window_failures >= self.breaker_failure_ratio * len(self._outcomes)
+                if self.state == HALF_OPEN or (self.state == CLOSED and tripped):
+                    self.counters["breaker_opened"] += 1
+                    logger.warning(
+                        f"KvK {self.name} circuit breaker opened: {self._window_failures} of the last {len(self._outcomes)} requests failed"
+                    )
+                    self.state = OPEN
+                    self._opened_at = time.monotonic()
+                    self._probing = False
+            else:
+                self.counters["successes"] += 1
+                if self.state != CLOSED:
+                    # The probe succeeded: start over with a clean window
+                    self._outcomes.clear()
+                    self._window_failures = 0
+                    self.state = CLOSED
+                self._probing = False
+
+    def abandon(self) -> None:
+        """A request ended without an outcome (cancelled): free the half-open probe slot."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def latency_quantile(self, quantile: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            # Re-sort only every so often; the window moves slowly
+            if self._new_samples >= 16 or not self._sorted_latencies:
+                self._sorted_latencies = sorted(self._latencies)
+                self._new_samples = 0
+            return self._sorted_latencies[min(len(self._sorted_latencies) - 1, int(len(self._sorted_latencies) * quantile))]
+
+    def hedge_delay(self) -> Optional[float]:
+        p95 = self.latency_quantile(0.95)
+        return None if p95 is None else max(p95, KVK_HEDGE_MIN_DELAY_MS / 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.latency_quantile(0.5), self.latency_quantile(0.95)
+        with self._lock:
+            return {
+                **self.counters,
+                "breaker_state": self.state,
+                "retry_budget_tokens": round(self.budget.tokens, 2),
+                "latency_p50_ms": None if p50 is None else round(p50 * 1000, 2),
+                "latency_p95_ms": None if p95 is None else round(p95 * 1000, 2),
+            }
+
+
+class UpstreamPolicy:
+    def __init__(
+        self,
+        endpoints: Iterable[str],
+        retry_attempts: int = KVK_RETRY_ATTEMPTS,
+        hedge: bool = KVK_HEDGE_REQUESTS,
+        hedge_workers: int = KVK_HEDGE_WORKERS,
+    ):
+        self.endpoints = {endpoint: EndpointPolicy(endpoint) for endpoint in endpoints}
+        self.retry_attempts = retry_attempts
+        self.hedge = hedge
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="kvk-hedge")
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """Full jitter: uniform between 0 and the exponential delay for this attempt."""
+        return random.uniform(0, min(KVK_RETRY_MAX_DELAY_MS, KVK_RETRY_BASE_DELAY_MS * 2 ** attempt)) / 1000
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retry_attempts": self.retry_attempts,
+            "hedge": self.hedge,
+            "endpoints": {name: policy.stats() for name, policy in self.endpoints.items()},
+        }
+
+    # --- Sync callers ---
+    def call(self, endpoint: str, send: Callable[[], Any], idempotent: bool = False) -> Any:
+        """Run `send` (one upstream request) with the endpoint's retries, hedging and breaker."""
+        policy = self.endpoints[endpoint]
+        policy.count("requests")
+        policy.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(policy, send, idempotent)
+            except Exception as e:
+                if not self._retry(policy, e, attempt):
+                    raise
+            time.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def _retry(self, policy: EndpointPolicy, error: Exception, attempt: int) -> bool:
+        if not is_retryable(error) or attempt >= self.retry_attempts:
+            return False
+        if not policy.budget.withdraw():
+            policy.count("retries_denied")
+            return False
+        policy.count("retries")
+        return True
+
+    def _attempt(self, policy: EndpointPolicy, send: Callable[[], Any], idempotent: bool) -> Any:
+        if not policy.allow():
+            raise CircuitOpenError(f"KvK {policy.name} circuit breaker is open")
+        delay = policy.hedge_delay() if self.hedge and idempotent else None
+        if delay is None:
+            return self._timed(policy, send)
+        first = self._executor.submit(self._timed, policy, send)
+        done, _ = wait([first], timeout=delay)
+        if done or not policy.budget.withdraw():
+            return first.result()
+        policy.count("hedges")
+        second = self._executor.submit(self._timed, policy, send)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The other request finishes in the background
+                    if future is second:
+                        policy.count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _timed(policy: EndpointPolicy, send: Callable[[], Any]) -> Any:
+        start = time.monotonic()
+        try:
+            result = send()
+        except Exception as e:
+            answered = isinstance(e, httpx.HTTPStatusError)
+            policy.record(time.monotonic() - start if answered else None, is_failure(e))
+            raise
+        except BaseException:
+            # Cancelled (a losing hedge, a batch stopped early, a disconnected client)
+            policy.abandon()
+            raise
+        policy.record(time.monotonic() - start, False)
+        return result
+
+    # --- Async callers ---
+    async def acall(self, endpoint: str, send: Callable[[], Awaitable[Any]], idempotent: bool = False) -> Any:
+        """Async counterpart of call(); `send` is a coroutine function."""
+        policy = self.endpoints[endpoint]
+        policy.count("requests")
+        policy.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return await self._aattempt(policy, send, idempotent)
+            except Exception as e:
+                if not self._retry(policy, e, attempt):
+                    raise
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    async def _aattempt(self, policy: EndpointPolicy, send: Callable[[], Awaitable[Any]], idempotent: bool) -> Any:
+        if not policy.allow():
+            raise CircuitOpenError(f"KvK {policy.name} circuit breaker is open")
+        delay = policy.hedge_delay() if self.hedge and idempotent else None
+        if delay is None:
+            return await self._atimed(policy, send)
+        first = asyncio.ensure_future(self._atimed(policy, send))
+        second = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done or not policy.budget.withdraw():
+                return await first
+            policy.count("hedges")
+            second = asyncio.ensure_future(self._atimed(policy, send))
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            policy.count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The losing request is cancelled
+            for task in (first, second):
+                if task is not None:
+                    task.cancel()
+
+    @staticmethod
+    async def _atimed(policy: EndpointPolicy, send: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.monotonic()
+        try:
+            result = await send()
+        except Exception as e:
+            answered = isinstance(e, httpx.HTTPStatusError)
+            policy.record(time.monotonic() - start if answered else None, is_failure(e))
+            raise
+        except BaseException:
+            # Cancelled (a losing hedge, a batch stopped early, a disconnected client)
+            policy.abandon()
+            raise
+        policy.record(time.monotonic() - start, False)
+        return result
@@ -0,0 +1,47 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from app.routes import base_routes, kvk_bevoegdheid_rest_api, mini_suomi, well_known_routes, rdw_niscy
+from app.services import kvk_mirror_sync
+from app.services.json_codec import CodecJSONResponse
+
+# Application log level (issuance internals are only recorded by the opt-in ISSUANCE_TRACE)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+# httpx logs every upstream KvK request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep the optional local KvK mirror in sync (no-op unless KVK_MIRROR_DB_PATH is set;
+    # only one process sharing the mirror runs the job)
+    kvk_mirror_sync.start()
+    yield
+    kvk_mirror_sync.stop()
+
+
+app = FastAPI(default_response_class=CodecJSONResponse, lifespan=lifespan)
+
+# Configure CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "http://localhost:5173",  # Local development
+        "https://mijn-kvk-portal.nieuwlaar.com",
+        "https://kvk-issuance-ui.nieuwlaar.com"
+    ],
+    allow_credentials=True,
+    allow_methods=["*"],  # Allows all methods
+    allow_headers=["*"],  # Allows all headers
+)
+
+# Mount well-known routes at root level
+app.include_router(well_known_routes.router)
+
+# Mount other routes with their prefixes
+app.include_router(base_routes.router)
+app.include_router(mini_suomi.router, prefix="/mini-suomi")
+app.include_router(rdw_niscy.router, prefix="/rdw-niscy")
+app.include_router(kvk_bevoegdheid_rest_api.router, prefix="/bevoegdheid")
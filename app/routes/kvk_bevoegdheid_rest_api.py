@@ -1,9 +1,22 @@
+import os
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 from datetime import date
 
-from app.clients.kvk_bevoegdheden_rest_api import KVKBevoegdhedenAPI
+import httpx
+
+from app.clients.kvk_bevoegdheden_rest_api import kvk_api, kvk_upstream
+from app.clients.kvk_mirror import kvk_mirror
+from app.clients.kvk_person_cache import (
+    invalidate_natural_person_company_certificate,
+    invalidate_signatory_right,
+    kvk_person_cache,
+)
+from app.clients.kvk_response_cache import kvk_response_cache
+from app.clients.kvk_upstream_policy import CircuitOpenError
+from app.services import json_codec, kvk_mirror_sync
 
 router = APIRouter()
 
@@ -20,44 +33,148 @@ class NaturalPersonCompanyCertificateRequest(BaseModel):
     familyName: str
     birthdate: str  # Format: "YYYY-MM-DD" (ISO format)
 
+# Pydantic model for batch LPID / company certificate lookups
+class BatchLookupRequest(BaseModel):
+    kvk_nummers: List[str]
+
+# Maximum number of KVK numbers per batch lookup, and per streamed batch lookup
+MAX_BATCH_KVK_NUMBERS = int(os.getenv("MAX_BATCH_KVK_NUMBERS", "100"))
+MAX_STREAMED_BATCH_KVK_NUMBERS = int(os.getenv("MAX_STREAMED_BATCH_KVK_NUMBERS", "5000"))
+
+def lookup_result(kvk_nummer: str, data: Any, error: Optional[Exception]) -> Dict[str, Any]:
+    """One item of a batch lookup response."""
+    if error is None:
+        return {"kvk_nummer": kvk_nummer, "data": data}
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+    else:
+        status_code = 503 if isinstance(error, CircuitOpenError) else 500
+    return {"kvk_nummer": kvk_nummer, "error": str(error), "status_code": status_code}
+
+async def batch_lookup(lookup: Callable[[str], Awaitable[Any]], request_body: BatchLookupRequest, stream: bool):
+    """
+    Look up distinct KVK numbers concurrently. Returns the results in request order,
+    or with `stream` one NDJSON line per number as soon as it is done.
+    """
+    limit = MAX_STREAMED_BATCH_KVK_NUMBERS if stream else MAX_BATCH_KVK_NUMBERS
+    if len(request_body.kvk_nummers) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} KVK numbers per batch")
+    if stream:
+        async def lines() -> AsyncIterator[bytes]:
+            async for kvk_nummer, data, error in kvk_api.lookup_many(lookup, request_body.kvk_nummers):
+                yield json_codec.dumps(lookup_result(kvk_nummer, data, error)) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    results = {}
+    async for kvk_nummer, data, error in kvk_api.lookup_many(lookup, request_body.kvk_nummers):
+        results[kvk_nummer] = lookup_result(kvk_nummer, data, error)
+    return {"results": [results[kvk_nummer] for kvk_nummer in dict.fromkeys(request_body.kvk_nummers)]}
+
 @router.get("/lpid/{kvk_nummer}")
 async def get_lpid(kvk_nummer: str):
     """Proxy endpoint for getting LPID details"""
     try:
-        return KVKBevoegdhedenAPI.get_lpid(kvk_nummer)
+        return await kvk_api.get_lpid(kvk_nummer)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/lpid:batch")
+async def get_lpid_batch(request_body: BatchLookupRequest, stream: bool = False):
+    """LPID details for many KVK numbers; `?stream=true` returns NDJSON in completion order"""
+    return await batch_lookup(kvk_api.get_lpid, request_body, stream)
+
 @router.get("/company-certificate/{kvk_nummer}")
 async def get_company_certificate(kvk_nummer: str):
     """Proxy endpoint for getting company certificate"""
     try:
-        return KVKBevoegdhedenAPI.get_company_certificate(kvk_nummer)
+        return await kvk_api.get_company_certificate(kvk_nummer)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/company-certificate:batch")
+async def get_company_certificate_batch(request_body: BatchLookupRequest, stream: bool = False):
+    """Company certificates for many KVK numbers; `?stream=true` returns NDJSON in completion order"""
+    return await batch_lookup(kvk_api.get_company_certificate, request_body, stream)
+
 @router.post("/signatory-rights/{kvk_nummer}")
 async def check_signatory_right(kvk_nummer: str, request: SignatoryRightsRequest):
     """Proxy endpoint for checking signatory rights"""
     try:
-        return KVKBevoegdhedenAPI.check_signatory_right(
+        return await kvk_api.check_signatory_right(
             kvk_nummer=kvk_nummer,
             geslachtsnaam=request.geslachtsnaam,
             voornamen=request.voornamen,
             geboortedatum=request.geboortedatum,
             voorvoegselGeslachtsnaam=request.voorvoegselGeslachtsnaam
         )
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/signatory-rights/{kvk_nummer}/invalidate")
+async def invalidate_signatory_right_cache(kvk_nummer: str, request: SignatoryRightsRequest):
+    """Drop the cached signatory rights check for this person, so the next check asks the KvK"""
+    invalidate_signatory_right(
+        kvk_nummer=kvk_nummer,
+        geslachtsnaam=request.geslachtsnaam,
+        voornamen=request.voornamen,
+        geboortedatum=request.geboortedatum,
+        voorvoegselGeslachtsnaam=request.voorvoegselGeslachtsnaam
+    )
+    return {"status": "success"}
+
 @router.post("/natural-person/company-certificate")
 async def get_natural_person_company_certificate(request: NaturalPersonCompanyCertificateRequest):
     """Proxy endpoint for getting company certificates associated with a natural person"""
     try:
-        return KVKBevoegdhedenAPI.get_natural_person_company_certificate(
+        return await kvk_api.get_natural_person_company_certificate(
             given_name=request.givenName,
             family_name=request.familyName,
             birthdate=request.birthdate
         )
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/natural-person/company-certificate/invalidate")
+async def invalidate_natural_person_company_certificate_cache(request: NaturalPersonCompanyCertificateRequest):
+    """Drop the cached company certificates of this person, so the next lookup asks the KvK"""
+    invalidate_natural_person_company_certificate(
+        given_name=request.givenName,
+        family_name=request.familyName,
+        birthdate=request.birthdate
+    )
+    return {"status": "success"}
+
+@router.get("/debug/kvk-upstream")
+async def get_kvk_upstream_stats():
+    """Return per-endpoint request, retry, hedge and circuit breaker counters for the KvK API."""
+    return {
+        "status": "success",
+        "upstream": kvk_upstream.stats()
+    }
+
+@router.get("/debug/kvk-cache")
+async def get_kvk_cache_stats():
+    """Return hit ratios and counters of the KvK response caches."""
+    return {
+        "status": "success",
+        "cache": kvk_response_cache.stats(),
+        "person_cache": kvk_person_cache.stats()
+    }
+
+@router.get("/debug/kvk-mirror")
+async def get_kvk_mirror_stats():
+    """Return record counts, freshness and hit counters of the local KvK mirror."""
+    if kvk_mirror is None:
+        return {"status": "disabled"}
+    return {
+        "status": "success",
+        "mirror": kvk_mirror.stats(),
+        "last_sync": kvk_mirror_sync.last_pass
+    }
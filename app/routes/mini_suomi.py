@@ -1,11 +1,24 @@
 from fastapi import APIRouter, HTTPException, Form, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, Response
 from io import BytesIO
 from app.services import mini_suomi
-from typing import Optional, Dict, Any, List
+from app.services.json_codec import CodecJSONResponse
+from app.services.deferred_issuance import FAILED, PENDING, UNKNOWN, deferred_issuance
+from app.services.nonce_store import nonce_store
+from app.services.offer_store import offer_store
+from app.services.proof_verifier import ProofError
+from app.services.credential_templates import CREDENTIAL_TEMPLATES, credential_configurations_supported
+from app.services.issuance_trace import trace_recorder, redact_headers
+from app.services.sd_jwt_verifier import VerificationError
+from app.services.status_list import STATUS_INVALID, STATUS_VALID
+from typing import Optional, Dict, Any, List, Tuple
 from pydantic import BaseModel
 from fastapi import Header
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import logging
+import os
+import secrets
 
 router = APIRouter()
 
@@ -25,6 +38,147 @@ class CredentialRequest(BaseModel):
     proofs: Optional[Dict[str, list]] = None
     credential_response_encryption: Optional[Dict[str, Any]] = None
 
+class BatchCredentialRequest(BaseModel):
+    credential_requests: List[CredentialRequest]
+
+class DeferredCredentialRequest(BaseModel):
+    transaction_id: str
+
+class PresentationVerificationRequest(BaseModel):
+    presentation: str
+    audience: Optional[str] = None
+    nonce: Optional[str] = None
+    require_key_binding: bool = False
+
+class BatchPresentationVerificationRequest(BaseModel):
+    presentations: List[PresentationVerificationRequest]
+
+class StatusListEntry(BaseModel):
+    list_id: int
+    idx: int
+
+class StatusUpdateRequest(BaseModel):
+    # Issued credentials (SD-JWT or issuer JWT) and/or explicit status list entries
+    credentials: List[str] = []
+    entries: List[StatusListEntry] = []
+    status: str = "invalid"
+
+# Upper bound on credentials issued by one request (proofs or batch entries)
+MAX_BATCH_CREDENTIALS = int(os.getenv("MAX_BATCH_CREDENTIALS", "20"))
+# Bearer token for reading issuance traces (the trace endpoint is disabled when unset)
+ISSUANCE_TRACE_ADMIN_TOKEN = os.getenv("ISSUANCE_TRACE_ADMIN_TOKEN")
+# Reject credential requests without a proof (otherwise they bind a default holder key)
+REQUIRE_HOLDER_PROOF = os.getenv("REQUIRE_HOLDER_PROOF", "true").lower() == "true"
+# Bearer token for status changes (revocation is disabled when unset)
+STATUS_LIST_ADMIN_TOKEN = os.getenv("STATUS_LIST_ADMIN_TOKEN")
+# Bearer token of the backend creating credential offers (offer creation is disabled when unset)
+CREDENTIAL_OFFER_ADMIN_TOKEN = os.getenv("CREDENTIAL_OFFER_ADMIN_TOKEN")
+# Upper bound on presentations verified by one batch verification request
+MAX_BATCH_PRESENTATIONS = int(os.getenv("MAX_BATCH_PRESENTATIONS", "100"))
+
+def issuance_response_headers(trace) -> Dict[str, str]:
+    headers = {"Cache-Control": "no-store"}
+    if trace is not None:
+        headers["X-Issuance-Trace-Id"] = trace.trace_id
+    return headers
+
+def requested_credential_type(request_body: CredentialRequest) -> Optional[str]:
+    for credential_type in CREDENTIAL_TEMPLATES:
+        if request_body.types and credential_type in request_body.types:
+            return credential_type
+    return None
+
+def require_admin_token(authorization: Optional[str], admin_token: Optional[str], disabled_detail: str) -> None:
+    if not admin_token:
+        raise HTTPException(status_code=403, detail=disabled_detail)
+    if not authorization or not secrets.compare_digest(authorization, f"Bearer {admin_token}"):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+def access_grant(authorization: Optional[str]) -> Optional[Tuple[str, str, int]]:
+    """
+    (credential configuration, KvK number, expires_at) the bearer access token was
+    issued for. May query SQLite: async handlers run it in the threadpool.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    return offer_store.get_grant(authorization[len("Bearer "):])
+
+def insufficient_scope(credential_type: str) -> CodecJSONResponse:
+    return CodecJSONResponse(
+        status_code=403,
+        content={
+            "error": "insufficient_scope",
+            "error_description": f"The access token was not issued for {credential_type}"
+        },
+        headers={"WWW-Authenticate": 'Bearer error="insufficient_scope"'}
+    )
+
+def requested_proofs(request_body: CredentialRequest) -> List[str]:
+    if request_body.proofs and request_body.proofs.get("jwt"):
+        return request_body.proofs["jwt"]
+    if request_body.proof and request_body.proof.jwt:
+        return [request_body.proof.jwt]
+    return []
+
+def verified_holder_jwks(access_token: str, request_body: CredentialRequest) -> List[Optional[Dict[str, Any]]]:
+    """Holder keys of the verified `proofs`/`proof` JWTs; raises ProofError."""
+    proofs = requested_proofs(request_body)
+    if proofs:
+        return mini_suomi.proof_verifier.verify_many(proofs, access_token)
+    if REQUIRE_HOLDER_PROOF:
+        raise ProofError("invalid_proof", "A proof of possession of the holder key is required")
+    # [None] binds the default holder key
+    return [None]
+
+async def proof_error_response(error: ProofError, access_token: str, trace) -> CodecJSONResponse:
+    # A fresh c_nonce lets the wallet retry with a new proof
+    c_nonce, c_nonce_expires_in = await run_in_threadpool(nonce_store.issue, access_token)
+    return CodecJSONResponse(
+        status_code=400,
+        content={
+            "error": error.error,
+            "error_description": str(error),
+            "c_nonce": c_nonce,
+            "c_nonce_expires_in": c_nonce_expires_in
+        },
+        headers=issuance_response_headers(trace)
+    )
+
+def build_credential_response(issuance_requests: List[Tuple[str, str, Optional[Dict[str, Any]]]], shape: str, trace) -> Dict[str, Any]:
+    """Issue the credentials and lay them out as `credential`, `credentials` or `credential_responses`."""
+    credential_jwts = mini_suomi.generate_credential_jwts(issuance_requests, trace)
+    if shape == "credential":
+        return {"credential": credential_jwts[0]}
+    return {shape: [{"credential": credential_jwt} for credential_jwt in credential_jwts]}
+
+async def build_or_defer(access_token: str, issuance_requests, shape: str, trace):
+    """(response content, None), or (None, (transaction_id, interval)) when the build outlasts the budget."""
+    build, started_at = deferred_issuance.submit(build_credential_response, issuance_requests, shape, trace)
+    try:
+        # Shielded: on timeout the build keeps running for the deferred credential endpoint
+        content = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(build)), deferred_issuance.budget_seconds)
+        return content, None
+    except asyncio.TimeoutError:
+        transaction_id, interval = await run_in_threadpool(deferred_issuance.defer, access_token, build, started_at)
+        if trace is not None:
+            # The build still records into the trace: finish it when the build is done
+            trace.record("deferred", interval=interval)
+            build.add_done_callback(lambda done: trace_recorder.finish(trace))
+        return None, (transaction_id, interval)
+
+async def deferred_response(access_token: str, transaction_id: str, interval: int, trace) -> CodecJSONResponse:
+    c_nonce, c_nonce_expires_in = await run_in_threadpool(nonce_store.issue, access_token)
+    return CodecJSONResponse(
+        status_code=202,
+        content={
+            "transaction_id": transaction_id,
+            "interval": interval,
+            "c_nonce": c_nonce,
+            "c_nonce_expires_in": c_nonce_expires_in
+        },
+        headers=issuance_response_headers(trace)
+    )
+
 @router.get("/issuers")
 def get_issuers():
     try:
@@ -33,11 +187,15 @@ def get_issuers():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/issuers/kvk/openid4vci/issue/{credentialConfiguration}/{kvkNumber}")
-def issue_credential(credentialConfiguration: str, kvkNumber: str):
+@router.post("/issuers/kvk/openid4vci/issue/{credentialConfiguration}/{kvkNumber}")
+def issue_credential(credentialConfiguration: str, kvkNumber: str, authorization: str = Header(None)):
+    """Create a credential offer for the KvK number (offers are persisted, so only the issuance backend may)."""
+    require_admin_token(authorization, CREDENTIAL_OFFER_ADMIN_TOKEN, "Credential offer creation is disabled")
     try:
         result = mini_suomi.issue_credential(credentialConfiguration, kvkNumber)
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -63,16 +221,6 @@ def get_kvk_federation_statement():
 @router.get("/issuers/kvk/.well-known/openid-credential-configuration")
 def get_credential_configuration():
     try:
-        # The public key JWK from the JWT
-        jwk = {
-            "kty": "EC",
-            "crv": "P-256",
-            "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-            "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-            "kid": "authentication-key",
-            "alg": "ES256"
-        }
-        
         base_url = f"{mini_suomi.ISSUER_DOMAIN}/mini-suomi"
         
         # The credential configuration response
@@ -80,9 +228,7 @@ def get_credential_configuration():
             "credential_issuer": f"{base_url}/issuers/kvk",
             "credential_endpoint": f"{base_url}/issuers/kvk/openid4vci/issue",
             "token_endpoint": f"{base_url}/token",  # Added token endpoint
-            "jwks": {
-                "keys": [jwk]
-            }
+            "jwks": mini_suomi.issuer_key_manager.jwks()
         }
         
         return configuration
@@ -92,87 +238,50 @@ def get_credential_configuration():
 @router.get("/issuers/kvk/jwks")
 def get_jwks():
     try:
-        # Using the same JWK that's defined in your credential configuration
-        jwk = {
-            "kty": "EC",
-            "crv": "P-256",
-            "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-            "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-            "kid": "authentication-key",
-            "alg": "ES256"
-        }
-        
-        return {
-            "keys": [jwk]
-        }
+        # Pre-serialised by the issuer KeyManager
+        return Response(
+            content=mini_suomi.issuer_key_manager.jwks_json(),
+            media_type="application/json"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/credential_offer")
 def get_credential_offer(id: str):
+    offer = offer_store.get_offer(id)
+    if offer is None:
+        raise HTTPException(status_code=404, detail="Credential offer not found")
+    pre_authorized_code, credential_configuration, _, _ = offer
     try:
-        # For now, only handle the mock offer ID
-        if id == "mockOfferId123":
-
-            # Get base URL from environment
-            base_url = f"{mini_suomi.ISSUER_DOMAIN}/mini-suomi"
-            
-            # Construct the credential offer metadata
-            credential_offer = {
-                "credential_issuer": f"{base_url}/issuers/kvk",
-                # Add credentials array as required by the spec
-                "credentials": [{
-                    # "format": "vc+sd-jwt",
-                    "types": ["LPIDSdJwt"],
-                    "trust_framework": {
-                        "name": "kvk",
-                        "type": "Legal Entity",
-                        "uri": f"{base_url}/issuers/kvk"
-                    }
-                }],
-                "grants": {
-                    "urn:ietf:params:oauth:grant-type:pre-authorized_code": {
-                        "pre-authorized_code": "mock_pre_authorized_code_123"
-                    }
+        # Get base URL from environment
+        base_url = f"{mini_suomi.ISSUER_DOMAIN}/mini-suomi"
+
+        # Construct the credential offer metadata
+        credential_offer = {
+            "credential_issuer": f"{base_url}/issuers/kvk",
+            # Add credentials array as required by the spec
+            "credentials": [{
+                # "format": "vc+sd-jwt",
+                "types": [credential_configuration],
+                "trust_framework": {
+                    "name": "kvk",
+                    "type": "Legal Entity",
+                    "uri": f"{base_url}/issuers/kvk"
                 }
-            }
-            
-            # Set correct content type
-            return JSONResponse(
-                content=credential_offer,
-                media_type="application/json"
-            )
-        if id == "mockOfferId124":
-            # Get base URL from environment
-            base_url = f"{mini_suomi.ISSUER_DOMAIN}/mini-suomi"
-            
-            # Construct the credential offer metadata
-            credential_offer = {
-                "credential_issuer": f"{base_url}/issuers/kvk",
-                # Add credentials array as required by the spec
-                "credentials": [{
-                    # "format": "vc+sd-jwt",
-                    "types": ["EUCCSdJwt"],
-                    "trust_framework": {
-                        "name": "kvk",
-                        "type": "Legal Entity",
-                        "uri": f"{base_url}/issuers/kvk"
-                    }
-                }],
-                "grants": {
-                    "urn:ietf:params:oauth:grant-type:pre-authorized_code": {
-                        "pre-authorized_code": "mock_pre_authorized_code_123"
-                    }
+            }],
+            "grants": {
+                "urn:ietf:params:oauth:grant-type:pre-authorized_code": {
+                    "pre-authorized_code": pre_authorized_code
                 }
             }
-            
-            # Set correct content type
-            return JSONResponse(
-                content=credential_offer,
-                media_type="application/json"
-            )
-        else:
-            raise HTTPException(status_code=404, detail="Credential offer not found")
+        }
+
+        # Set correct content type
+        return CodecJSONResponse(
+            content=credential_offer,
+            media_type="application/json",
+            headers={"Cache-Control": "no-store"}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -184,129 +293,17 @@ def get_credential_issuer_metadata():
         metadata = {
             "credential_issuer": f"{base_url}/issuers/kvk",
             "credential_endpoint": f"{base_url}/issuers/kvk/openid4vci/issue",
+            "batch_credential_endpoint": f"{base_url}/issuers/kvk/openid4vci/batch_credential",
+            "deferred_credential_endpoint": f"{base_url}/issuers/kvk/openid4vci/deferred_credential",
+            "batch_credential_issuance": {
+                "batch_size": MAX_BATCH_CREDENTIALS
+            },
             "token_endpoint": f"{base_url}/token",
-            "credential_configurations_supported": {
-                "LPIDSdJwt": {
-                    # "format": "vc+sd-jwt",
-                    "scope": "LPIDSdJwt",
-                    "cryptographic_binding_methods_supported": ["jwk"],
-                    "credential_signing_alg_values_supported": ["ES256"],
-                    "proof_types_supported": {
-                        "jwt": {
-                            "proof_signing_alg_values_supported": ["ES256"]
-                        }
-                    },
-                    "display": [{
-                        "name": "Legal Person Identifier",
-                        "locale": "en-US",
-                        "logo": {
-                            "uri": "https://example.com/logo.png",
-                            "alt_text": "Legal Person ID logo"
-                        },
-                        "background_color": "#12107c",
-                        "text_color": "#FFFFFF"
-                    }],
-                    "claims": [
-                        {
-                            "path": ["legal_person_id"],
-                            "display": [{
-                                "name": "Legal Person ID",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["legal_person_name"],
-                            "display": [{
-                                "name": "Legal Person Name",
-                                "locale": "en-US"
-                            }]
-                        }
-                    ]
-                },
-                "EUCCSdJwt": {
-                    # "format": "vc+sd-jwt",
-                    "scope": "EUCCSdJwt",
-                    "cryptographic_binding_methods_supported": ["jwk"],
-                    "credential_signing_alg_values_supported": ["ES256"],
-                    "proof_types_supported": {
-                        "jwt": {
-                            "proof_signing_alg_values_supported": ["ES256"]
-                        }
-                    },
-                    "display": [{
-                        "name": "EU Company Certificate",
-                        "locale": "en-US",
-                        "logo": {
-                            "uri": "https://example.com/logo.png",
-                            "alt_text": "EU Company Certificate logo"
-                        },
-                        "background_color": "#12107c",
-                        "text_color": "#FFFFFF"
-                    }],
-                    "claims": [
-                        {
-                            "path": ["legalName"],
-                            "display": [{
-                                "name": "Legal Name",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["legalFormType"],
-                            "display": [{
-                                "name": "Legal Form",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["legalIdentifier"],
-                            "display": [{
-                                "name": "Legal Identifier",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["registeredAddress"],
-                            "display": [{
-                                "name": "Registered Address",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["registrationDate"],
-                            "display": [{
-                                "name": "Registration Date",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["legalEntityStatus"],
-                            "display": [{
-                                "name": "Legal Entity Status",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["legalRepresentative"],
-                            "display": [{
-                                "name": "Legal Representatives",
-                                "locale": "en-US"
-                            }]
-                        },
-                        {
-                            "path": ["contactPoint"],
-                            "display": [{
-                                "name": "Contact Information",
-                                "locale": "en-US"
-                            }]
-                        }
-                    ]
-                }
-            }
+            "credential_configurations_supported": credential_configurations_supported()
         }
         
         # Return with correct content type
-        return JSONResponse(
+        return CodecJSONResponse(
             content=metadata,
             media_type="application/json",
             headers={"Content-Language": "en-US"}
@@ -329,21 +326,10 @@ def get_oauth_server_metadata():
             "grant_types_supported": ["authorization_code", "urn:ietf:params:oauth:grant-type:pre-authorized_code"],
             "token_endpoint_auth_methods_supported": ["none"],
             "credential_endpoint": f"{issuer_url}/openid4vci/issue",
-            "credential_configurations_supported": {
-                "LPIDSdJwt": {
-                    # "format": "vc+sd-jwt",
-                    "cryptographic_binding_methods_supported": ["jwk"],
-                    "credential_signing_alg_values_supported": ["ES256"],
-                    "proof_types_supported": {
-                        "jwt": {
-                            "proof_signing_alg_values_supported": ["ES256"]
-                        }
-                    }
-                }
-            }
+            "credential_configurations_supported": credential_configurations_supported(include_display=False)
         }
         
-        return JSONResponse(
+        return CodecJSONResponse(
             content=metadata,
             media_type="application/json",
             headers={"Content-Language": "en-US"}
@@ -362,7 +348,7 @@ async def token_endpoint(
     try:
         # Validate grant type
         if grant_type != "urn:ietf:params:oauth:grant-type:pre-authorized_code":
-            return JSONResponse(
+            return CodecJSONResponse(
                 status_code=400,
                 content={
                     "error": "unsupported_grant_type",
@@ -370,36 +356,40 @@ async def token_endpoint(
                 }
             )
         
-        # Validate pre-authorized code
-        if not pre_authorized_code or pre_authorized_code != "mock_pre_authorized_code_123":
-            return JSONResponse(
+        # Validate and redeem the pre-authorized code (single use)
+        redeemed = await run_in_threadpool(offer_store.redeem, pre_authorized_code) if pre_authorized_code else None
+        if redeemed is None:
+            return CodecJSONResponse(
                 status_code=400,
                 content={
                     "error": "invalid_grant",
                     "error_description": "Invalid or expired pre-authorized code"
                 }
             )
-            
-        # For now, we'll create a simple response with a mock access token
+        access_token, (credential_configuration, _, _) = redeemed
+        c_nonce, c_nonce_expires_in = await run_in_threadpool(nonce_store.issue, access_token)
+
         response = {
-            "access_token": "mock_access_token_456",
+            "access_token": access_token,
             "token_type": "Bearer",
-            "expires_in": 3600,
+            "expires_in": offer_store.access_token_ttl_seconds,
+            "c_nonce": c_nonce,
+            "c_nonce_expires_in": c_nonce_expires_in,
             "authorization_details": [{
                 "type": "openid_credential",
-                "credential_configuration_id": "LPIDSdJwt",
-                "credential_identifiers": ["mock_credential_id_789"]
+                "credential_configuration_id": credential_configuration,
+                "credential_identifiers": [credential_configuration]
             }]
         }
         
-        return JSONResponse(
+        return CodecJSONResponse(
             content=response,
             media_type="application/json",
             headers={"Cache-Control": "no-store"}
         )
         
     except Exception as e:
-        return JSONResponse(
+        return CodecJSONResponse(
             status_code=500,
             content={
                 "error": "server_error",
@@ -413,30 +403,32 @@ async def issue_credential_endpoint(
     request: Request,
     authorization: str = Header(None)
 ):
+    # Opt-in trace of the issuance internals (None unless enabled)
+    trace = trace_recorder.start("credential", request.headers)
+    deferred = None
     try:
-        # Log full request details
-        body = await request.json()
-        logging.info("=== Credential Request Details ===")
-        logging.info(f"Request Body: {body}")
-        logging.info(f"Authorization: {authorization}")
-        logging.info(f"Headers: {dict(request.headers)}")
-        
+        if trace is not None:
+            trace.record(
+                "received_request",
+                headers=redact_headers(dict(request.headers)),
+                types=request_body.types,
+                proof_count=len(request_body.proofs.get("jwt", [])) if request_body.proofs else int(request_body.proof is not None)
+            )
+
         # Validate authorization token
-        if not authorization or not authorization.startswith("Bearer "):
+        grant = await run_in_threadpool(access_grant, authorization)
+        if grant is None:
             logging.error("Missing or invalid authorization token")
-            return JSONResponse(
+            return CodecJSONResponse(
                 status_code=401,
                 content={"error": "invalid_token"},
                 headers={"WWW-Authenticate": "Bearer"}
             )
 
-        # Log parsed request body
-        logging.info(f"Parsed Request Body: {request_body}")
-
         # Validate format and types
         # if request_body.format != "vc+sd-jwt":
         #     logging.error(f"Unsupported format: {request_body.format}")
-        #     return JSONResponse(
+        #     return CodecJSONResponse(
         #         status_code=400,
         #         content={
         #             "error": "unsupported_credential_format",
@@ -444,53 +436,293 @@ async def issue_credential_endpoint(
         #         }
         #     )
 
-        if not request_body.types or not any(cred_type in request_body.types for cred_type in ["LPIDSdJwt", "EUCCSdJwt"]):
+        credential_type = requested_credential_type(request_body)
+        if credential_type is None:
             logging.error(f"Invalid types: {request_body.types}")
-            return JSONResponse(
+            return CodecJSONResponse(
                 status_code=400,
                 content={
                     "error": "unsupported_credential_type",
                     "error_description": "Either LPIDSdJwt or EUCCSdJwt type is required"
                 }
             )
+        if credential_type != grant[0]:
+            return insufficient_scope(credential_type)
 
-        # Generate actual JWT credential
-        if "LPIDSdJwt" in request_body.types:
-            credential_jwt = mini_suomi.generate_credential_jwt(
-                credential_type="LPIDSdJwt",  # or "EUCCSdJwt" based on request
-                kvk_number="90000021"  # Get this from the request or context
-            )
-        elif "EUCCSdJwt" in request_body.types:
-            credential_jwt = mini_suomi.generate_credential_jwt(
-                credential_type="EUCCSdJwt",  # or "EUCCSdJwt" based on request
-                kvk_number="90000021"  # Get this from the request or context
+        if len(requested_proofs(request_body)) > MAX_BATCH_CREDENTIALS:
+            return CodecJSONResponse(
+                status_code=400,
+                content={
+                    "error": "invalid_proof",
+                    "error_description": f"At most {MAX_BATCH_CREDENTIALS} proofs are accepted per request"
+                }
             )
 
+        # One credential per holder key when the wallet sends several proofs
+        access_token = authorization[len("Bearer "):]
+        try:
+            holder_jwks = await run_in_threadpool(verified_holder_jwks, access_token, request_body)
+        except ProofError as e:
+            return await proof_error_response(e, access_token, trace)
+        if trace is not None:
+            trace.record("verified_proofs", holder_keys=holder_jwks)
+
+        # Generate actual JWT credentials, or defer them when the KvK lookups are slow
+        content, deferred = await build_or_defer(
+            access_token,
+            [(credential_type, grant[1], holder_jwk) for holder_jwk in holder_jwks],
+            "credentials" if request_body.proofs else "credential",
+            trace
+        )
+        if deferred is not None:
+            return await deferred_response(access_token, *deferred, trace)
+
         # Format response
-        response = {
-            # "format": "vc+sd-jwt",
-            "credential": credential_jwt,
-            "c_nonce": "xyz123",
-            # "c_nonce_expires_in": 3600
-        }
-        
-        logging.info(f"Sending response: {response}")
-        return JSONResponse(
+        c_nonce, c_nonce_expires_in = await run_in_threadpool(nonce_store.issue, access_token)
+        response = {**content, "c_nonce": c_nonce, "c_nonce_expires_in": c_nonce_expires_in}
+
+        return CodecJSONResponse(
             content=response,
             media_type="application/json",
-            headers={"Cache-Control": "no-store"}
+            headers=issuance_response_headers(trace)
         )
 
     except Exception as e:
         logging.error(f"Error in credential issuance: {str(e)}")
         logging.error(f"Exception details:", exc_info=True)
-        return JSONResponse(
+        if trace is not None:
+            trace.record("failed", error=str(e))
+        return CodecJSONResponse(
+            status_code=500,
+            content={
+                "error": "invalid_credential_request",
+                "error_description": str(e)
+            },
+            headers=issuance_response_headers(trace)
+        )
+    finally:
+        # A deferred build finishes its trace itself
+        if trace is not None and deferred is None:
+            trace_recorder.finish(trace)
+
+@router.post("/issuers/kvk/openid4vci/batch_credential")
+async def batch_credential_endpoint(
+    request_body: BatchCredentialRequest,
+    request: Request,
+    authorization: str = Header(None)
+):
+    trace = trace_recorder.start("batch_credential", request.headers)
+    deferred = None
+    try:
+        if trace is not None:
+            trace.record(
+                "received_request",
+                headers=redact_headers(dict(request.headers)),
+                credential_requests=len(request_body.credential_requests)
+            )
+
+        grant = await run_in_threadpool(access_grant, authorization)
+        if grant is None:
+            logging.error("Missing or invalid authorization token")
+            return CodecJSONResponse(
+                status_code=401,
+                content={"error": "invalid_token"},
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+
+        issuance_requests = []
+        for credential_request in request_body.credential_requests:
+            credential_type = requested_credential_type(credential_request)
+            if credential_type is None:
+                return CodecJSONResponse(
+                    status_code=400,
+                    content={
+                        "error": "unsupported_credential_type",
+                        "error_description": "Either LPIDSdJwt or EUCCSdJwt type is required"
+                    }
+                )
+            if credential_type != grant[0]:
+                return insufficient_scope(credential_type)
+            issuance_requests.append((credential_type, max(len(requested_proofs(credential_request)), 1)))
+
+        if not issuance_requests or sum(count for _, count in issuance_requests) > MAX_BATCH_CREDENTIALS:
+            return CodecJSONResponse(
+                status_code=400,
+                content={
+                    "error": "invalid_request",
+                    "error_description": f"Between 1 and {MAX_BATCH_CREDENTIALS} credentials can be requested per batch"
+                }
+            )
+
+        access_token = authorization[len("Bearer "):]
+        try:
+            holder_jwks = await run_in_threadpool(
+                lambda: [verified_holder_jwks(access_token, credential_request) for credential_request in request_body.credential_requests]
+            )
+        except ProofError as e:
+            return await proof_error_response(e, access_token, trace)
+        issuance_requests = [
+            (credential_type, grant[1], holder_jwk)
+            for (credential_type, _), request_holder_jwks in zip(issuance_requests, holder_jwks)
+            for holder_jwk in request_holder_jwks
+        ]
+
+        # Shared KvK fetch, bulk disclosures and parallel signing
+        content, deferred = await build_or_defer(access_token, issuance_requests, "credential_responses", trace)
+        if deferred is not None:
+            return await deferred_response(access_token, *deferred, trace)
+
+        c_nonce, c_nonce_expires_in = await run_in_threadpool(nonce_store.issue, access_token)
+        response = {**content, "c_nonce": c_nonce, "c_nonce_expires_in": c_nonce_expires_in}
+        return CodecJSONResponse(
+            content=response,
+            media_type="application/json",
+            headers=issuance_response_headers(trace)
+        )
+
+    except Exception as e:
+        logging.error(f"Error in batch credential issuance: {str(e)}")
+        if trace is not None:
+            trace.record("failed", error=str(e))
+        return CodecJSONResponse(
             status_code=500,
             content={
                 "error": "invalid_credential_request",
                 "error_description": str(e)
+            },
+            headers=issuance_response_headers(trace)
+        )
+    finally:
+        # A deferred build finishes its trace itself
+        if trace is not None and deferred is None:
+            trace_recorder.finish(trace)
+
+@router.post("/issuers/kvk/openid4vci/deferred_credential")
+async def deferred_credential_endpoint(
+    request_body: DeferredCredentialRequest,
+    authorization: str = Header(None)
+):
+    if await run_in_threadpool(access_grant, authorization) is None:
+        return CodecJSONResponse(
+            status_code=401,
+            content={"error": "invalid_token"},
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    access_token = authorization[len("Bearer "):]
+
+    state, value = await run_in_threadpool(deferred_issuance.poll, request_body.transaction_id, access_token)
+    if state == PENDING:
+        return CodecJSONResponse(
+            status_code=400,
+            content={"error": "issuance_pending", "interval": value},
+            headers={"Cache-Control": "no-store"}
+        )
+    if state == UNKNOWN:
+        return CodecJSONResponse(
+            status_code=400,
+            content={
+                "error": "invalid_transaction_id",
+                "error_description": "Unknown, expired or already redeemed transaction_id"
             }
         )
+    if state == FAILED:
+        return CodecJSONResponse(
+            status_code=500,
+            content={
+                "error": "invalid_credential_request",
+                "error_description": value
+            },
+            headers={"Cache-Control": "no-store"}
+        )
+
+    c_nonce, c_nonce_expires_in = await run_in_threadpool(nonce_store.issue, access_token)
+    return CodecJSONResponse(
+        content={**value, "c_nonce": c_nonce, "c_nonce_expires_in": c_nonce_expires_in},
+        media_type="application/json",
+        headers={"Cache-Control": "no-store"}
+    )
+
+@router.post("/verifier/verify")
+def verify_presentation(request_body: PresentationVerificationRequest):
+    """Verify an SD-JWT VC presentation (issuer signature, disclosures, optional key binding)."""
+    try:
+        result = mini_suomi.presentation_verifier.verify(
+            request_body.presentation,
+            audience=request_body.audience,
+            nonce=request_body.nonce,
+            require_key_binding=request_body.require_key_binding
+        )
+        return {"valid": True, **result}
+    except VerificationError as e:
+        return CodecJSONResponse(status_code=400, content={"valid": False, "error": str(e)})
+    except Exception as e:
+        logging.error(f"Error verifying presentation: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/verifier/batch_verify")
+def batch_verify_presentations(request_body: BatchPresentationVerificationRequest):
+    """Verify many presentations in one call; issuer and holder keys are parsed once."""
+    if len(request_body.presentations) > MAX_BATCH_PRESENTATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PRESENTATIONS} presentations per batch")
+    try:
+        results = mini_suomi.presentation_verifier.verify_many(
+            [presentation.dict() for presentation in request_body.presentations]
+        )
+        return {"results": results}
+    except Exception as e:
+        logging.error(f"Error verifying presentations: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/issuers/kvk/status-lists/{list_id}")
+def get_status_list(list_id: int, request: Request):
+    """Signed status list token; re-signed only after status changes."""
+    try:
+        token, etag = mini_suomi.status_list_service.token(list_id, mini_suomi.status_list_uri(list_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Status list not found")
+    headers = {"Cache-Control": f"public, max-age={mini_suomi.status_list_service.ttl_seconds}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=token, media_type="application/statuslist+jwt", headers=headers)
+
+@router.post("/issuers/kvk/status-lists/update")
+def update_credential_status(request_body: StatusUpdateRequest, authorization: str = Header(None)):
+    """Revoke (or reinstate) a batch of issued credentials."""
+    require_admin_token(authorization, STATUS_LIST_ADMIN_TOKEN, "Status updates are disabled")
+    if request_body.status not in ("invalid", "valid"):
+        raise HTTPException(status_code=400, detail="status must be 'invalid' or 'valid'")
+
+    entries = [(entry.list_id, entry.idx) for entry in request_body.entries]
+    for credential in request_body.credentials:
+        try:
+            # Only credentials we issued (valid issuer signature) can be revoked this way
+            payload = mini_suomi.presentation_verifier.verify(credential.split("~")[0] + "~")
+            reference = payload["claims"]["status"]["status_list"]
+            list_id = int(reference["uri"].rsplit("/", 1)[1])
+            if reference["uri"] != mini_suomi.status_list_uri(list_id):
+                raise ValueError("status list of another issuer")
+        except (VerificationError, KeyError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid credential: {str(e)}")
+        entries.append((list_id, reference["idx"]))
+
+    try:
+        changed = mini_suomi.status_list_service.set_status(
+            entries, STATUS_INVALID if request_body.status == "invalid" else STATUS_VALID
+        )
+    except (KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+    return {"status": "success", "updated": len(entries), "changed": changed}
+
+@router.get("/debug/issuance-traces")
+async def get_issuance_traces(trace_id: Optional[str] = None, authorization: str = Header(None)):
+    """Return recorded issuance traces (empty unless ISSUANCE_TRACE is enabled)."""
+    require_admin_token(authorization, ISSUANCE_TRACE_ADMIN_TOKEN, "Issuance traces are disabled")
+    if trace_id is not None:
+        trace = trace_recorder.get(trace_id)
+        if trace is None:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return trace
+    return {"mode": trace_recorder.mode, "traces": trace_recorder.latest()}
 
 @well_known_router.get("/.well-known/jwt-vc-issuer/mini-suomi/issuers/kvk")
 async def get_jwt_vc_issuer_metadata():
@@ -499,22 +731,10 @@ async def get_jwt_vc_issuer_metadata():
         
         metadata = {
             "issuer": issuer_url,
-            "jwks": {
-                "keys": [
-                    {
-                    "kty": "EC",
-                    "crv": "P-256",
-                    "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-                    "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-                    "alg": "ES256",
-                    "kid": "authentication-key"
-                    # "use": "sig"
-                  }
-                ]
-            }
+            "jwks": mini_suomi.issuer_key_manager.jwks()
         }
         
-        return JSONResponse(
+        return CodecJSONResponse(
             content=metadata,
             media_type="application/json",
             status_code=200
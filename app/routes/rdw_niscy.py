@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, status, Header, Cookie
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, status, Header, Cookie, Request
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 import logging
@@ -20,26 +20,61 @@ import re
 from enum import Enum
 import jwt
 import hashlib
-from fastapi.responses import JSONResponse
+import secrets
+from fastapi.responses import JSONResponse, Response
+from app.services import json_codec
+from app.services.browser_broker import brokered
+from app.services.key_manager import KeyManager
+from app.services.profile_store import ProfileStore, PROFILE_STORE_PATH
+from app.services.revocation_store import revocation_store
+from app.services.session_store import read_session_file, write_session_file, session_cache
+from app.services.token_cache import verified_token_cache
 
 logger = logging.getLogger(__name__)
 
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
-ALGORITHM = "HS256"
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")  # HS256, ES256 or EdDSA
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", "300"))
+
+# Asymmetric signing keys: the first PEM file in JWT_SIGNING_KEY_FILES signs new
+# tokens, the others are only used to verify tokens issued before a rotation
+JWT_SIGNING_KEY_FILES = [path.strip() for path in os.getenv("JWT_SIGNING_KEY_FILES", "").split(",") if path.strip()]
+# Development only: sign with a key generated at startup when no key files are set.
+# Every worker process would generate its own key and reject the others' tokens.
+JWT_EPHEMERAL_KEY = os.getenv("JWT_EPHEMERAL_KEY", "false").lower() == "true"
+
+
+def load_auth_keys(algorithm: str, key_files: List[str], ephemeral: bool = False) -> Optional[KeyManager]:
+    """Signing keys for `algorithm` (None for HS256); refuses to start without key files unless `ephemeral`."""
+    if algorithm == "HS256":
+        return None
+    if key_files:
+        return KeyManager.from_pem_files(algorithm, key_files)
+    if not ephemeral:
+        raise RuntimeError(
+            f"JWT_ALGORITHM={algorithm} requires JWT_SIGNING_KEY_FILES, shared by all worker processes "
+            "(or JWT_EPHEMERAL_KEY=true for a single development process)"
+        )
+    logger.warning(f"JWT_EPHEMERAL_KEY set; using an ephemeral {algorithm} key (single process only, tokens will not survive a restart)")
+    return KeyManager.generate(algorithm)
+
+
+auth_key_manager = load_auth_keys(ALGORITHM, JWT_SIGNING_KEY_FILES, JWT_EPHEMERAL_KEY)
+
+# Claims of authenticated users, so refreshed access tokens keep them
+profile_store = ProfileStore(PROFILE_STORE_PATH, max_age_seconds=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
 
 # Create router with prefix
 router = APIRouter()
 user_data_dir = tempfile.mkdtemp()
 
-# In-memory store for active driver sessions
+# In-memory store for active driver sessions (lives in the browser broker process
+# when BROWSER_BROKER_SOCKET is set, see app/services/browser_broker.py)
 active_sessions = {}
 
-# In-memory store for revoked tokens (should be replaced with a database in production)
-revoked_tokens = set()
-
 # Define the request models
 class PowerOfRepresentationRequest(BaseModel):
     legal_person_identifier: str
@@ -93,27 +128,8 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # --- Helper Functions ---
 def get_request_data_from_file(session_id: str) -> Optional[Dict[str, Any]]:
-    """Retrieve request data from the session JSON file."""
-    file_path = Path("authentication-requests") / f"{session_id}.json"
-    if not file_path.exists():
-        logger.warning(f"No data file found for session ID: {session_id} at {file_path}")
-        return None
-    try:
-        with open(file_path, "r") as f:
-            # Handle empty file case
-            content = f.read()
-            if not content:
-                logger.warning(f"Session file {file_path} is empty.")
-                # Return a dict indicating the error state
-                return {"status": "error", "error": "Empty session file", "logs": []}
-            return json.loads(content)
-    except json.JSONDecodeError as decode_err:
-         logger.error(f"Error decoding JSON from {file_path}: {decode_err}")
-         # Return a dict indicating the error state
-         return {"status": "error", "error": f"Corrupted session file: {decode_err}", "logs": []}
-    except Exception as e:
-        logger.error(f"Error reading session data file {file_path}: {str(e)}")
-        return None # Indicate general read error
+    """Retrieve request data from the session JSON file (cached, validated by mtime/size)."""
+    return read_session_file(session_id)
 
 def create_user_id(given_name: str, family_name: str, birth_date: str) -> str:
     """Create a consistent user ID from user attributes."""
@@ -121,43 +137,76 @@ def create_user_id(given_name: str, family_name: str, birth_date: str) -> str:
     combined = f"{given_name}:{family_name}:{birth_date}"
     return hashlib.sha256(combined.encode()).hexdigest()
 
+def new_token_id() -> str:
+    """Create a compact unique token ID for the `jti` claim."""
+    return secrets.token_urlsafe(12)
+
+def token_id(payload: Dict[str, Any], token: str) -> str:
+    """Return the token's `jti`, or a digest of the token for tokens issued without one."""
+    return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+def encode_token(claims: Dict[str, Any]) -> str:
+    """Sign token claims with the shared secret or the active asymmetric key."""
+    if auth_key_manager is None:
+        return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+    key = auth_key_manager.active_key
+    return jwt.encode(claims, key.private_key, algorithm=ALGORITHM, headers={"kid": key.kid})
+
+def decode_token(token: str, **kwargs) -> Dict[str, Any]:
+    """Verify a token's signature (selecting the key by `kid`) and return its claims."""
+    if auth_key_manager is None:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], **kwargs)
+    key = auth_key_manager.get_key(jwt.get_unverified_header(token).get("kid"))
+    if key is None:
+        raise jwt.InvalidTokenError("Unknown signing key")
+    return jwt.decode(token, key.public_key, algorithms=[ALGORITHM], **kwargs)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "jti": new_token_id()})
+    return encode_token(to_encode)
 
 def create_refresh_token(user_id: str) -> str:
     """Create a JWT refresh token."""
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode = {"sub": user_id, "exp": expire, "type": "refresh"}
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode = {"sub": user_id, "exp": expire, "type": "refresh", "jti": new_token_id()}
+    return encode_token(to_encode)
 
 def verify_token(token: str) -> Optional[TokenData]:
     """Verify a JWT token and return token data."""
-    try:
-        # Check if token is revoked
-        if token in revoked_tokens:
+    # Reuse an earlier verification of the same token (bounded by its exp)
+    cached = verified_token_cache.get(token)
+    if cached is not None:
+        token_data, jti = cached
+        if revocation_store.is_revoked(jti):
+            verified_token_cache.invalidate(token)
             return None
-        
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return token_data
+
+    try:
+        # jwt.decode also rejects expired tokens
+        payload = decode_token(token)
         user_id = payload.get("sub")
         if user_id is None:
             return None
-        
-        # Check for token expiration
-        exp = payload.get("exp")
-        if exp and datetime.utcnow() > datetime.fromtimestamp(exp):
+
+        # Check if token is revoked
+        jti = token_id(payload, token)
+        if revocation_store.is_revoked(jti):
             return None
-            
-        return TokenData(
+
+        exp = payload.get("exp")
+        token_data = TokenData(
             sub=user_id,
             given_name=payload.get("given_name"),
             family_name=payload.get("family_name"),
             birth_date=payload.get("birth_date"),
             exp=exp
         )
+        verified_token_cache.put(token, (token_data, jti), exp)
+        return token_data
     except jwt.PyJWTError:
         return None
 
@@ -222,6 +271,9 @@ async def generate_token(request: TokenRequest):
         "birth_date": birth_date
     }
     
+    # Remember the claims so refresh_token can re-mint full access tokens
+    profile_store.put(user_id, given_name, family_name, birth_date)
+
     # Generate tokens
     access_token = create_access_token(token_data)
     refresh_token = create_refresh_token(user_id)
@@ -238,10 +290,10 @@ async def refresh_token(request: RefreshTokenRequest):
     """Generate new access token using refresh token."""
     try:
         # Verify refresh token
-        payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(request.refresh_token)
         
         # Check if token is revoked
-        if request.refresh_token in revoked_tokens:
+        if revocation_store.is_revoked(token_id(payload, request.refresh_token)):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token has been revoked"
@@ -261,8 +313,11 @@ async def refresh_token(request: RefreshTokenRequest):
                 detail="Invalid token: missing user ID"
             )
             
-        # Create new token data (without user details as we don't have them here)
+        # Create new token data, with the user details stored at login when available
         token_data = {"sub": user_id}
+        profile = profile_store.get(user_id)
+        if profile:
+            token_data.update(profile)
         
         # Generate new tokens
         access_token = create_access_token(token_data)
@@ -295,10 +350,33 @@ async def validate_token(current_user: TokenData = Depends(get_current_user)):
 @router.post("/auth/logout")
 async def logout(token: str = Depends(oauth2_scheme)):
     """Invalidate the current token."""
-    # Add token to revoked list
-    revoked_tokens.add(token)
+    try:
+        # Signature must be valid; an already expired token needs no revocation
+        payload = decode_token(token, options={"verify_exp": False})
+    except jwt.PyJWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # Revoke the token until it expires
+    exp = payload.get("exp")
+    if exp:
+        revocation_store.revoke(token_id(payload, token), exp)
+    verified_token_cache.invalidate(token)
     return {"detail": "Successfully logged out"}
 
+@router.get("/.well-known/jwks.json")
+async def get_auth_jwks(request: Request):
+    """Public keys for verifying access tokens locally (empty when tokens are HS256)."""
+    body = auth_key_manager.jwks_json() if auth_key_manager else b'{"keys":[]}'
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    headers = {"Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/user/profile")
 async def get_user_profile(current_user: TokenData = Depends(get_current_user)):
     """Return the authenticated user's profile data."""
@@ -411,6 +489,7 @@ async def create_power_of_representation(request: PowerOfRepresentationRequest,
 
 # this version works
 @router.get("/pid-extraction/{request_id}")
+@brokered("extract_pid_data")
 async def extract_pid_data(request_id: str):
     # Check if we have an active session for this request
     if request_id not in active_sessions:
@@ -437,7 +516,7 @@ async def extract_pid_data(request_id: str):
     # Read the current request data from file
     try:
         with open(file_path, "r") as f:
-            request_data = json.load(f)
+            request_data = json_codec.loads(f.read())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read session file {file_path}: {str(e)}")
 
@@ -557,8 +636,7 @@ async def extract_pid_data(request_id: str):
 
             # Save updated request data and logs
             request_data["logs"] = log_messages
-            with open(file_path, "w") as f:
-                json.dump(request_data, f, indent=4)
+            write_session_file(file_path, request_data)
             
             # Clean up the driver session
             log_and_capture(f"Closing driver session for request {request_id}")
@@ -589,8 +667,7 @@ async def extract_pid_data(request_id: str):
             
             # Save status and logs
             request_data["logs"] = log_messages
-            with open(file_path, "w") as f:
-                json.dump(request_data, f, indent=4)
+            write_session_file(file_path, request_data)
                 
             # Don't close driver if pending, otherwise close if error
             if status_to_return == "error":
@@ -620,8 +697,7 @@ async def extract_pid_data(request_id: str):
             request_data["status"] = "error"
             request_data["error"] = f"Outer exception: {str(e)}"
             request_data["logs"] = log_messages
-            with open(file_path, "w") as f:
-                json.dump(request_data, f, indent=4)
+            write_session_file(file_path, request_data)
         except: pass # Ignore if file writing fails here
 
         # Return a generic error response
@@ -632,6 +708,7 @@ async def extract_pid_data(request_id: str):
         }
 
 @router.get("/pid-authentication")
+@brokered("verify_pid_authentication")
 async def verify_pid_authentication(background_tasks: BackgroundTasks):
     # List to capture log messages for the response
     log_messages: List[str] = []
@@ -766,8 +843,7 @@ async def verify_pid_authentication(background_tasks: BackgroundTasks):
 
         # Save initial JSON file
         file_path = auth_requests_dir / f"{request_id}.json"
-        with open(file_path, "w") as f:
-            json.dump(request_data, f, indent=4)
+        write_session_file(file_path, request_data)
 
         log_and_capture(f"Saved authentication request data to {file_path}")
         
@@ -822,6 +898,7 @@ async def verify_pid_authentication(background_tasks: BackgroundTasks):
                  log_and_capture(f"Error quitting driver in finally block: {quit_err}")
 
 @router.get("/debug/active-sessions")
+@brokered("get_active_sessions")
 async def get_active_sessions():
     """Return information about active sessions for debugging purposes."""
     try:
@@ -847,6 +924,7 @@ async def get_active_sessions():
         }
 
 @router.delete("/debug/active-sessions/{session_id}")
+@brokered("delete_active_session")
 async def delete_active_session(session_id: str):
     """Delete an active session by ID."""
     try:
@@ -877,6 +955,14 @@ async def delete_active_session(session_id: str):
             "message": f"Error deleting session {session_id}: {str(e)}"
         }
 
+@router.get("/debug/session-cache")
+async def get_session_cache_stats():
+    """Return hit/miss counters of the session file read cache."""
+    return {
+        "status": "success",
+        "cache": session_cache.stats()
+    }
+
 async def handle_pid_extraction_in_background(request_id: str):
     """Background task to handle Selenium interaction and data extraction."""
     session_data = active_sessions.get(request_id)
@@ -919,7 +1005,7 @@ async def handle_pid_extraction_in_background(request_id: str):
         # Load initial request data and logs from file
         try:
             with open(file_path, "r") as f:
-                request_data = json.load(f)
+                request_data = json_codec.loads(f.read())
             # Prepend existing logs
             existing_logs = request_data.get("logs", [])
             log_messages.extend(existing_logs)
@@ -1036,8 +1122,7 @@ async def handle_pid_extraction_in_background(request_id: str):
         # Update the JSON file with final status and logs
         request_data["logs"] = log_messages
         try:
-            with open(file_path, "w") as f:
-                json.dump(request_data, f, indent=4)
+            write_session_file(file_path, request_data)
             log_and_capture(f"Successfully updated session file: {file_path}")
         except Exception as write_err:
             log_and_capture(f"ERROR updating session file {file_path}: {write_err}")
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
 import logging
 from app.services import mini_suomi
+from app.services.json_codec import CodecJSONResponse
 
 router = APIRouter()
 
@@ -12,22 +12,10 @@ async def get_jwt_vc_issuer_metadata():
         
         metadata = {
             "issuer": issuer_url,
-            "jwks": {
-                "keys": [
-                    {
-                        "kty": "EC",
-                        "crv": "P-256",
-                        "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-                        "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-                        "alg": "ES256",
-                        "kid": "authentication-key"
-                        # "use": "sig"
-                    }
-                ]
-            }
+            "jwks": mini_suomi.issuer_key_manager.jwks()
         }
         
-        return JSONResponse(
+        return CodecJSONResponse(
             content=metadata,
             media_type="application/json",
             status_code=200
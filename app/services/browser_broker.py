@@ -0,0 +1,154 @@
+"""
+Out-of-process broker that owns all Selenium WebDriver instances.
+
+API workers are stateless: when BROWSER_BROKER_SOCKET is set, route handlers
+decorated with `brokered` forward their call over a Unix socket to a single
+broker process, which runs the real handler next to `active_sessions`.
+
+Start the broker from the same working directory as the API workers (session
+files are shared through the `authentication-requests` directory):
+
+    BROWSER_BROKER_SOCKET=/tmp/kvk-browser-broker.sock python -m app.services.browser_broker
+
+Protocol: one JSON line per connection, {"op": ..., "args": {...}}, answered by
+one JSON line, {"ok": true, "result": ...} or {"ok": false, "status_code": ..., "detail": ...}.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+from typing import Any, Callable, Dict
+
+from fastapi import BackgroundTasks, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+BROKER_SOCKET = os.getenv("BROWSER_BROKER_SOCKET")
+BROKER_TIMEOUT = float(os.getenv("BROWSER_BROKER_TIMEOUT", "120"))
+
+# Operations the broker can run, registered by the `brokered` decorator
+_operations: Dict[str, Callable] = {}
+
+# Set in the broker process so its handlers run locally instead of forwarding
+_in_broker = False
+
+
+def broker_enabled() -> bool:
+    return bool(BROKER_SOCKET) and not _in_broker
+
+
+def call(operation: str, **args) -> Any:
+    """Run an operation in the broker process and return its result."""
+    request = json.dumps({"op": operation, "args": args}).encode() + b"\n"
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(BROKER_TIMEOUT)
+            sock.connect(BROKER_SOCKET)
+            sock.sendall(request)
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+    except OSError as e:
+        logger.error(f"Browser broker unavailable at {BROKER_SOCKET}: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Browser broker unavailable: {str(e)}")
+
+    if not line:
+        raise HTTPException(status_code=502, detail="Browser broker closed the connection")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise HTTPException(status_code=reply.get("status_code", 500), detail=reply.get("detail"))
+    return reply.get("result")
+
+
+def brokered(operation: str):
+    """
+    Mark a route handler as needing the browser. In API workers with a broker
+    configured the call is forwarded; in the broker (or without one) it runs locally.
+    BackgroundTasks arguments are not forwarded: the broker supplies its own.
+    """
+    def decorator(func):
+        _operations[operation] = func
+
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            if not broker_enabled():
+                return await func(**kwargs)
+            args = {key: value for key, value in kwargs.items() if not isinstance(value, BackgroundTasks)}
+            return await run_in_threadpool(call, operation, **args)
+        return wrapper
+    return decorator
+
+
+async def _dispatch(operation: str, args: Dict[str, Any]):
+    func = _operations.get(operation)
+    if func is None:
+        raise HTTPException(status_code=400, detail=f"Unknown broker operation: {operation}")
+
+    background_tasks = None
+    for name, param in inspect.signature(func).parameters.items():
+        if param.annotation is BackgroundTasks:
+            background_tasks = BackgroundTasks()
+            args[name] = background_tasks
+
+    result = await func(**args)
+    if background_tasks is not None and background_tasks.tasks:
+        # Background work (e.g. waiting for the wallet) must outlive this request
+        threading.Thread(target=asyncio.run, args=(background_tasks(),), daemon=True).start()
+    return result
+
+
+class _BrokerRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            result = asyncio.run(_dispatch(request["op"], dict(request.get("args") or {})))
+            reply = {"ok": True, "result": result}
+        except HTTPException as e:
+            reply = {"ok": False, "status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logger.exception("Browser broker operation failed")
+            reply = {"ok": False, "status_code": 500, "detail": str(e)}
+        self.wfile.write(json.dumps(reply, default=str).encode() + b"\n")
+
+
+class BrowserBrokerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(socket_path: str) -> None:
+    """Run the broker until interrupted."""
+    global _in_broker
+    _in_broker = True
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+
+    # Importing the routes registers the brokered operations
+    import app.routes.rdw_niscy  # noqa: F401
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with BrowserBrokerServer(socket_path, _BrokerRequestHandler) as server:
+        os.chmod(socket_path, 0o600)
+        logger.info(f"Browser broker listening on {socket_path} ({', '.join(sorted(_operations))})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Browser broker shutting down")
+        finally:
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    # Use the package module so routes register into the same operation table
+    from app.services import browser_broker
+    logging.basicConfig(level=logging.INFO)
+    browser_broker.serve(BROKER_SOCKET or "/tmp/kvk-browser-broker.sock")
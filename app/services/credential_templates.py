@@ -0,0 +1,294 @@
+"""
+Registry of the credential types the KvK issuer can issue.
+
+Each template declares where a credential's data comes from (a
+KVKBevoegdhedenAPI method), how every selectively disclosable claim is mapped
+from that KvK JSON, and how the credential is displayed. The claim mapping is
+compiled once at import into plain accessor functions, so issuance only walks a
+list of (claim name, accessor) pairs. The issuer metadata's
+`credential_configurations_supported` is generated from the same templates.
+"""
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ISSUANCE_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# Compiled accessor: (scope, root, now) -> claim value
+Accessor = Callable[[Any, Dict[str, Any], datetime], Any]
+
+
+# --- Transforms applied to a source value ---
+def family_name(full_name: str) -> str:
+    return full_name.split()[-1]
+
+
+def given_names(full_name: str) -> str:
+    return " ".join(full_name.split()[:-1])
+
+
+def kvk_date(value: str) -> str:
+    """KvK `dd-mm-yyyy` date as issuance datetime (same output as strptime/strftime)."""
+    match = re.fullmatch(r"(\d{1,2})-(\d{1,2})-(\d{4})", value)
+    if match is None:
+        raise ValueError(f"time data {value!r} does not match format '%d-%m-%Y'")
+    day, month, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    # Validates the calendar date
+    datetime(year, month, day)
+    return f"{year:04d}-{month:02d}-{day:02d}T00:00:00.000000Z"
+
+
+def postal_address(value: str) -> Dict[str, str]:
+    """Split a KvK postal address line into post code, place and street."""
+    address_parts = value.split()
+    return {
+        "post_code": next((part for part in address_parts if len(part) == 6 and part[:4].isdigit()), ""),
+        "post_name": address_parts[-1] if address_parts else "",
+        "thoroughfare": " ".join(address_parts[:-1]) if address_parts else ""
+    }
+
+
+# --- Claim specifications ---
+class ClaimSpec(ABC):
+    def __init__(self, display: Optional[str] = None, recursive: bool = False):
+        # Claims with a display name are listed in the issuer metadata
+        self.display = display
+        # Conceal the value's members / elements individually instead of as one disclosure
+        self.recursive = recursive
+
+    @abstractmethod
+    def compile(self) -> Accessor:
+        """Accessor computing the claim value."""
+
+
+class Field(ClaimSpec):
+    """Value at a dotted path in the current scope (or in the KvK response with root=True)."""
+
+    def __init__(self, path: str, transform: Optional[Callable[[Any], Any]] = None,
+                 root: bool = False, display: Optional[str] = None, recursive: bool = False):
+        super().__init__(display, recursive)
+        self.keys = tuple(path.split("."))
+        self.transform = transform
+        self.root = root
+
+    def compile(self) -> Accessor:
+        keys, transform, root = self.keys, self.transform, self.root
+        if len(keys) == 1:
+            key = keys[0]
+            def get(scope, source, now):
+                return (source if root else scope)[key]
+        elif len(keys) == 2:
+            first, second = keys
+            def get(scope, source, now):
+                return (source if root else scope)[first][second]
+        else:
+            def get(scope, source, now):
+                value = source if root else scope
+                for key in keys:
+                    value = value[key]
+                return value
+        if transform is None:
+            return get
+        return lambda scope, source, now: transform(get(scope, source, now))
+
+
+class Const(ClaimSpec):
+    def __init__(self, value: Any, display: Optional[str] = None):
+        super().__init__(display)
+        self.value = value
+
+    def compile(self) -> Accessor:
+        value = self.value
+        return lambda scope, source, now: value
+
+
+class IssuanceDate(ClaimSpec):
+    def __init__(self, days: int = 0, display: Optional[str] = None):
+        super().__init__(display)
+        self.offset = timedelta(days=days)
+
+    def compile(self) -> Accessor:
+        offset = self.offset
+        return lambda scope, source, now: (now + offset).strftime(ISSUANCE_DATETIME_FORMAT)
+
+
+class Object(ClaimSpec):
+    """A JSON object whose members are themselves claim specs."""
+
+    def __init__(self, claims: Dict[str, ClaimSpec], display: Optional[str] = None, recursive: bool = False):
+        super().__init__(display, recursive)
+        self.claims = claims
+
+    def compile(self) -> Accessor:
+        members = compile_claims(self.claims)
+        return lambda scope, source, now: {name: get(scope, source, now) for name, get in members}
+
+
+class Each(ClaimSpec):
+    """One object per element of the list at `path`; member paths are relative to the element."""
+
+    def __init__(self, path: str, claims: Dict[str, ClaimSpec], display: Optional[str] = None, recursive: bool = False):
+        super().__init__(display, recursive)
+        self.items = Field(path, root=True)
+        self.claims = claims
+
+    def compile(self) -> Accessor:
+        get_items = self.items.compile()
+        members = compile_claims(self.claims)
+        return lambda scope, source, now: [
+            {name: get(item, source, now) for name, get in members}
+            for item in get_items(scope, source, now)
+        ]
+
+
+def compile_claims(claims: Dict[str, ClaimSpec]) -> List[Tuple[str, Accessor]]:
+    return [(name, spec.compile()) for name, spec in claims.items()]
+
+
+# --- Templates ---
+class CredentialTemplate:
+    def __init__(
+        self,
+        credential_type: str,
+        vct: str,
+        source: str,
+        display_name: str,
+        logo_alt_text: str,
+        claims: Dict[str, ClaimSpec],
+        signing_alg: str = "ES256",
+    ):
+        self.credential_type = credential_type
+        self.vct = vct
+        # Name of the KVKBevoegdhedenAPI method returning the source data
+        self.source = source
+        self.display_name = display_name
+        self.logo_alt_text = logo_alt_text
+        self.claims = claims
+        self.signing_alg = signing_alg
+        self._accessors = compile_claims(claims)
+        self.recursive_claims = frozenset(name for name, spec in claims.items() if spec.recursive)
+
+    def build_claims(self, source_data: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        """Map KvK data onto the selectively disclosable claims of this credential."""
+        return {name: get(source_data, source_data, now) for name, get in self._accessors}
+
+    def configuration(self, include_display: bool = True) -> Dict[str, Any]:
+        """Entry of `credential_configurations_supported` for this credential type."""
+        configuration = {
+            # "format": "vc+sd-jwt",
+            "cryptographic_binding_methods_supported": ["jwk"],
+            "credential_signing_alg_values_supported": [self.signing_alg],
+            "proof_types_supported": {
+                "jwt": {
+                    "proof_signing_alg_values_supported": [self.signing_alg]
+                }
+            }
+        }
+        if not include_display:
+            return configuration
+        return {
+            "scope": self.credential_type,
+            **configuration,
+            "display": [{
+                "name": self.display_name,
+                "locale": "en-US",
+                "logo": {
+                    "uri": "https://example.com/logo.png",
+                    "alt_text": self.logo_alt_text
+                },
+                "background_color": "#12107c",
+                "text_color": "#FFFFFF"
+            }],
+            "claims": [
+                {
+                    "path": [name],
+                    "display": [{
+                        "name": spec.display,
+                        "locale": "en-US"
+                    }]
+                }
+                for name, spec in self.claims.items() if spec.display
+            ]
+        }
+
+
+CREDENTIAL_TEMPLATES: Dict[str, CredentialTemplate] = {}
+
+
+def register_template(template: CredentialTemplate) -> CredentialTemplate:
+    CREDENTIAL_TEMPLATES[template.credential_type] = template
+    return template
+
+
+def get_template(credential_type: str) -> CredentialTemplate:
+    template = CREDENTIAL_TEMPLATES.get(credential_type)
+    if template is None:
+        raise ValueError(f"Unsupported credential type: {credential_type}")
+    return template
+
+
+def credential_configurations_supported(include_display: bool = True) -> Dict[str, Dict[str, Any]]:
+    return {
+        credential_type: template.configuration(include_display)
+        for credential_type, template in CREDENTIAL_TEMPLATES.items()
+    }
+
+
+register_template(CredentialTemplate(
+    credential_type="LPIDSdJwt",
+    vct="LPID",
+    source="get_lpid",
+    display_name="Legal Person Identifier",
+    logo_alt_text="Legal Person ID logo",
+    claims={
+        "legal_person_id": Field("data.id", display="Legal Person ID"),
+        "legal_person_name": Field("data.legal_person_name", display="Legal Person Name"),
+        "issuer_id": Field("metadata.issuer_id"),
+        "issuer_name": Field("metadata.issuing_authority_name"),
+        "issuer_country": Field("metadata.issuing_country"),
+        "issuance_date": IssuanceDate(),
+        "expiry_date": IssuanceDate(days=365),
+        "authentic_source_id": Field("metadata.issuer_id"),
+        "authentic_source_name": Const("Kamer van Koophandel"),
+    },
+))
+
+register_template(CredentialTemplate(
+    credential_type="EUCCSdJwt",
+    vct="EUCC",
+    source="get_company_certificate",
+    display_name="EU Company Certificate",
+    logo_alt_text="EU Company Certificate logo",
+    claims={
+        "legalName": Field("data.legal_person_name", display="Legal Name"),
+        "legalFormType": Field("data.legal_form", display="Legal Form"),
+        "legalIdentifier": Field("data.id", display="Legal Identifier"),
+        "registeredAddress": Field("data.postal_address", transform=postal_address, display="Registered Address", recursive=True),
+        "postalAddress": Field("data.postal_address", transform=postal_address, recursive=True),
+        "registrationDate": Field("data.date_of_registration", transform=kvk_date, display="Registration Date"),
+        "shareCapital": Const(None),
+        "legalEntityStatus": Const("active", display="Legal Entity Status"),
+        "legalRepresentative": Each("data.authorized_persons", {
+            "role": Const("J"),
+            "legalEntityId": Field("data.registration_number", root=True),
+            "scopeOfRepresentation": Const("Jointly"),
+            "family_name": Field("full_name", transform=family_name),
+            "given_name": Field("full_name", transform=given_names),
+            "birth_date": Field("date_of_birth", transform=kvk_date),
+        }, display="Legal Representatives", recursive=True),
+        "legalEntityActivity": Const([{"code": "", "businessDescription": ""}]),
+        "contactPoint": Object({
+            "contactPage": Const(""),
+            "hasEmail": Field("data.electronic_address"),
+            "hasTelephone": Const(""),
+        }, display="Contact Information", recursive=True),
+        "issuer_id": Field("metadata.issuer_id"),
+        "issuer_name": Field("metadata.issuing_authority_name"),
+        "issuer_country": Field("metadata.issuing_country"),
+        "issuance_date": IssuanceDate(),
+        "expiry_date": IssuanceDate(days=365),
+        "authentic_source_id": Field("metadata.issuer_id"),
+        "authentic_source_name": Const("Kamer van Koophandel"),
+    },
+))
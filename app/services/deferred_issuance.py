@@ -0,0 +1,229 @@
+"""
+Deferred credential issuance (OpenID4VCI deferred credential endpoint).
+
+Credentials are built on a bounded pool of worker threads. The credential
+endpoint waits up to DEFERRED_ISSUANCE_BUDGET_MS for the build (mostly the KvK
+lookups); when the budget runs out it answers with a `transaction_id` and the
+build carries on in the background. The wallet then polls the deferred
+credential endpoint with the same access token.
+
+The polling interval is chosen from the observed build times: an exponentially
+weighted average of recent builds minus the time the transaction has already
+taken, clamped to [DEFERRED_MIN_INTERVAL_SECONDS, DEFERRED_MAX_INTERVAL_SECONDS].
+Results are handed out once and dropped after DEFERRED_RESULT_TTL_SECONDS.
+Transactions are kept in creation order, so expiring them only looks at the
+oldest entries.
+
+Without DEFERRED_DB_PATH, transactions live in the memory of the worker that
+started the build, so a poll landing on another API worker gets
+`invalid_transaction_id`. With DEFERRED_DB_PATH set, a deferred transaction is
+written to SQLite and the build's result is stored there when it finishes, so
+any worker sharing the file can answer the poll; the result is handed out by
+whichever poll deletes the row. A transaction whose worker died before its
+build finished stays pending until it expires. `defer` and `poll` then block on
+SQLite (and on the lock the finishing builds take): async handlers call them in
+the threadpool.
+"""
+import hashlib
+import logging
+import math
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.services import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Shared transaction store for several API workers (unset: transactions are per process)
+DEFERRED_DB_PATH = os.getenv("DEFERRED_DB_PATH")
+# How long the credential endpoint waits for a build before deferring it (0: never defer)
+DEFERRED_ISSUANCE_BUDGET_MS = float(os.getenv("DEFERRED_ISSUANCE_BUDGET_MS", "3000"))
+# Threads building credentials (bounds the concurrent KvK lookups for issuance)
+DEFERRED_ISSUANCE_WORKERS = int(os.getenv("DEFERRED_ISSUANCE_WORKERS", "16"))
+DEFERRED_RESULT_TTL_SECONDS = int(os.getenv("DEFERRED_RESULT_TTL_SECONDS", "600"))
+DEFERRED_MIN_INTERVAL_SECONDS = int(os.getenv("DEFERRED_MIN_INTERVAL_SECONDS", "1"))
+DEFERRED_MAX_INTERVAL_SECONDS = int(os.getenv("DEFERRED_MAX_INTERVAL_SECONDS", "30"))
+
+# Weight of the latest build time in the running average
+DURATION_SMOOTHING = 0.2
+
+PENDING = "pending"
+ISSUED = "issued"
+FAILED = "failed"
+UNKNOWN = "unknown"
+
+
+class DeferredIssuance:
+    def __init__(
+        self,
+        workers: int = DEFERRED_ISSUANCE_WORKERS,
+        budget_ms: float = DEFERRED_ISSUANCE_BUDGET_MS,
+        result_ttl_seconds: int = DEFERRED_RESULT_TTL_SECONDS,
+        min_interval_seconds: int = DEFERRED_MIN_INTERVAL_SECONDS,
+        max_interval_seconds: int = DEFERRED_MAX_INTERVAL_SECONDS,
+        db_path: Optional[str] = DEFERRED_DB_PATH,
+    ):
+        self.budget_seconds = budget_ms / 1000 if budget_ms > 0 else None
+        self.result_ttl_seconds = result_ttl_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="credential-build")
+        self._lock = threading.Lock()
+        # transaction_id -> (access token digest, build, started_at, expires_at)
+        self._transactions: "OrderedDict[str, Tuple[bytes, Future, float, float]]" = OrderedDict()
+        self._average_duration: Optional[float] = None
+        self.deferred = 0
+        self.completed = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS deferred_transactions ("
+                "transaction_id TEXT PRIMARY KEY, token_hash BLOB NOT NULL, state TEXT NOT NULL, "
+                "result BLOB, started_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def _token_hash(access_token: str) -> bytes:
+        return hashlib.sha256(access_token.encode()).digest()
+
+    def submit(self, build: Callable[..., Any], *args: Any) -> Tuple[Future, float]:
+        """Start a build on the worker pool; returns the future and its start time."""
+        started_at = time.monotonic()
+
+        def timed_build():
+            try:
+                return build(*args)
+            finally:
+                self._record_duration(time.monotonic() - started_at)
+
+        return self._executor.submit(timed_build), started_at
+
+    def defer(self, access_token: str, build: Future, started_at: float) -> Tuple[str, int]:
+        """Register a running build; returns (transaction_id, polling interval in seconds)."""
+        transaction_id = secrets.token_urlsafe(24)
+        token_hash = self._token_hash(access_token)
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            self._transactions[transaction_id] = (
+                token_hash, build, started_at, time.monotonic() + self.result_ttl_seconds
+            )
+            self.deferred += 1
+            if self._db is not None:
+                # Wall clock, as other processes read it
+                now = time.time()
+                self._db.execute(
+                    "INSERT INTO deferred_transactions (transaction_id, token_hash, state, result, started_at, expires_at) "
+                    "VALUES (?, ?, ?, NULL, ?, ?)",
+                    (transaction_id, token_hash, PENDING, now - (time.monotonic() - started_at), now + self.result_ttl_seconds),
+                )
+        if self._db is not None:
+            # Runs right away when the build already finished
+            build.add_done_callback(lambda done: self._store_result(transaction_id, done))
+        return transaction_id, self.interval(started_at)
+
+    def poll(self, transaction_id: str, access_token: str) -> Tuple[str, Any]:
+        """
+        State of a deferred build for the access token that started it:
+        (PENDING, interval), (ISSUED, result), (FAILED, error message) or (UNKNOWN, None).
+        A result is handed out only once.
+        """
+        if self._db is not None:
+            return self._poll_db(transaction_id, self._token_hash(access_token))
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            transaction = self._transactions.get(transaction_id)
+            if transaction is None or not secrets.compare_digest(transaction[0], self._token_hash(access_token)):
+                return UNKNOWN, None
+            token_hash, build, started_at, _ = transaction
+            if not build.done():
+                return PENDING, self.interval(started_at)
+            del self._transactions[transaction_id]
+        error = build.exception()
+        if error is not None:
+            logger.error(f"Deferred credential build failed: {str(error)}")
+            return FAILED, str(error)
+        return ISSUED, build.result()
+
+    def interval(self, started_at: float) -> int:
+        """Seconds until the build is expected to be done."""
+        return self._interval(time.monotonic() - started_at)
+
+    def _interval(self, elapsed: float) -> int:
+        average = self._average_duration if self._average_duration is not None else self.budget_seconds or 0
+        return max(self.min_interval_seconds, min(self.max_interval_seconds, math.ceil(average - elapsed)))
+
+    def _store_result(self, transaction_id: str, build: Future) -> None:
+        # Done-callback of a deferred build (DEFERRED_DB_PATH set)
+        error = build.exception()
+        state, result = (FAILED, str(error).encode()) if error is not None else (ISSUED, json_codec.dumps(build.result()))
+        with self._lock:
+            self._transactions.pop(transaction_id, None)
+            try:
+                self._db.execute(
+                    "UPDATE deferred_transactions SET state = ?, result = ? WHERE transaction_id = ?",
+                    (state, result, transaction_id),
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Error storing deferred credential result: {str(e)}")
+
+    def _poll_db(self, transaction_id: str, token_hash: bytes) -> Tuple[str, Any]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT token_hash, state, result, started_at FROM deferred_transactions "
+                "WHERE transaction_id = ? AND expires_at > ?",
+                (transaction_id, now),
+            ).fetchone()
+            if row is None or not secrets.compare_digest(bytes(row[0]), token_hash):
+                return UNKNOWN, None
+            if row[1] == PENDING:
+                return PENDING, self._interval(now - row[3])
+            # Whoever deletes the row hands out the result
+            if self._db.execute(
+                "DELETE FROM deferred_transactions WHERE transaction_id = ?", (transaction_id,)
+            ).rowcount == 0:
+                return UNKNOWN, None
+        if row[1] == FAILED:
+            error = bytes(row[2]).decode()
+            logger.error(f"Deferred credential build failed: {error}")
+            return FAILED, error
+        return ISSUED, json_codec.loads(bytes(row[2]))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": sum(1 for _, build, _, _ in self._transactions.values() if not build.done()),
+                "transactions": len(self._transactions),
+                "deferred": self.deferred,
+                "completed": self.completed,
+                "average_build_seconds": self._average_duration,
+            }
+
+    def _record_duration(self, duration: float) -> None:
+        with self._lock:
+            self.completed += 1
+            if self._average_duration is None:
+                self._average_duration = duration
+            else:
+                self._average_duration += DURATION_SMOOTHING * (duration - self._average_duration)
+
+    def _purge_expired(self, now: float) -> None:
+        # Called with the lock held; transactions are in creation order
+        while self._transactions:
+            transaction_id, (_, _, _, expires_at) = next(iter(self._transactions.items()))
+            if expires_at > now:
+                break
+            del self._transactions[transaction_id]
+        if self._db is not None:
+            self._db.execute("DELETE FROM deferred_transactions WHERE expires_at <= ?", (time.time(),))
+
+
+deferred_issuance = DeferredIssuance()
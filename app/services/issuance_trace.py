@@ -0,0 +1,112 @@
+"""
+Opt-in, per-request trace of credential issuance.
+
+With ISSUANCE_TRACE=off (default) no trace object exists and the issuance code
+skips every trace step behind a single `if trace is not None`, so nothing is
+formatted or decoded. With ISSUANCE_TRACE=header a request is traced when it
+sends `X-Issuance-Trace: 1`; with ISSUANCE_TRACE=always every request is.
+
+A trace is a list of timed steps with structured fields. Private material is
+redacted when it is recorded: private JWK members, bearer tokens, disclosure
+salts and values (only claim names are kept) and JWT signatures never end up in
+a trace. Finished traces are logged as one JSON line and kept in a small
+in-memory ring for GET /mini-suomi/debug/issuance-traces, which requires
+ISSUANCE_TRACE_ADMIN_TOKEN.
+"""
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ISSUANCE_TRACE = os.getenv("ISSUANCE_TRACE", "off").lower()
+ISSUANCE_TRACE_HEADER = "X-Issuance-Trace"
+ISSUANCE_TRACE_KEEP = int(os.getenv("ISSUANCE_TRACE_KEEP", "50"))
+
+REDACTED = "[redacted]"
+PRIVATE_JWK_MEMBERS = ("d", "p", "q", "dp", "dq", "qi", "oth", "k")
+SENSITIVE_HEADERS = ("authorization", "cookie", "proxy-authorization")
+
+
+def redact_jwk(jwk: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if jwk is None:
+        return None
+    return {name: (REDACTED if name in PRIVATE_JWK_MEMBERS else value) for name, value in jwk.items()}
+
+
+def redact_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    return {name: (REDACTED if name.lower() in SENSITIVE_HEADERS else value) for name, value in headers.items()}
+
+
+def redact_jwt(token: str) -> str:
+    """Keep header and payload of a compact JWT, drop the signature."""
+    parts = token.split(".")
+    if len(parts) != 3:
+        return REDACTED
+    return f"{parts[0]}.{parts[1]}.{REDACTED}"
+
+
+def decode_disclosure(disclosure: str) -> List[Any]:
+    """Decoded disclosure with its salt and value removed: only an object member's claim name is kept."""
+    decoded = json.loads(base64.urlsafe_b64decode(disclosure + "=" * (-len(disclosure) % 4)))
+    # [salt, name, value] for object members, [salt, value] for array elements
+    return [REDACTED, decoded[1], REDACTED] if len(decoded) == 3 else [REDACTED, REDACTED]
+
+
+class IssuanceTrace:
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.perf_counter()
+        self.steps: List[Dict[str, Any]] = []
+
+    def record(self, step: str, **fields: Any) -> None:
+        self.steps.append({
+            "step": step,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            **fields
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"trace_id": self.trace_id, "name": self.name, "steps": self.steps}
+
+
+class IssuanceTraceRecorder:
+    """Decides whether a request is traced and keeps the latest finished traces."""
+
+    def __init__(self, mode: str = ISSUANCE_TRACE, keep: int = ISSUANCE_TRACE_KEEP):
+        self.mode = mode
+        self.keep = keep
+        self._traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, name: str, headers) -> Optional[IssuanceTrace]:
+        if self.mode == "always" or (self.mode == "header" and headers.get(ISSUANCE_TRACE_HEADER) == "1"):
+            return IssuanceTrace(name)
+        return None
+
+    def finish(self, trace: IssuanceTrace) -> None:
+        trace.record("done")
+        finished = trace.to_dict()
+        logger.info(json.dumps(finished, default=str))
+        with self._lock:
+            self._traces[trace.trace_id] = finished
+            while len(self._traces) > self.keep:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def latest(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(reversed(self._traces.values()))
+
+
+trace_recorder = IssuanceTraceRecorder()
@@ -0,0 +1,57 @@
+"""
+JSON codec used for HTTP responses and stored session data.
+
+Uses orjson when it is installed and falls back to the stdlib otherwise. Output
+is compact by default. Anything that is hashed or signed (SD-JWT disclosures)
+must use `dumps_stable`, whose bytes never depend on which encoder is installed.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+CODEC_NAME = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """Serialise to UTF-8 JSON bytes, compact unless `pretty` is set."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except TypeError:
+            # e.g. non-str dict keys or integers beyond 64 bits; the stdlib handles these
+            pass
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from bytes or str. Raises json.JSONDecodeError on invalid input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Reused: json.dumps with non-default arguments builds a new encoder per call
+_stable_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def dumps_stable(obj: Any) -> str:
+    """
+    Compact stdlib serialisation for data whose exact bytes are hashed, such as
+    SD-JWT disclosures. Deliberately independent of the installed codec.
+    """
+    return _stable_encoder.encode(obj)
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast codec."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
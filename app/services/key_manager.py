@@ -0,0 +1,249 @@
+"""
+Asymmetric signing keys with `kid`s, rotation and a pre-serialised JWKS.
+
+Keys are loaded once and kept as parsed `cryptography` key objects (plus the
+python-jose key object, built on first use). The first key is the active
+signing key; the others stay available for verification so tokens signed
+before a rotation keep validating until they expire.
+
+Also verifies JWTs signed by other parties' keys (holder proofs, SD-JWTs):
+python-jose has no Ed25519 support, so EdDSA signatures are checked with
+`cryptography` instead.
+"""
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_ALGORITHMS = ("ES256", "EdDSA")
+
+
+def base64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("utf-8")
+
+
+def base64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def public_jwk(public_key) -> Dict[str, str]:
+    """Return the JWK members of a P-256 or Ed25519 public key (without kid/alg)."""
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        numbers = public_key.public_numbers()
+        return {
+            "kty": "EC",
+            "crv": "P-256",
+            "x": base64url_encode(numbers.x.to_bytes(32, "big")),
+            "y": base64url_encode(numbers.y.to_bytes(32, "big")),
+        }
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return {"kty": "OKP", "crv": "Ed25519", "x": base64url_encode(raw)}
+    raise ValueError(f"Unsupported key type: {type(public_key).__name__}")
+
+
+def private_key_from_jwk(jwk: Dict[str, str]):
+    """Build a private key object from a private EC (P-256) or OKP (Ed25519) JWK."""
+    d = base64url_decode(jwk["d"])
+    if jwk.get("kty") == "EC" and jwk.get("crv") == "P-256":
+        return ec.derive_private_key(int.from_bytes(d, "big"), ec.SECP256R1())
+    if jwk.get("kty") == "OKP" and jwk.get("crv") == "Ed25519":
+        return ed25519.Ed25519PrivateKey.from_private_bytes(d)
+    raise ValueError(f"Unsupported private JWK: kty={jwk.get('kty')} crv={jwk.get('crv')}")
+
+
+def jwk_thumbprint(jwk: Dict[str, str]) -> str:
+    """RFC 7638 SHA-256 thumbprint of a public JWK."""
+    required = {"EC": ("crv", "kty", "x", "y"), "OKP": ("crv", "kty", "x")}[jwk["kty"]]
+    canonical = json.dumps({name: jwk[name] for name in required}, separators=(",", ":"), sort_keys=True)
+    return base64url_encode(hashlib.sha256(canonical.encode()).digest())
+
+
+def verification_key(jwk: Dict[str, Any], algorithm: str):
+    """Parsed public key to check `algorithm` signatures with (see verify_jwt)."""
+    if algorithm == "EdDSA":
+        if jwk.get("kty") != "OKP" or jwk.get("crv") != "Ed25519":
+            raise ValueError("EdDSA requires an Ed25519 JWK")
+        return ed25519.Ed25519PublicKey.from_public_bytes(base64url_decode(jwk["x"]))
+    from jose import jwk as jose_jwk
+
+    return jose_jwk.construct(jwk, algorithm)
+
+
+def verify_jwt(token: str, key, algorithm: str) -> Dict[str, Any]:
+    """
+    Check the signature (and `exp`/`nbf`, when present) of a compact JWT signed
+    with `algorithm` by `key` from verification_key; returns its claims. The
+    audience is left to the caller. Raises ValueError or a python-jose JOSEError.
+    """
+    if algorithm != "EdDSA":
+        if isinstance(key, ed25519.Ed25519PublicKey):
+            raise ValueError(f"An Ed25519 key cannot verify {algorithm} signatures")
+        from jose import jwt
+
+        return jwt.decode(token, key, algorithms=[algorithm], options={"verify_aud": False})
+    if not isinstance(key, ed25519.Ed25519PublicKey):
+        raise ValueError("EdDSA signatures need an Ed25519 key")
+    segments = token.split(".")
+    if len(segments) != 3:
+        raise ValueError("Malformed JWT")
+    header = json.loads(base64url_decode(segments[0]))
+    if not isinstance(header, dict) or header.get("alg") != "EdDSA":
+        raise ValueError("JWT header alg is not EdDSA")
+    try:
+        key.verify(base64url_decode(segments[2]), f"{segments[0]}.{segments[1]}".encode("ascii"))
+    except InvalidSignature:
+        raise ValueError("Signature verification failed")
+    claims = json.loads(base64url_decode(segments[1]))
+    if not isinstance(claims, dict):
+        raise ValueError("JWT claims are not a JSON object")
+    now = time.time()
+    if "exp" in claims and (not isinstance(claims["exp"], (int, float)) or now >= claims["exp"]):
+        raise ValueError("Signature has expired")
+    if "nbf" in claims and (not isinstance(claims["nbf"], (int, float)) or now < claims["nbf"]):
+        raise ValueError("The token is not yet valid (nbf)")
+    return claims
+
+
+class SigningKey:
+    def __init__(self, private_key, algorithm: str, kid: Optional[str] = None, key_use: Optional[str] = "sig"):
+        if algorithm == "ES256" and not (
+            isinstance(private_key, ec.EllipticCurvePrivateKey) and isinstance(private_key.curve, ec.SECP256R1)
+        ):
+            raise ValueError("ES256 requires a P-256 private key")
+        if algorithm == "EdDSA" and not isinstance(private_key, ed25519.Ed25519PrivateKey):
+            raise ValueError("EdDSA requires an Ed25519 private key")
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.algorithm = algorithm
+        jwk = public_jwk(self.public_key)
+        self.kid = kid or jwk_thumbprint(jwk)
+        self.public_jwk = {**jwk, "alg": algorithm, "kid": self.kid}
+        if key_use:
+            self.public_jwk["use"] = key_use
+        self._jose_key = None
+
+    @property
+    def jose_key(self):
+        """python-jose key object, so jose.jwt.encode does not re-parse the key per call."""
+        if self._jose_key is None:
+            from jose import jwk as jose_jwk
+
+            pem = self.private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+            self._jose_key = jose_jwk.construct(pem, self.algorithm)
+        return self._jose_key
+
+
+class KeyManager:
+    def __init__(self, algorithm: str, key_use: Optional[str] = "sig"):
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.key_use = key_use
+        self._keys: Dict[str, SigningKey] = {}
+        self._active_kid: Optional[str] = None
+        self._jwks: Optional[Dict[str, Any]] = None
+        self._jwks_json: Optional[bytes] = None
+        # Incremented on every key-set change, for callers caching derived documents
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pem_files(
+        cls, algorithm: str, paths: List[str], kids: Optional[List[str]] = None, key_use: Optional[str] = "sig"
+    ) -> "KeyManager":
+        """Load keys from PEM files; the first file holds the active signing key."""
+        manager = cls(algorithm, key_use)
+        kids = kids or []
+        for index in reversed(range(len(paths))):
+            with open(paths[index], "rb") as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+            manager.add_key(private_key, kid=kids[index] if index < len(kids) else None, activate=True)
+        return manager
+
+    @classmethod
+    def from_jwks(cls, algorithm: str, jwks: Dict[str, Any], key_use: Optional[str] = "sig") -> "KeyManager":
+        """Load private keys from a JWK or JWK Set; the first key is the active signing key."""
+        manager = cls(algorithm, key_use)
+        keys = jwks["keys"] if "keys" in jwks else [jwks]
+        for jwk in reversed(keys):
+            manager.add_key(private_key_from_jwk(jwk), kid=jwk.get("kid"), activate=True)
+        return manager
+
+    @classmethod
+    def generate(cls, algorithm: str) -> "KeyManager":
+        """Create a manager with a fresh in-memory key (development only: the key exists in this process alone)."""
+        manager = cls(algorithm)
+        manager.rotate()
+        return manager
+
+    def add_key(self, private_key, kid: Optional[str] = None, activate: bool = False) -> SigningKey:
+        key = SigningKey(private_key, self.algorithm, kid, self.key_use)
+        with self._lock:
+            self._keys[key.kid] = key
+            if activate or self._active_kid is None:
+                self._active_kid = key.kid
+            self._key_set_changed()
+        return key
+
+    def rotate(self) -> SigningKey:
+        """Generate a new active key; previous keys remain valid for verification."""
+        if self.algorithm == "ES256":
+            private_key = ec.generate_private_key(ec.SECP256R1())
+        else:
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        key = self.add_key(private_key, activate=True)
+        logger.info(f"Rotated {self.algorithm} signing key, new kid: {key.kid}")
+        return key
+
+    def retire(self, kid: str) -> None:
+        """Stop accepting a non-active key (once all tokens it signed have expired)."""
+        with self._lock:
+            if kid == self._active_kid:
+                raise ValueError("Cannot retire the active signing key")
+            self._keys.pop(kid, None)
+            self._key_set_changed()
+
+    def _key_set_changed(self) -> None:
+        self._jwks = None
+        self._jwks_json = None
+        self.version += 1
+
+    @property
+    def active_key(self) -> SigningKey:
+        return self._keys[self._active_kid]
+
+    def get_key(self, kid: Optional[str]) -> Optional[SigningKey]:
+        return self._keys.get(kid)
+
+    def keys(self) -> List[SigningKey]:
+        return list(self._keys.values())
+
+    def jwks(self) -> Dict[str, List[Dict[str, str]]]:
+        """Public JWK Set, built once per key-set change. Do not mutate."""
+        jwks = self._jwks
+        if jwks is None:
+            jwks = {"keys": [key.public_jwk for key in self._keys.values()]}
+            self._jwks = jwks
+        return jwks
+
+    def jwks_json(self) -> bytes:
+        """JWKS serialised once per key-set change."""
+        jwks_json = self._jwks_json
+        if jwks_json is None:
+            jwks_json = json.dumps(self.jwks(), separators=(",", ":")).encode()
+            self._jwks_json = jwks_json
+        return jwks_json
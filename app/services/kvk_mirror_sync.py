@@ -0,0 +1,144 @@
+"""
+Sync job of the local KvK mirror (see app.clients.kvk_mirror).
+
+Every KVK_MIRROR_SYNC_INTERVAL_SECONDS a pass fetches the LPID and company
+certificate of every configured KvK number (KVK_MIRROR_KVK_NUMBERS) and every
+number already in the mirror straight from the upstream, KVK_BATCH_CONCURRENCY
+at a time. Only changed records are rewritten; records the upstream answers 404
+for are removed. A pass without failures marks the mirror complete, after which
+natural-person lookups can fall back to its person index while the upstream's
+circuit breaker is open.
+
+The upstream has no change feed, so a pass compares content digests rather than
+asking for changes since the previous pass.
+
+The job runs on a daemon thread, started from the app's lifespan when the mirror
+is enabled. Only one process syncs: the one holding an exclusive lock on
+KVK_MIRROR_DB_PATH + ".sync-lock" (other API workers sharing the mirror only
+read it). A single pass can also be run by hand, unless a job holds the lock:
+
+Run from the repository root: python -m app.services.kvk_mirror_sync
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Dict, IO, Optional
+
+import httpx
+
+from app.clients.kvk_bevoegdheden_rest_api import AsyncKVKBevoegdhedenAPI
+from app.clients.kvk_mirror import (
+    ADDED,
+    CHANGED,
+    KVK_MIRROR_DB_PATH,
+    KVK_MIRROR_KVK_NUMBERS,
+    UNCHANGED,
+    KVKMirror,
+    kvk_mirror,
+)
+from app.clients.kvk_response_cache import COMPANY_CERTIFICATE, LPID
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sync passes; 0 disables the background job
+KVK_MIRROR_SYNC_INTERVAL_SECONDS = int(os.getenv("KVK_MIRROR_SYNC_INTERVAL_SECONDS", "300"))
+
+# Its own client: kvk_api keeps one client per event loop and the job runs its own loops
+sync_api = AsyncKVKBevoegdhedenAPI()
+_sync_lock_file: Optional[IO] = None
+_sync_thread: Optional[threading.Thread] = None
+_start_lock = threading.Lock()
+_stop = threading.Event()
+last_pass: Dict[str, int] = {}
+
+
+def acquire_sync_lock(db_path: str) -> bool:
+    """Become the process that syncs the mirror at `db_path`, unless another one is."""
+    global _sync_lock_file
+    if _sync_lock_file is not None:
+        return True
+    lock_file = open(f"{db_path}.sync-lock", "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    # Held (open) for the life of the process
+    _sync_lock_file = lock_file
+    return True
+
+
+async def sync_once(mirror: KVKMirror) -> Dict[str, int]:
+    """One pass over the configured and mirrored KvK numbers; returns per-outcome counts."""
+    started = time.time()
+    numbers = sorted(set(KVK_MIRROR_KVK_NUMBERS) | set(mirror.kvk_numbers()))
+    counts = {ADDED: 0, CHANGED: 0, UNCHANGED: 0, "removed": 0, "failed": 0}
+    for kind in (LPID, COMPANY_CERTIFICATE):
+        async for kvk_nummer, value, error in sync_api.lookup_many(
+            lambda number, kind=kind: sync_api.fetch_record(kind, number), numbers
+        ):
+            if error is None:
+                counts[mirror.put(kind, kvk_nummer, value)] += 1
+            elif isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 404:
+                mirror.delete(kind, kvk_nummer)
+                counts["removed"] += 1
+            else:
+                logger.warning(f"KvK mirror sync of {kind} {kvk_nummer} failed: {error}")
+                counts["failed"] += 1
+    # Without a configured list the mirror only holds what happened to be read through it
+    if KVK_MIRROR_KVK_NUMBERS and not counts["failed"]:
+        mirror.mark_complete(started)
+    return counts
+
+
+async def _sync_pass(mirror: KVKMirror) -> Dict[str, int]:
+    try:
+        return await sync_once(mirror)
+    finally:
+        await sync_api.aclose()
+
+
+def sync_forever(mirror: KVKMirror, interval_seconds: int) -> None:
+    global last_pass
+    while not _stop.is_set():
+        try:
+            last_pass = asyncio.run(_sync_pass(mirror))
+            logger.info(f"KvK mirror sync: {last_pass}")
+        except Exception as e:
+            logger.error(f"KvK mirror sync failed: {e}")
+        _stop.wait(interval_seconds)
+
+
+def start() -> None:
+    """Start the background sync job (app lifespan), if the mirror is enabled and no other process syncs it."""
+    global _sync_thread
+    if kvk_mirror is None or KVK_MIRROR_SYNC_INTERVAL_SECONDS <= 0:
+        return
+    with _start_lock:
+        if _sync_thread is not None and _sync_thread.is_alive():
+            return
+        if not acquire_sync_lock(KVK_MIRROR_DB_PATH):
+            logger.info("KvK mirror is synced by another process")
+            return
+        _stop.clear()
+        _sync_thread = threading.Thread(
+            target=sync_forever, args=(kvk_mirror, KVK_MIRROR_SYNC_INTERVAL_SECONDS), name="kvk-mirror-sync", daemon=True
+        )
+        _sync_thread.start()
+
+
+def stop() -> None:
+    """Stop the background sync job after its current pass (app lifespan)."""
+    _stop.set()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    if kvk_mirror is None:
+        raise SystemExit("KVK_MIRROR_DB_PATH is not set")
+    if not acquire_sync_lock(KVK_MIRROR_DB_PATH):
+        raise SystemExit("The KvK mirror is being synced by another process")
+    print(asyncio.run(_sync_pass(kvk_mirror)))
@@ -1,14 +1,23 @@
 import requests
 import logging
 from app.clients.kvk_bevoegdheden_rest_api import KVKBevoegdhedenAPI
+from app.services.key_manager import KeyManager, SigningKey
+from app.services.nonce_store import nonce_store
+from app.services.offer_store import offer_store
+from app.services.proof_verifier import ProofVerifier
+from app.services.sd_jwt_verifier import JWKSResolver, PresentationVerifier
+from app.services.sd_jwt_builder import build_sd_jwt, create_disclosures
+from app.services.status_list import StatusListService
+from app.services.signing_service import SIGNING_WORKERS, SigningService
+from app.services.credential_templates import get_template
+from app.services.issuance_trace import IssuanceTrace, decode_disclosure, redact_jwk, redact_jwt
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
-from typing import Dict, Any
-from jose import jwt
-import hashlib
+from typing import Dict, Any, FrozenSet, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import json
-import base64
+from pathlib import Path
 
 # Load environment variables
 load_dotenv()
@@ -17,9 +26,59 @@ load_dotenv()
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
 ISSUER_DOMAIN = os.getenv('EWC_PROD_DOMAIN') if ENVIRONMENT == "production" else os.getenv('DEV_DOMAIN')
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Issuer signing keys: a private JWK / JWK Set in ISSUER_PRIVATE_JWKS, or PEM files
+# in ISSUER_KEY_FILES (default: private_key.pem in the repository root). The first
+# key signs; the others stay in the published JWKS during a rotation.
+DEFAULT_ISSUER_KEY_FILE = str(Path(__file__).resolve().parents[2] / "private_key.pem")
+DEFAULT_ISSUER_KEY_ID = "authentication-key"
+
+
+def load_issuer_keys() -> KeyManager:
+    private_jwks = os.getenv("ISSUER_PRIVATE_JWKS")
+    if private_jwks:
+        manager = KeyManager.from_jwks("ES256", json.loads(private_jwks), key_use=None)
+    else:
+        key_files = [path.strip() for path in os.getenv("ISSUER_KEY_FILES", DEFAULT_ISSUER_KEY_FILE).split(",") if path.strip()]
+        key_ids = [kid.strip() for kid in os.getenv("ISSUER_KEY_IDS", DEFAULT_ISSUER_KEY_ID).split(",")]
+        manager = KeyManager.from_pem_files("ES256", key_files, kids=key_ids, key_use=None)
+    # Parse the signing key for python-jose now rather than on the first issuance
+    manager.active_key.jose_key
+    return manager
+
+
+issuer_key_manager = load_issuer_keys()
+
+# `iss` of the credentials we issue
+CREDENTIAL_ISSUER = "https://kvk-issuance-service.nieuwlaar.com/mini-suomi/issuers/kvk"
+
+# Verifies presentations of our own credentials against the local issuer keys,
+# and of SD_JWT_TRUSTED_ISSUERS through their jwt-vc-issuer metadata
+presentation_verifier = PresentationVerifier(JWKSResolver(local_issuers={
+    issuer: issuer_key_manager.jwks
+    for issuer in (CREDENTIAL_ISSUER, f"{ISSUER_DOMAIN}/mini-suomi/issuers/kvk" if ISSUER_DOMAIN else None)
+    if issuer
+}))
+
+# Verifies the holder's proofs of possession sent to the credential endpoints
+proof_verifier = ProofVerifier(
+    audiences=[issuer for issuer in (CREDENTIAL_ISSUER, f"{ISSUER_DOMAIN}/mini-suomi/issuers/kvk" if ISSUER_DOMAIN else None) if issuer],
+    nonce_store=nonce_store
+)
+
+# Status list bits for every issued credential (revocation)
+status_list_service = StatusListService(issuer_key_manager, CREDENTIAL_ISSUER)
+
+
+def status_list_uri(list_id: int) -> str:
+    base_url = f"{ISSUER_DOMAIN}/mini-suomi/issuers/kvk" if ISSUER_DOMAIN else CREDENTIAL_ISSUER
+    return f"{base_url}/status-lists/{list_id}"
+
+
+# Worker processes for disclosures and signing (None: sign in the request process)
+signing_service = SigningService(issuer_key_manager) if SIGNING_WORKERS > 0 else None
+
 # def test_get_issuers():
 #     url = f"{BASE_URL}/issuers"
 #     response = requests.get(url)
@@ -28,411 +87,156 @@ logger = logging.getLogger(__name__)
 #     return issuers
 
 def issue_credential(credentialConfiguration: str, kvkNumber: str):
-    print(f"credentialConfiguration: {credentialConfiguration}")
+    """Create a credential offer for the KvK number; returns its credential_offer_uri."""
+    get_template(credentialConfiguration)  # Raises ValueError for unsupported configurations
+    offer_id, _ = offer_store.create(credentialConfiguration, kvkNumber)
+    credential_offer_url = f"{ISSUER_DOMAIN}/mini-suomi/credential_offer?id={offer_id}"
+
+    # Construct the credential offer URI
+    credential_offer_uri = f"openid-credential-offer://?credential_offer_uri={requests.utils.quote(credential_offer_url)}"
+    return {"credential_offer_uri": credential_offer_uri}
+
+# Holder key bound into `cnf` when the request carries no proof
+DEFAULT_HOLDER_JWK = {
+    "kty": "EC",
+    "x": "rYmxB0Pftb6Vg2hqDw5bt9ZmunVU8cr5Q0YAKlkIXmQ",
+    "y": "QkAPrZ5JQUPBKnodOefFDJRYu54hk-6toTFngyEAEP8",
+    "crv": "P-256",
+    "kid": "authentication-key",
+    "alg": "ES256"
+}
+
+# Threads used to sign the credentials of one batch request
+ISSUANCE_SIGNING_THREADS = int(os.getenv("ISSUANCE_SIGNING_THREADS", "4"))
+
+# Conceal nested members and array elements of the claims a template marks as recursive
+# (set to false to disclose every top-level claim as a whole)
+RECURSIVE_DISCLOSURES = os.getenv("RECURSIVE_DISCLOSURES", "true").lower() == "true"
+
+
+def fetch_credential_source(credential_type: str, kvk_number: str) -> Dict[str, Any]:
+    """Fetch the KvK data a credential type is built from."""
+    return getattr(KVKBevoegdhedenAPI, get_template(credential_type).source)(kvk_number)
+
+
+def build_credential_claims(credential_type: str, source_data: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """Map KvK data onto the selectively disclosable claims of a credential type."""
+    return get_template(credential_type).build_claims(source_data, now)
+
+
+def recursive_claims(credential_type: str) -> FrozenSet[str]:
+    return get_template(credential_type).recursive_claims if RECURSIVE_DISCLOSURES else frozenset()
+
+
+def credential_headers(signing_key: SigningKey) -> Dict[str, Any]:
+    # JWT header with embedded JWK
+    return {
+        "alg": "ES256",
+        "typ": "vc+sd-jwt",
+        "kid": signing_key.kid,
+        "jwk": signing_key.public_jwk
+    }
+
+
+def credential_payload(
+    credential_type: str,
+    now: datetime,
+    holder_jwk: Optional[Dict[str, Any]] = None,
+    status: Optional[Tuple[int, int]] = None
+) -> Dict[str, Any]:
+    """JWT payload of a credential; `_sd` is filled in by build_sd_jwt."""
+    payload = {
+        "iat": int(now.timestamp()),
+        "nbf": int(now.timestamp()) - 2963,
+        "vct": get_template(credential_type).vct,
+        "iss": CREDENTIAL_ISSUER,
+        "_sd": [],
+        "_sd_alg": "sha-256",
+        "cnf": {
+            "jwk": holder_jwk or DEFAULT_HOLDER_JWK
+        },
+        "termsOfUse": []
+    }
+    if status is not None:
+        # Token Status List reference (list id, index)
+        payload["status"] = {"status_list": {"idx": status[1], "uri": status_list_uri(status[0])}}
+    return payload
+
+
+def generate_credential_jwt(
+    credential_type: str,
+    kvk_number: str,
+    holder_jwk: Optional[Dict[str, Any]] = None,
+    trace: Optional[IssuanceTrace] = None
+) -> str:
+    return generate_credential_jwts([(credential_type, kvk_number, holder_jwk)], trace)[0]
+
+
+def generate_credential_jwts(
+    credential_requests: List[Tuple[str, str, Optional[Dict[str, Any]]]],
+    trace: Optional[IssuanceTrace] = None
+) -> List[str]:
+    """
+    Issue several credentials at once, given (credential_type, kvk_number, holder_jwk)
+    tuples. KvK data is fetched and mapped once per (type, KvK number). Disclosures
+    and signatures are created by the signing worker processes when SIGNING_WORKERS
+    is set, otherwise on a thread pool.
+    """
     try:
-        # Get LPID or company data based on credential configuration
         now = datetime.utcnow()
-        one_year_from_now = now + timedelta(days=365)
-        
-        if credentialConfiguration == "LPIDSdJwt":
-            # lpid_data = KVKBevoegdhedenAPI.get_lpid(kvkNumber)
-            # payload = {
-            #     "legal_person_id": lpid_data["data"]["id"],
-            #     "legal_person_name": lpid_data["data"]["legal_person_name"],
-            #     "issuer_id": lpid_data["metadata"]["issuer_id"],
-            #     "issuer_name": lpid_data["metadata"]["issuing_authority_name"],
-            #     "issuer_country": lpid_data["metadata"]["issuing_country"],
-            #     "issuance_date": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-            #     "expiry_date": one_year_from_now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-            #     "credential_status": "active",
-            #     "authentic_source_id": lpid_data["metadata"]["issuer_id"],
-            #     "authentic_source_name": "Kamer van Koophandel"
-            # }
-            offer_id = "mockOfferId123"  # Generate a unique ID if necessary
-            credential_offer_url = f"{ISSUER_DOMAIN}/mini-suomi/credential_offer?id={offer_id}"
-
-            # Construct the credential offer URI
-            credential_offer_uri = f"openid-credential-offer://?credential_offer_uri={requests.utils.quote(credential_offer_url)}"
-
-            # Return the credential offer URI
-            return {"credential_offer_uri": credential_offer_uri}
-        
-        elif credentialConfiguration == "EUCCSdJwt":
-            # company_data = KVKBevoegdhedenAPI.get_company_certificate(kvkNumber)
-            # legal_representatives = [
-            #     {
-            #         "role": "J",
-            #         "legalEntityId": company_data["data"]["registration_number"],
-            #         "scopeOfRepresentation": "Jointly",
-            #         "family_name": person["full_name"].split()[-1],
-            #         "given_name": " ".join(person["full_name"].split()[:-1]),
-            #         "birth_date": datetime.strptime(person["date_of_birth"], "%d-%m-%Y").strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-            #     }
-            #     for person in company_data["data"]["authorized_persons"]
-            # ]
-            # address_parts = company_data["data"]["postal_address"].split()
-            # postal_code = next((part for part in address_parts if len(part) == 6 and part[:4].isdigit()), "")
-            
-            # payload = {
-            #     "legalName": company_data["data"]["legal_person_name"],
-            #     "legalFormType": company_data["data"]["legal_form"],
-            #     "legalIdentifier": company_data["data"]["id"],
-            #     "registeredAddress": {
-            #         "post_code": postal_code,
-            #         "post_name": address_parts[-1] if address_parts else "",
-            #         "thoroughfare": " ".join(address_parts[:-1]) if address_parts else ""
-            #     },
-            #     "postalAddress": {
-            #         "post_code": postal_code,
-            #         "post_name": address_parts[-1] if address_parts else "",
-            #         "thoroughfare": " ".join(address_parts[:-1]) if address_parts else ""
-            #     },
-            #     "registrationDate": datetime.strptime(company_data["data"]["date_of_registration"], "%d-%m-%Y").strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-            #     "legalEntityStatus": "active",
-            #     "legalRepresentative": legal_representatives,
-            #     "legalEntityActivity": [{"code": "", "businessDescription": ""}],
-            #     "contactPoint": {
-            #         "contactPage": "",
-            #         "hasEmail": company_data["data"]["electronic_address"],
-            #         "hasTelephone": ""
-            #     },
-            #     "issuer_id": company_data["metadata"]["issuer_id"],
-            #     "issuer_name": company_data["metadata"]["issuing_authority_name"],
-            #     "issuer_country": company_data["metadata"]["issuing_country"],
-            #     "issuance_date": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-            #     "expiry_date": one_year_from_now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-            #     "authentic_source_id": company_data["metadata"]["issuer_id"],
-            #     "authentic_source_name": "Kamer van Koophandel"
-            # }
-                    # Construct the credential offer URL (this can point to an internal or mock endpoint)
-            offer_id = "mockOfferId124"  # Generate a unique ID if necessary
-            credential_offer_url = f"{ISSUER_DOMAIN}/mini-suomi/credential_offer?id={offer_id}"
-
-            # Construct the credential offer URI
-            credential_offer_uri = f"openid-credential-offer://?credential_offer_uri={requests.utils.quote(credential_offer_url)}"
-
-            # Return the credential offer URI
-            return {"credential_offer_uri": credential_offer_uri}
-        else:
-            raise ValueError(f"Unsupported credential configuration: {credentialConfiguration}")
-
-
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request error: {str(e)}")
-        raise Exception(f"Request failed: {str(e)}")
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        raise
 
-def generate_credential_jwt(credential_type: str, kvk_number: str) -> str:
-    try:
-        now = datetime.utcnow()
-        one_year_from_now = now + timedelta(days=365)
-
-        if credential_type == "LPIDSdJwt":
-            lpid_data = KVKBevoegdhedenAPI.get_lpid(kvk_number)
-            
-            # Create disclosure objects with salt
-            disclosures = []
-            sd_hashes = []
-            
-            claims = {
-                "legal_person_id": lpid_data["data"]["id"],
-                "legal_person_name": lpid_data["data"]["legal_person_name"],
-                "issuer_id": lpid_data["metadata"]["issuer_id"],
-                "issuer_name": lpid_data["metadata"]["issuing_authority_name"],
-                "issuer_country": lpid_data["metadata"]["issuing_country"],
-                "issuance_date": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                "expiry_date": one_year_from_now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                "credential_status": "active",
-                "authentic_source_id": lpid_data["metadata"]["issuer_id"],
-                "authentic_source_name": "Kamer van Koophandel",
-                # "authentic_source_name2": "Kamer van Koophandel",
-            }
-
-            # Generate salted disclosures for each claim
-            for key, value in claims.items():
-                # Log each claim being processed
-                logging.info(f"Processing claim: {key} with value: {value}")
-                
-                # Generate random salt
-                salt = base64.urlsafe_b64encode(os.urandom(16)).decode('utf-8').rstrip('=')
-                
-                # Create disclosure array [salt, key, value]
-                disclosure = [salt, key, value]
-                
-                # Convert to JSON and then base64url encode
-                disclosure_json = json.dumps(disclosure, separators=(',', ':'))
-                disclosure_b64 = base64.urlsafe_b64encode(
-                    disclosure_json.encode('utf-8')
-                ).decode('utf-8').rstrip('=')
-                
-                # Log the disclosure details
-                logging.info(f"Generated disclosure for {key}:")
-                logging.info(f"  Raw disclosure: {disclosure}")
-                logging.info(f"  Encoded disclosure: {disclosure_b64}")
-                
-                # Add encoded disclosure to list
-                disclosures.append(disclosure_b64)
-                
-                # Generate hash for _sd array
-                hash_obj = hashlib.sha256(disclosure_json.encode('utf-8'))
-                sd_hash = base64.urlsafe_b64encode(hash_obj.digest()).decode('utf-8').rstrip('=')
-                sd_hashes.append(sd_hash)
-                
-                # Log the hash
-                logging.info(f"  Generated hash: {sd_hash}")
-
-            # Log final arrays
-            logging.info("=== Final Arrays ===")
-            logging.info(f"Number of claims: {len(claims)}")
-            logging.info(f"Number of disclosures: {len(disclosures)}")
-            logging.info(f"Number of hashes: {len(sd_hashes)}")
-            logging.info(f"All claims keys: {list(claims.keys())}")
-            logging.info(f"All disclosure decoded: {[json.loads(base64.urlsafe_b64decode(d + '==').decode('utf-8')) for d in disclosures]}")
-
-            # JWT header with embedded JWK
-            headers = {
-                "alg": "ES256",
-                "typ": "vc+sd-jwt",
-                "kid": "authentication-key",
-                "jwk": {
-                    "kty": "EC",
-                    "crv": "P-256",
-                    "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-                    "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-                    "alg": "ES256",
-                    "kid": "authentication-key"
-                    # "use": "sig"
-                }
-            }
-
-            # JWT payload
-            jwt_payload = {
-                "iat": int(now.timestamp()),
-                "nbf": int(now.timestamp()) - 2963,
-                "vct": "LPID",
-                "iss": "https://kvk-issuance-service.nieuwlaar.com/mini-suomi/issuers/kvk",
-                "_sd": sd_hashes,
-                "_sd_alg": "sha-256",
-                "cnf": {
-                    "jwk": {
-                        "kty": "EC",
-                        "x": "rYmxB0Pftb6Vg2hqDw5bt9ZmunVU8cr5Q0YAKlkIXmQ",
-                        "y": "QkAPrZ5JQUPBKnodOefFDJRYu54hk-6toTFngyEAEP8",
-                        "crv": "P-256",
-                        "kid": "authentication-key",
-                        "alg": "ES256"
-                    }
-                },
-                "termsOfUse": []
-            }
-
-            # Hardcoded private key for signing
-            private_key = {
-                "kty": "EC",
-                "crv": "P-256",
-                "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-                "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-                "alg": "ES256",
-                "kid": "authentication-key",
-                "d": "kAP-MAxRTy4F77xl-9unD-9IWfneEMC7j6E4WdSEdxI"
-                # "use": "sig"
-            }
-
-            # Generate the JWT
-            credential_jwt = jwt.encode(
-                claims=jwt_payload,
-                key=private_key,
-                algorithm="ES256",
-                headers=headers
-            )
-
-            # Combine JWT and base64url-encoded disclosures
-            combined_token = credential_jwt + "~" + "~".join(disclosures) + "~"
-
-            logging.info("=== SD-JWT Generation Details ===")
-            logging.info(f"Headers: {headers}")
-            logging.info(f"Payload: {jwt_payload}")
-            logging.info(f"Disclosures (decoded): {[json.loads(base64.urlsafe_b64decode(d + '==').decode('utf-8')) for d in disclosures]}")
-            logging.info(f"Final SD-JWT: {combined_token}")
-            
-            # Add this debug logging
-            logging.info("=== SD-JWT Debug Information ===")
-            logging.info(f"JWT part length: {len(credential_jwt)}")
-            logging.info(f"Number of disclosures: {len(disclosures)}")
-            logging.info("Individual disclosures:")
-            for i, disc in enumerate(disclosures):
-                # Decode and print each disclosure
-                padded = disc + "=" * (-len(disc) % 4)
-                decoded = json.loads(base64.urlsafe_b64decode(padded))
-                logging.info(f"Disclosure {i+1}: {decoded}")
-            logging.info(f"Final token parts: {len(combined_token.split('~'))}")
-            logging.info("=== End Debug Information ===")
-            
-            return combined_token
-
-        elif credential_type == "EUCCSdJwt":
-            company_data = KVKBevoegdhedenAPI.get_company_certificate(kvk_number)
-            
-            # Create disclosure objects with salt
-            disclosures = []
-            sd_hashes = []
-            
-            # Prepare legal representatives data
-            legal_representatives = [
-                {
-                    "role": "J",
-                    "legalEntityId": company_data["data"]["registration_number"],
-                    "scopeOfRepresentation": "Jointly",
-                    "family_name": person["full_name"].split()[-1],
-                    "given_name": " ".join(person["full_name"].split()[:-1]),
-                    "birth_date": datetime.strptime(person["date_of_birth"], "%d-%m-%Y").strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-                }
-                for person in company_data["data"]["authorized_persons"]
+        # Shared upstream fetch and claim mapping
+        claims_by_source = {}
+        for credential_type, kvk_number, _ in credential_requests:
+            source_key = (credential_type, kvk_number)
+            if source_key not in claims_by_source:
+                source_data = fetch_credential_source(credential_type, kvk_number)
+                claims_by_source[source_key] = build_credential_claims(credential_type, source_data, now)
+        if trace is not None:
+            trace.record("fetched_sources", sources=[list(source_key) for source_key in claims_by_source])
+
+        # The request path only assembles header, payload and claims
+        signing_key = issuer_key_manager.active_key
+        headers = credential_headers(signing_key)
+        statuses = status_list_service.allocate(len(credential_requests))
+        try:
+            signing_tasks = [
+                (
+                    signing_key.kid,
+                    headers,
+                    credential_payload(credential_type, now, holder_jwk, status),
+                    claims_by_source[(credential_type, kvk_number)],
+                    recursive_claims(credential_type)
+                )
+                for (credential_type, kvk_number, holder_jwk), status in zip(credential_requests, statuses)
             ]
 
-            # Parse address
-            address_parts = company_data["data"]["postal_address"].split()
-            postal_code = next((part for part in address_parts if len(part) == 6 and part[:4].isdigit()), "")
-            post_name = address_parts[-1] if address_parts else ""
-            thoroughfare = " ".join(address_parts[:-1]) if address_parts else ""
-
-            # Prepare claims
-            claims = {
-                "legalName": company_data["data"]["legal_person_name"],
-                "legalFormType": company_data["data"]["legal_form"],
-                "legalIdentifier": company_data["data"]["id"],
-                "registeredAddress": {
-                    "post_code": postal_code,
-                    "post_name": post_name,
-                    "thoroughfare": thoroughfare
-                },
-                "postalAddress": {
-                    "post_code": postal_code,
-                    "post_name": post_name,
-                    "thoroughfare": thoroughfare
-                },
-                "registrationDate": datetime.strptime(company_data["data"]["date_of_registration"], "%d-%m-%Y").strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                "shareCapital": None,
-                "legalEntityStatus": "active",
-                "legalRepresentative": legal_representatives,
-                "legalEntityActivity": [{"code": "", "businessDescription": ""}],
-                "contactPoint": {
-                    "contactPage": "",
-                    "hasEmail": company_data["data"]["electronic_address"],
-                    "hasTelephone": ""
-                },
-                "issuer_id": company_data["metadata"]["issuer_id"],
-                "issuer_name": company_data["metadata"]["issuing_authority_name"],
-                "issuer_country": company_data["metadata"]["issuing_country"],
-                "issuance_date": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                "expiry_date": one_year_from_now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-                "authentic_source_id": company_data["metadata"]["issuer_id"],
-                "authentic_source_name": "Kamer van Koophandel",
-                # "authentic_source_name2": "Kamer van Koophandel",
-            }
-
-            # Generate salted disclosures for each claim
-            for key, value in claims.items():
-                # Generate random salt
-                salt = base64.urlsafe_b64encode(os.urandom(16)).decode('utf-8').rstrip('=')
-                
-                # Create disclosure array [salt, key, value]
-                disclosure = [salt, key, value]
-                
-                # Convert to JSON and then base64url encode
-                disclosure_json = json.dumps(disclosure, separators=(',', ':'))
-                disclosure_b64 = base64.urlsafe_b64encode(
-                    disclosure_json.encode('utf-8')
-                ).decode('utf-8').rstrip('=')
-                
-                # Add encoded disclosure to list
-                disclosures.append(disclosure_b64)
-                
-                # Generate hash for _sd array
-                hash_obj = hashlib.sha256(disclosure_json.encode('utf-8'))
-                sd_hash = base64.urlsafe_b64encode(hash_obj.digest()).decode('utf-8').rstrip('=')
-                sd_hashes.append(sd_hash)
-
-            # JWT header with embedded JWK
-            headers = {
-                "alg": "ES256",
-                "typ": "vc+sd-jwt",
-                "kid": "authentication-key",
-                "jwk": {
-                    "kty": "EC",
-                    "crv": "P-256",
-                    "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-                    "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-                    "alg": "ES256",
-                    "kid": "authentication-key"
-                    # "use": "sig"
+            # Disclosures (fresh salts for every credential) and signatures
+            if signing_service is not None:
+                credential_jwts = signing_service.sign_many(signing_tasks)
+            elif len(signing_tasks) == 1 or ISSUANCE_SIGNING_THREADS <= 1:
+                credential_jwts = [build_sd_jwt(signing_key.jose_key, *task[1:]) for task in signing_tasks]
+            else:
+                with ThreadPoolExecutor(max_workers=min(ISSUANCE_SIGNING_THREADS, len(signing_tasks))) as executor:
+                    credential_jwts = list(executor.map(lambda task: build_sd_jwt(signing_key.jose_key, *task[1:]), signing_tasks))
+        except Exception:
+            # No credential carrying these indexes was handed out
+            status_list_service.release(statuses)
+            raise
+        if trace is not None:
+            trace.record("signed_credentials", kid=signing_key.kid, credentials=[
+                {
+                    "credential_type": credential_type,
+                    "holder_jwk": redact_jwk(holder_jwk),
+                    "jwt": redact_jwt(credential_jwt.split("~", 1)[0]),
+                    "disclosures": [decode_disclosure(disclosure) for disclosure in credential_jwt.split("~")[1:-1]]
                 }
-            }
-
-            # JWT payload
-            jwt_payload = {
-                "iat": int(now.timestamp()),
-                "nbf": int(now.timestamp()) - 2963,
-                "vct": "EUCC",  # Changed to EUCC for this credential type
-                "iss": "https://kvk-issuance-service.nieuwlaar.com/mini-suomi/issuers/kvk",
-                "_sd": sd_hashes,
-                "_sd_alg": "sha-256",
-                "cnf": {
-                    "jwk": {
-                        "kty": "EC",
-                        "x": "rYmxB0Pftb6Vg2hqDw5bt9ZmunVU8cr5Q0YAKlkIXmQ",
-                        "y": "QkAPrZ5JQUPBKnodOefFDJRYu54hk-6toTFngyEAEP8",
-                        "crv": "P-256",
-                        "kid": "authentication-key",
-                        "alg": "ES256"
-                    }
-                },
-                "termsOfUse": []
-            }
-
-            # Use the same private key and JWT generation as before
-            private_key = {
-                "kty": "EC",
-                "crv": "P-256",
-                "x": "viZw39H509xRvZcNHtGw8ixFeexaF4La1ZQLZUWTUUs",
-                "y": "ydN1o0LQAdPT1wv-0b4YBNsmQpcXzfmIKiUhhy42MXw",
-                "alg": "ES256",
-                "kid": "authentication-key",
-                "d": "kAP-MAxRTy4F77xl-9unD-9IWfneEMC7j6E4WdSEdxI"
-                # "use": "sig"
-            }
-
-            # Generate the JWT
-            credential_jwt = jwt.encode(
-                claims=jwt_payload,
-                key=private_key,
-                algorithm="ES256",
-                headers=headers
-            )
-
-            # Combine JWT and base64url-encoded disclosures
-            combined_token = credential_jwt + "~" + "~".join(disclosures) + "~"
-
-            # Add this debug logging
-            logging.info("=== SD-JWT Debug Information ===")
-            logging.info(f"JWT part length: {len(credential_jwt)}")
-            logging.info(f"Number of disclosures: {len(disclosures)}")
-            logging.info("Individual disclosures:")
-            for i, disc in enumerate(disclosures):
-                # Decode and print each disclosure
-                padded = disc + "=" * (-len(disc) % 4)
-                decoded = json.loads(base64.urlsafe_b64decode(padded))
-                logging.info(f"Disclosure {i+1}: {decoded}")
-            logging.info(f"Final token parts: {len(combined_token.split('~'))}")
-            logging.info("=== End Debug Information ===")
-            
-            return combined_token
+                for (credential_type, _, holder_jwk), credential_jwt in zip(credential_requests, credential_jwts)
+            ])
+        return credential_jwts
 
     except Exception as e:
-        logging.error(f"Error generating credential JWT: {str(e)}")
+        logging.error(f"Error generating credential JWTs: {str(e)}")
         raise
 
 
@@ -0,0 +1,267 @@
+"""
+c_nonce values for the mini-suomi credential endpoints and a replay cache for
+the proof JWTs that use them.
+
+The token and credential endpoints mint a c_nonce bound to the access token. A
+proof must carry a nonce minted for the access token it is sent with, and each
+proof (its `jti`, or its digest when it has none) is accepted only once per
+nonce. Used proofs are kept exactly as long as their nonce.
+
+Expiry runs on a hierarchical timing wheel: scheduling is O(1) and every key
+is touched a bounded number of times (once per wheel level) before it expires,
+so there is no scan of the live set. Memory is bounded by NONCE_MAX_ENTRIES
+(nonces plus used proofs); when full, the entries closest to expiry are
+dropped early. Dropping a used proof also drops its nonce, so early eviction
+can only reject a proof, never accept a replay.
+
+With NONCE_DB_PATH set, nonces and used proofs are also written to SQLite so
+worker processes sharing the file accept each other's nonces and detect replays
+across processes (a used proof is a primary key conflict). The connection is
+only used with the lock held, and `issue` and `use` then block on SQLite: async
+handlers call them in the threadpool.
+"""
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NONCE_DB_PATH = os.getenv("NONCE_DB_PATH")
+C_NONCE_TTL_SECONDS = int(os.getenv("C_NONCE_TTL_SECONDS", "300"))
+# Upper bound on nonces plus used proofs kept in memory
+NONCE_MAX_ENTRIES = int(os.getenv("NONCE_MAX_ENTRIES", "200000"))
+
+
+class NonceError(Exception):
+    """A proof was rejected; `error` is the OpenID4VCI error code."""
+
+    def __init__(self, error: str, message: str):
+        super().__init__(message)
+        self.error = error
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel of `levels` wheels with `slots` slots each.
+
+    Level 0 slots span one tick, level 1 slots span `slots` ticks, and so on.
+    A key is placed on the lowest level whose range covers its expiry and is
+    moved down a level ("cascaded") when the slot it sits in comes up.
+
+    A cascade re-places a whole slot at once, so level 0 should cover the usual
+    lifetime: with 512 one-second slots, nonces never cascade.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 512, levels: int = 2, now: Optional[float] = None):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self.levels = levels
+        self._wheels: List[List[List[Tuple[int, Any]]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._tick = int((time.time() if now is None else now) / tick_seconds)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, key: Any, expires_at: float) -> None:
+        self._place(max(int(expires_at / self.tick_seconds), self._tick + 1), key)
+        self._count += 1
+
+    def _place(self, expiry_tick: int, key: Any) -> None:
+        delta = expiry_tick - self._tick
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.slots or level == self.levels - 1:
+                # Beyond the top level's range the key sits in its farthest slot and cascades again later
+                slot_tick = min(expiry_tick, self._tick + span * (self.slots - 1))
+                self._wheels[level][(slot_tick // span) % self.slots].append((expiry_tick, key))
+                return
+            span *= self.slots
+
+    def advance(self, now: float) -> List[Any]:
+        """Move the wheel to `now`; returns the keys that expired."""
+        target = int(now / self.tick_seconds)
+        expired: List[Any] = []
+        if target - self._tick > self.slots ** self.levels:
+            # Idle for longer than the wheel covers: re-place everything at once
+            entries = [entry for wheel in self._wheels for slot in wheel for entry in slot]
+            self._wheels = [[[] for _ in range(self.slots)] for _ in range(self.levels)]
+            self._tick = target
+            for expiry_tick, key in entries:
+                if expiry_tick <= target:
+                    expired.append(key)
+                else:
+                    self._place(expiry_tick, key)
+            self._count -= len(expired)
+            return expired
+        while self._tick < target:
+            self._tick += 1
+            # Cascade from the highest level whose slot boundary was crossed
+            span = self.slots ** (self.levels - 1)
+            for level in range(self.levels - 1, 0, -1):
+                if self._tick % span == 0:
+                    self._cascade(level, (self._tick // span) % self.slots)
+                span //= self.slots
+            slot = self._wheels[0][self._tick % self.slots]
+            if slot:
+                self._wheels[0][self._tick % self.slots] = []
+                expired.extend(key for _, key in slot)
+        self._count -= len(expired)
+        return expired
+
+    def _cascade(self, level: int, index: int) -> None:
+        entries = self._wheels[level][index]
+        self._wheels[level][index] = []
+        for expiry_tick, key in entries:
+            self._place(expiry_tick, key)
+
+    def pop_earliest(self) -> List[Any]:
+        """Remove the keys of the next non-empty slot (the ones expiring soonest)."""
+        span = 1
+        for level in range(self.levels):
+            # The current slot comes last: it holds keys a full turn ahead
+            start = (self._tick // span) % self.slots
+            for offset in range(1, self.slots + 1):
+                index = (start + offset) % self.slots
+                entries = self._wheels[level][index]
+                if entries:
+                    self._wheels[level][index] = []
+                    self._count -= len(entries)
+                    return [key for _, key in entries]
+            span *= self.slots
+        return []
+
+
+class NonceStore:
+    def __init__(
+        self,
+        db_path: Optional[str] = NONCE_DB_PATH,
+        ttl_seconds: int = C_NONCE_TTL_SECONDS,
+        max_entries: int = NONCE_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # nonce -> (access token digest, expires_at)
+        self._nonces: Dict[str, Tuple[bytes, int]] = {}
+        # (nonce, proof id) -> expires_at
+        self._used: Dict[Tuple[str, str], int] = {}
+        self._wheel = TimingWheel()
+        self.evictions = 0
+        self.replays = 0
+        self._next_purge = 0.0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS c_nonces ("
+                "nonce TEXT PRIMARY KEY, token_hash BLOB NOT NULL, expires_at INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS used_proofs ("
+                "nonce TEXT NOT NULL, proof_id TEXT NOT NULL, expires_at INTEGER NOT NULL, "
+                "PRIMARY KEY (nonce, proof_id)) WITHOUT ROWID"
+            )
+
+    @staticmethod
+    def _token_hash(access_token: str) -> bytes:
+        return hashlib.sha256(access_token.encode()).digest()
+
+    # --- Public API ---
+    def issue(self, access_token: str) -> Tuple[str, int]:
+        """Mint a c_nonce for the access token; returns (c_nonce, c_nonce_expires_in)."""
+        nonce = secrets.token_urlsafe(24)
+        expires_at = int(time.time()) + self.ttl_seconds
+        token_hash = self._token_hash(access_token)
+        with self._lock:
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO c_nonces (nonce, token_hash, expires_at) VALUES (?, ?, ?)",
+                    (nonce, token_hash, expires_at),
+                )
+            self._advance(time.time())
+            self._add(nonce, (token_hash, expires_at), expires_at)
+        return nonce, self.ttl_seconds
+
+    def use(self, access_token: str, nonce: Optional[str], proof_id: str) -> None:
+        """Accept a proof carrying `nonce` once; raises NonceError otherwise."""
+        if not nonce:
+            raise NonceError("invalid_nonce", "Proof has no nonce")
+        now = time.time()
+        token_hash = self._token_hash(access_token)
+        with self._lock:
+            self._advance(now)
+            entry = self._nonces.get(nonce)
+            if entry is None and self._db is not None:
+                # Minted by another process
+                row = self._db.execute("SELECT token_hash, expires_at FROM c_nonces WHERE nonce = ?", (nonce,)).fetchone()
+                if row is not None:
+                    entry = (bytes(row[0]), row[1])
+        if entry is None or entry[1] <= now or entry[0] != token_hash:
+            raise NonceError("invalid_nonce", "Unknown or expired c_nonce")
+
+        with self._lock:
+            if (nonce, proof_id) in self._used:
+                self.replays += 1
+                raise NonceError("invalid_proof", "Proof was already used")
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT INTO used_proofs (nonce, proof_id, expires_at) VALUES (?, ?, ?)",
+                        (nonce, proof_id, entry[1]),
+                    )
+                except sqlite3.IntegrityError:
+                    self.replays += 1
+                    raise NonceError("invalid_proof", "Proof was already used")
+            if nonce not in self._nonces:
+                self._add(nonce, entry, entry[1])
+            self._add((nonce, proof_id), entry[1], entry[1])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "nonces": len(self._nonces),
+            "used_proofs": len(self._used),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "replays": self.replays,
+        }
+
+    # --- Internals (called with the lock held) ---
+    def _add(self, key: Any, value: Any, expires_at: int) -> None:
+        while len(self._nonces) + len(self._used) >= self.max_entries and len(self._wheel):
+            for evicted in self._wheel.pop_earliest():
+                self._remove(evicted)
+                self.evictions += 1
+        if isinstance(key, tuple):
+            self._used[key] = value
+        else:
+            self._nonces[key] = value
+        self._wheel.schedule(key, expires_at)
+
+    def _remove(self, key: Any) -> None:
+        if isinstance(key, tuple):
+            self._used.pop(key, None)
+            # Without its used-proof record the nonce could be replayed: drop it as well
+            self._nonces.pop(key[0], None)
+        else:
+            self._nonces.pop(key, None)
+
+    def _advance(self, now: float) -> None:
+        for key in self._wheel.advance(now):
+            self._remove(key)
+        if self._db is not None and now >= self._next_purge:
+            self._next_purge = now + self.ttl_seconds
+            try:
+                self._db.execute("DELETE FROM c_nonces WHERE expires_at <= ?", (int(now),))
+                self._db.execute("DELETE FROM used_proofs WHERE expires_at <= ?", (int(now),))
+            except sqlite3.Error as e:
+                logger.error(f"Error purging expired nonces: {str(e)}")
+
+
+nonce_store = NonceStore()
@@ -0,0 +1,235 @@
+"""
+Credential offers and the pre-authorized code flow for the mini-suomi issuer.
+
+An offer binds a credential configuration and a KvK number to a random offer
+id (public, in the credential_offer_uri) and a pre-authorized code. Redeeming
+the code at the token endpoint is single use and yields an access token bound
+to the same configuration and KvK number, which the credential endpoints use.
+
+Outstanding offers and access tokens live in hash indexes, so every lookup is
+a dict access however many offers are outstanding. They expire after
+OFFER_TTL_SECONDS / ACCESS_TOKEN_TTL_SECONDS: entries sit in time buckets and
+whole buckets are dropped once expired, as in the revocation store.
+
+With OFFER_DB_PATH set (the default), offers are also stored in SQLite and the
+database decides whether an offer is outstanding: another process may have
+created or redeemed it. Redemption is an atomic conditional UPDATE, so a code
+can be redeemed only once across processes. Access tokens are stored as SHA-256
+digests and, as they are never revoked, are served from the local index once
+seen. The connection is shared by threadpool threads and the event loop, so
+every use of it holds the store's lock.
+"""
+import hashlib
+import heapq
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# SQLite database shared by the worker processes ("" keeps offers in memory only)
+OFFER_DB_PATH = os.getenv("OFFER_DB_PATH", "credential-offers.sqlite3")
+# How long a credential offer and its pre-authorized code can be redeemed
+OFFER_TTL_SECONDS = int(os.getenv("OFFER_TTL_SECONDS", "600"))
+ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", "3600"))
+OFFER_BUCKET_SECONDS = int(os.getenv("OFFER_BUCKET_SECONDS", "60"))
+
+# Outstanding offer: (pre-authorized code, credential configuration, KvK number, expires_at)
+Offer = Tuple[str, str, str, int]
+# Access token grant: (credential configuration, KvK number, expires_at)
+Grant = Tuple[str, str, int]
+
+
+class OfferStore:
+    def __init__(
+        self,
+        db_path: Optional[str] = OFFER_DB_PATH,
+        offer_ttl_seconds: int = OFFER_TTL_SECONDS,
+        access_token_ttl_seconds: int = ACCESS_TOKEN_TTL_SECONDS,
+        bucket_seconds: int = OFFER_BUCKET_SECONDS,
+    ):
+        self.offer_ttl_seconds = offer_ttl_seconds
+        self.access_token_ttl_seconds = access_token_ttl_seconds
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._offers: Dict[str, Offer] = {}
+        # Pre-authorized code -> offer id
+        self._codes: Dict[str, str] = {}
+        # SHA-256 of the access token -> grant
+        self._grants: Dict[bytes, Grant] = {}
+        # Expiry bucket -> offer ids and access token digests to drop
+        self._buckets: Dict[int, List[Any]] = {}
+        self._bucket_heap: List[int] = []
+        self._next_purge = 0.0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS credential_offers ("
+                "offer_id TEXT PRIMARY KEY, code TEXT NOT NULL UNIQUE, configuration TEXT NOT NULL, "
+                "kvk_number TEXT NOT NULL, expires_at INTEGER NOT NULL, redeemed INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS access_tokens ("
+                "token_hash BLOB PRIMARY KEY, configuration TEXT NOT NULL, kvk_number TEXT NOT NULL, "
+                "expires_at INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS credential_offers_expires_at ON credential_offers (expires_at)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS access_tokens_expires_at ON access_tokens (expires_at)")
+
+    @staticmethod
+    def _token_hash(access_token: str) -> bytes:
+        return hashlib.sha256(access_token.encode()).digest()
+
+    # --- Public API ---
+    def create(self, credential_configuration: str, kvk_number: str) -> Tuple[str, str]:
+        """Mint an offer; returns (offer id, pre-authorized code)."""
+        offer_id = secrets.token_urlsafe(16)
+        code = secrets.token_urlsafe(32)
+        expires_at = int(time.time()) + self.offer_ttl_seconds
+        with self._lock:
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO credential_offers (offer_id, code, configuration, kvk_number, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (offer_id, code, credential_configuration, kvk_number, expires_at),
+                )
+            self._add_offer(offer_id, (code, credential_configuration, kvk_number, expires_at))
+        return offer_id, code
+
+    def get_offer(self, offer_id: str) -> Optional[Offer]:
+        """The offer while it is outstanding (not expired and not redeemed)."""
+        now = time.time()
+        self._maintain(now)
+        with self._lock:
+            offer = self._offers.get(offer_id)
+            if self._db is not None:
+                # Created, or already redeemed, by another process
+                row = self._db.execute(
+                    "SELECT code, configuration, kvk_number, expires_at FROM credential_offers "
+                    "WHERE offer_id = ? AND redeemed = 0",
+                    (offer_id,),
+                ).fetchone()
+                if row is None:
+                    if offer is not None:
+                        self._drop_offer(offer_id)
+                    return None
+                if offer is None:
+                    offer = tuple(row)
+                    self._add_offer(offer_id, offer)
+        if offer is None or offer[3] <= now:
+            return None
+        return offer
+
+    def redeem(self, code: str) -> Optional[Tuple[str, Grant]]:
+        """Exchange a pre-authorized code (once) for an access token and its grant."""
+        now = time.time()
+        self._maintain(now)
+        access_token = secrets.token_urlsafe(32)
+        token_hash = self._token_hash(access_token)
+        with self._lock:
+            offer_id = self._codes.get(code)
+            offer = self._drop_offer(offer_id) if offer_id is not None else None
+            if self._db is not None:
+                # The conditional update decides, also for offers redeemed by another process
+                row = self._db.execute(
+                    "UPDATE credential_offers SET redeemed = 1 WHERE code = ? AND redeemed = 0 AND expires_at > ? "
+                    "RETURNING configuration, kvk_number, expires_at",
+                    (code, int(now)),
+                ).fetchone()
+                offer = (code, *row) if row is not None else None
+            if offer is None or offer[3] <= now:
+                return None
+
+            grant = (offer[1], offer[2], int(now) + self.access_token_ttl_seconds)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO access_tokens (token_hash, configuration, kvk_number, expires_at) VALUES (?, ?, ?, ?)",
+                    (token_hash, *grant),
+                )
+            self._grants[token_hash] = grant
+            self._add_to_bucket(grant[2], token_hash)
+        return access_token, grant
+
+    def get_grant(self, access_token: str) -> Optional[Grant]:
+        """The configuration and KvK number an unexpired access token was issued for."""
+        now = time.time()
+        self._maintain(now)
+        token_hash = self._token_hash(access_token)
+        with self._lock:
+            grant = self._grants.get(token_hash)
+            if grant is None and self._db is not None:
+                # Issued by another process (blocking I/O: call from a worker thread)
+                row = self._db.execute(
+                    "SELECT configuration, kvk_number, expires_at FROM access_tokens WHERE token_hash = ?",
+                    (token_hash,),
+                ).fetchone()
+                if row is not None and row[2] > now:
+                    grant = tuple(row)
+                    self._grants[token_hash] = grant
+                    self._add_to_bucket(grant[2], token_hash)
+        if grant is None or grant[2] <= now:
+            return None
+        return grant
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "offers": len(self._offers),
+            "access_tokens": len(self._grants),
+            "buckets": len(self._buckets),
+        }
+
+    # --- Internals ---
+    def _add_offer(self, offer_id: str, offer: Offer) -> None:
+        # Called with the lock held
+        self._offers[offer_id] = offer
+        self._codes[offer[0]] = offer_id
+        self._add_to_bucket(offer[3], offer_id)
+
+    def _drop_offer(self, offer_id: str) -> Optional[Offer]:
+        # Called with the lock held; the bucket entry is skipped when it expires
+        offer = self._offers.pop(offer_id, None)
+        if offer is not None:
+            self._codes.pop(offer[0], None)
+        return offer
+
+    def _add_to_bucket(self, expires_at: int, key: Any) -> None:
+        # Called with the lock held
+        bucket = expires_at // self.bucket_seconds
+        if bucket not in self._buckets:
+            self._buckets[bucket] = []
+            heapq.heappush(self._bucket_heap, bucket)
+        self._buckets[bucket].append(key)
+
+    def _maintain(self, now: float) -> None:
+        if now < self._next_purge:
+            return
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._purge_expired(now)
+            self._next_purge = (now // self.bucket_seconds + 1) * self.bucket_seconds
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM credential_offers WHERE expires_at <= ?", (int(now),))
+                    self._db.execute("DELETE FROM access_tokens WHERE expires_at <= ?", (int(now),))
+                except sqlite3.Error as e:
+                    logger.error(f"Error purging expired credential offers: {str(e)}")
+
+    def _purge_expired(self, now: float) -> None:
+        # Called with the lock held; a bucket is fully expired once its end lies in the past
+        current_bucket = int(now // self.bucket_seconds)
+        while self._bucket_heap and self._bucket_heap[0] < current_bucket:
+            for key in self._buckets.pop(heapq.heappop(self._bucket_heap), ()):
+                if isinstance(key, bytes):
+                    self._grants.pop(key, None)
+                else:
+                    self._drop_offer(key)
+
+
+offer_store = OfferStore()
@@ -0,0 +1,128 @@
+"""
+Bounded store of the claims needed to re-mint full access tokens.
+
+Profiles are written when tokens are first generated after a PID authentication,
+so a refresh does not require a new browser login. Entries older than
+`max_age_seconds` are ignored and purged, and the least recently used entries
+are evicted above `max_entries`.
+
+Rows hold no personal data in the clear: they are keyed by an HMAC-SHA256 of the
+`create_user_id` hash under PROFILE_STORE_SALT, and the claims are encrypted
+with AES-GCM under a key derived from the same secret and the user id. The
+unsalted user id is a hash of name and birth date that could be recomputed from
+a guess, so neither the key nor the claims can be read from the database alone.
+
+By default profiles are kept in an in-memory database of the process (a refresh
+on another worker, or after a restart, gets a token with only `sub`). With
+PROFILE_STORE_PATH set, the file is shared by the workers and PROFILE_STORE_SALT
+is required. The database is opened on first use.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+logger = logging.getLogger(__name__)
+
+PROFILE_STORE_PATH = os.getenv("PROFILE_STORE_PATH")
+# Secret for row keys and claim encryption; required with PROFILE_STORE_PATH
+PROFILE_STORE_SALT = os.getenv("PROFILE_STORE_SALT")
+PROFILE_STORE_MAX_ENTRIES = int(os.getenv("PROFILE_STORE_MAX_ENTRIES", "100000"))
+
+NONCE_BYTES = 12
+
+
+class ProfileStore:
+    def __init__(
+        self,
+        db_path: Optional[str],
+        max_age_seconds: int,
+        max_entries: int = PROFILE_STORE_MAX_ENTRIES,
+        salt: Optional[str] = PROFILE_STORE_SALT,
+    ):
+        if db_path and not salt:
+            raise RuntimeError("PROFILE_STORE_PATH requires PROFILE_STORE_SALT")
+        self.db_path = db_path or ":memory:"
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        # An in-memory store only has to agree with itself
+        self._salt = salt.encode() if salt else secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes_since_trim = 0
+
+    def _digest(self, purpose: bytes, user_id: str) -> bytes:
+        return hmac.new(self._salt, purpose + b"\n" + user_id.encode(), hashlib.sha256).digest()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with the lock held
+        if self._db is None:
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                "profile_key BLOB PRIMARY KEY, claims BLOB NOT NULL, last_seen INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS profiles_last_seen ON profiles (last_seen)")
+            self._db = db
+        return self._db
+
+    def put(self, user_id: str, given_name: str, family_name: str, birth_date: str) -> None:
+        nonce = secrets.token_bytes(NONCE_BYTES)
+        profile_key = self._digest(b"profile-key", user_id)
+        claims = json.dumps({"given_name": given_name, "family_name": family_name, "birth_date": birth_date}).encode()
+        sealed = AESGCM(self._digest(b"claims-key", user_id)).encrypt(nonce, claims, profile_key)
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO profiles (profile_key, claims, last_seen) VALUES (?, ?, ?)",
+                (profile_key, nonce + sealed, int(time.time())),
+            )
+            self._writes_since_trim += 1
+            # Trimming needs a count; amortise it over a batch of writes
+            if self._writes_since_trim >= max(1, self.max_entries // 100):
+                self._trim()
+
+    def get(self, user_id: str) -> Optional[Dict[str, str]]:
+        """Return the stored claims and mark the profile as recently used."""
+        now = int(time.time())
+        profile_key = self._digest(b"profile-key", user_id)
+        with self._lock:
+            db = self._connection()
+            row = db.execute("SELECT claims, last_seen FROM profiles WHERE profile_key = ?", (profile_key,)).fetchone()
+            if row is None or row[1] < now - self.max_age_seconds:
+                return None
+            db.execute("UPDATE profiles SET last_seen = ? WHERE profile_key = ?", (now, profile_key))
+        sealed = bytes(row[0])
+        try:
+            claims = AESGCM(self._digest(b"claims-key", user_id)).decrypt(sealed[:NONCE_BYTES], sealed[NONCE_BYTES:], profile_key)
+        except InvalidTag:
+            logger.error("Stored user profile could not be decrypted (was PROFILE_STORE_SALT changed?)")
+            return None
+        return json.loads(claims)
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM profiles WHERE profile_key = ?", (self._digest(b"profile-key", user_id),))
+
+    def _trim(self) -> None:
+        self._writes_since_trim = 0
+        try:
+            self._db.execute("DELETE FROM profiles WHERE last_seen < ?", (int(time.time()) - self.max_age_seconds,))
+            excess = self._db.execute("SELECT COUNT(*) FROM profiles").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM profiles WHERE profile_key IN "
+                    "(SELECT profile_key FROM profiles ORDER BY last_seen LIMIT ?)",
+                    (excess,),
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error trimming user profile store: {str(e)}")
@@ -0,0 +1,145 @@
+"""
+Verification of OpenID4VCI `jwt` proofs of possession sent to the credential
+endpoints.
+
+A proof is a JWT (`typ: openid4vci-proof+jwt`) signed by the holder's key,
+which is carried as a public JWK in the header. Verifying it checks the
+algorithm, the signature, that `aud` is this credential issuer, that `iat` lies
+within PROOF_MAX_AGE_SECONDS (allowing PROOF_CLOCK_SKEW_SECONDS into the future)
+and that `nonce` is a current c_nonce for the access token, used once. The
+verified holder key is what the credential binds in `cnf`.
+
+Parsed holder keys are kept in an LRU keyed by JWK thumbprint, so wallets that
+come back and the proofs of a batch (often all signed by the same key) skip
+key construction.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from jose import jwt
+from jose.exceptions import JOSEError
+
+from app.services.key_manager import jwk_thumbprint, verification_key, verify_jwt
+from app.services.nonce_store import NonceError, NonceStore
+
+PROOF_MAX_AGE_SECONDS = int(os.getenv("PROOF_MAX_AGE_SECONDS", "300"))
+PROOF_CLOCK_SKEW_SECONDS = int(os.getenv("PROOF_CLOCK_SKEW_SECONDS", "60"))
+# Maximum number of parsed holder public keys kept in memory
+HOLDER_KEY_CACHE_MAX_ENTRIES = int(os.getenv("HOLDER_KEY_CACHE_MAX_ENTRIES", "4096"))
+PROOF_TYPE = "openid4vci-proof+jwt"
+SUPPORTED_PROOF_ALGORITHMS = ["ES256", "EdDSA"]
+PRIVATE_JWK_MEMBERS = ("d", "p", "q", "dp", "dq", "qi", "k")
+
+
+class ProofError(Exception):
+    """A proof was rejected; `error` is the OpenID4VCI error code."""
+
+    def __init__(self, error: str, message: str):
+        super().__init__(message)
+        self.error = error
+
+
+class HolderKeyCache:
+    """Bounded LRU cache from (JWK thumbprint, alg) to the parsed public key (see key_manager.verification_key)."""
+
+    def __init__(self, max_entries: int = HOLDER_KEY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, public_jwk: Dict[str, Any], algorithm: str) -> Any:
+        cache_key = (jwk_thumbprint(public_jwk), algorithm)
+        with self._lock:
+            key = self._entries.get(cache_key)
+            if key is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return key
+            self.misses += 1
+        key = verification_key(public_jwk, algorithm)
+        with self._lock:
+            self._entries[cache_key] = key
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return key
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+class ProofVerifier:
+    def __init__(
+        self,
+        audiences: Iterable[str],
+        nonce_store: NonceStore,
+        key_cache: Optional[HolderKeyCache] = None,
+        max_age_seconds: int = PROOF_MAX_AGE_SECONDS,
+        clock_skew_seconds: int = PROOF_CLOCK_SKEW_SECONDS,
+    ):
+        self.audiences = set(audiences)
+        self.nonce_store = nonce_store
+        self.key_cache = key_cache or HolderKeyCache()
+        self.max_age_seconds = max_age_seconds
+        self.clock_skew_seconds = clock_skew_seconds
+
+    def verify(self, proof_jwt: str, access_token: str) -> Dict[str, Any]:
+        """Verify a proof sent with `access_token`; returns the holder's public JWK."""
+        try:
+            header = jwt.get_unverified_header(proof_jwt)
+        except JOSEError:
+            raise ProofError("invalid_proof", "Malformed proof JWT")
+        if header.get("typ") != PROOF_TYPE:
+            raise ProofError("invalid_proof", f"Proof JWT must have typ {PROOF_TYPE}")
+        algorithm = header.get("alg")
+        if algorithm not in SUPPORTED_PROOF_ALGORITHMS:
+            raise ProofError("invalid_proof", f"Unsupported proof algorithm: {algorithm}")
+        holder_jwk = header.get("jwk")
+        if not isinstance(holder_jwk, dict):
+            raise ProofError("invalid_proof", "Proof JWT header has no jwk")
+        if any(member in holder_jwk for member in PRIVATE_JWK_MEMBERS):
+            raise ProofError("invalid_proof", "Proof JWT header jwk contains private key material")
+
+        try:
+            key = self.key_cache.get(holder_jwk, algorithm)
+            claims = verify_jwt(proof_jwt, key, algorithm)
+        except (JOSEError, KeyError, ValueError) as e:
+            raise ProofError("invalid_proof", f"Invalid proof signature: {str(e)}")
+
+        audience = claims.get("aud")
+        if not (self.audiences & set(audience if isinstance(audience, list) else [audience])):
+            raise ProofError("invalid_proof", "Proof JWT audience is not this credential issuer")
+        issued_at = claims.get("iat")
+        now = time.time()
+        if not isinstance(issued_at, (int, float)) \
+                or not now - self.max_age_seconds <= issued_at <= now + self.clock_skew_seconds:
+            raise ProofError("invalid_proof", "Proof JWT is not fresh")
+
+        # Proofs without a jti are identified by their digest
+        proof_id = claims.get("jti") or hashlib.sha256(proof_jwt.encode()).hexdigest()
+        try:
+            self.nonce_store.use(access_token, claims.get("nonce"), str(proof_id))
+        except NonceError as e:
+            raise ProofError(e.error, str(e))
+        return {name: value for name, value in holder_jwk.items() if name not in PRIVATE_JWK_MEMBERS}
+
+    def verify_many(self, proof_jwts: List[str], access_token: str) -> List[Dict[str, Any]]:
+        """Verify the proofs of one request; the first invalid proof rejects the request."""
+        return [self.verify(proof_jwt, access_token) for proof_jwt in proof_jwts]
@@ -0,0 +1,169 @@
+"""
+Revocation store for the rdw-niscy bearer tokens.
+
+Revocations are keyed by the token's `jti` and kept only until the token's own
+`exp`: entries sit in time buckets and whole buckets are dropped once they have
+expired. A Bloom filter answers the common "not revoked" case without touching
+the index. With REVOCATION_DB_PATH set, revocations are persisted in SQLite and
+every process picks up the others' revocations within REVOCATION_SYNC_INTERVAL
+seconds.
+"""
+import hashlib
+import heapq
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_DB_PATH = os.getenv("REVOCATION_DB_PATH")
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "1.0"))
+REVOCATION_BUCKET_SECONDS = int(os.getenv("REVOCATION_BUCKET_SECONDS", "60"))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys (double hashing on one blake2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    def __init__(
+        self,
+        db_path: Optional[str] = REVOCATION_DB_PATH,
+        bucket_seconds: int = REVOCATION_BUCKET_SECONDS,
+        bloom_capacity: int = REVOCATION_BLOOM_CAPACITY,
+        sync_interval: float = REVOCATION_SYNC_INTERVAL,
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.bloom_capacity = bloom_capacity
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._expiry: Dict[str, int] = {}
+        self._buckets: Dict[int, Set[str]] = {}
+        self._bucket_heap: List[int] = []
+        self._bloom = BloomFilter(bloom_capacity)
+        self._bloom_stale = 0
+        self._next_purge = 0.0
+        self._db: Optional[sqlite3.Connection] = None
+        self._synced_seq = 0
+        self._next_sync = 0.0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, jti TEXT NOT NULL, exp INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS revoked_tokens_exp ON revoked_tokens (exp)")
+
+    # --- Public API ---
+    def revoke(self, jti: str, exp: int) -> None:
+        """Revoke a token until its expiry time (unix seconds)."""
+        now = time.time()
+        if exp <= now:
+            return
+        with self._lock:
+            self._add_local(jti, int(exp))
+            if self._db is not None:
+                self._db.execute("INSERT INTO revoked_tokens (jti, exp) VALUES (?, ?)", (jti, int(exp)))
+
+    def is_revoked(self, jti: str) -> bool:
+        now = time.time()
+        if now >= self._next_sync or now >= self._next_purge:
+            with self._lock:
+                self._maintain(now)
+        # Fast path: a Bloom miss means the jti was never revoked
+        if jti not in self._bloom:
+            return False
+        exp = self._expiry.get(jti)
+        return exp is not None and exp > now
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    # --- Internals (called with the lock held) ---
+    def _add_local(self, jti: str, exp: int) -> None:
+        if self._expiry.get(jti, 0) >= exp:
+            return
+        self._expiry[jti] = exp
+        bucket = exp // self.bucket_seconds
+        if bucket not in self._buckets:
+            self._buckets[bucket] = set()
+            heapq.heappush(self._bucket_heap, bucket)
+        self._buckets[bucket].add(jti)
+        self._bloom.add(jti)
+        if len(self._expiry) > self.bloom_capacity:
+            # Keep the false-positive rate bounded as the live set grows
+            self.bloom_capacity *= 2
+            self._rebuild_bloom()
+
+    def _maintain(self, now: float) -> None:
+        if now >= self._next_sync and self._db is not None:
+            self._sync_from_db(now)
+            self._next_sync = now + self.sync_interval
+        if now >= self._next_purge:
+            self._purge_expired(now)
+            self._next_purge = (now // self.bucket_seconds + 1) * self.bucket_seconds
+
+    def _purge_expired(self, now: float) -> None:
+        current_bucket = int(now // self.bucket_seconds)
+        removed = 0
+        # A bucket is fully expired once every exp in it lies in the past
+        while self._bucket_heap and self._bucket_heap[0] < current_bucket:
+            bucket = heapq.heappop(self._bucket_heap)
+            for jti in self._buckets.pop(bucket, ()):
+                if self._expiry.get(jti, 0) // self.bucket_seconds == bucket:
+                    del self._expiry[jti]
+                    removed += 1
+        if removed:
+            self._bloom_stale += removed
+            if self._bloom_stale > len(self._expiry):
+                self._rebuild_bloom()
+            if self._db is not None:
+                self._db.execute("DELETE FROM revoked_tokens WHERE exp <= ?", (int(now),))
+
+    def _rebuild_bloom(self) -> None:
+        self._bloom = BloomFilter(self.bloom_capacity)
+        for jti in self._expiry:
+            self._bloom.add(jti)
+        self._bloom_stale = 0
+
+    def _sync_from_db(self, now: float) -> None:
+        try:
+            rows = self._db.execute(
+                "SELECT seq, jti, exp FROM revoked_tokens WHERE seq > ? ORDER BY seq",
+                (self._synced_seq,),
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error syncing revoked tokens: {str(e)}")
+            return
+        for seq, jti, exp in rows:
+            if exp > now:
+                self._add_local(jti, exp)
+            self._synced_seq = seq
+
+
+revocation_store = RevocationStore()
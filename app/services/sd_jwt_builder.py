@@ -0,0 +1,97 @@
+"""
+SD-JWT assembly: salted disclosures, their `_sd` digests and the signed JWT.
+
+Kept free of import side effects (no app, stores or KvK clients) because the
+signing worker processes import it (see app.services.signing_service).
+"""
+import base64
+import hashlib
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+from jose import jwt
+
+from app.services import json_codec
+
+SALT_BYTES = 16
+
+
+def generate_salts(count: int) -> List[str]:
+    """Draw the salts for `count` disclosures from a single os.urandom call."""
+    random_bytes = os.urandom(SALT_BYTES * count)
+    return [
+        base64.urlsafe_b64encode(random_bytes[i:i + SALT_BYTES]).decode('utf-8').rstrip('=')
+        for i in range(0, SALT_BYTES * count, SALT_BYTES)
+    ]
+
+
+def count_disclosures(value: Any) -> int:
+    """Number of disclosures needed to conceal every member and element of `value`."""
+    if isinstance(value, dict):
+        return sum(1 + count_disclosures(member) for member in value.values())
+    if isinstance(value, list):
+        return sum(1 + count_disclosures(element) for element in value)
+    return 0
+
+
+def create_disclosures(claims: Dict[str, Any], recursive_claims: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+    """
+    Create salted, base64url-encoded disclosures and the top-level `_sd` hashes.
+
+    Every claim is one disclosure. For claims in `recursive_claims` the value is
+    concealed recursively as well: object members go into a nested `_sd` and
+    array elements become `{"...": digest}` element disclosures, so a holder can
+    reveal e.g. a single legal representative. Salts for the whole credential
+    come from one os.urandom call.
+    """
+    recursive_claims = set(recursive_claims)
+    salts = iter(generate_salts(len(claims) + sum(
+        count_disclosures(value) for name, value in claims.items() if name in recursive_claims
+    )))
+    disclosures = []
+
+    def disclose(content: List[Any]) -> str:
+        # Disclosure array [salt, key, value] or, for array elements, [salt, value]
+        disclosure = [next(salts), *content]
+
+        # Convert to JSON and then base64url encode (stable encoder: the bytes are hashed)
+        disclosure_json = json_codec.dumps_stable(disclosure).encode('utf-8')
+        disclosures.append(base64.urlsafe_b64encode(disclosure_json).decode('utf-8').rstrip('='))
+
+        # Generate hash for the _sd array / array element
+        return base64.urlsafe_b64encode(hashlib.sha256(disclosure_json).digest()).decode('utf-8').rstrip('=')
+
+    def conceal(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {"_sd": [disclose([key, conceal(member)]) for key, member in value.items()]}
+        if isinstance(value, list):
+            return [{"...": disclose([conceal(element)])} for element in value]
+        return value
+
+    sd_hashes = [
+        disclose([key, conceal(value) if key in recursive_claims else value])
+        for key, value in claims.items()
+    ]
+    return disclosures, sd_hashes
+
+
+def build_sd_jwt(
+    key,
+    headers: Dict[str, Any],
+    payload: Dict[str, Any],
+    claims: Dict[str, Any],
+    recursive_claims: Iterable[str] = ()
+) -> str:
+    """Create the disclosures, sign the JWT with the python-jose `key` and append the disclosures."""
+    disclosures, sd_hashes = create_disclosures(claims, recursive_claims)
+
+    # Generate the JWT
+    credential_jwt = jwt.encode(
+        claims={**payload, "_sd": sd_hashes},
+        key=key,
+        algorithm="ES256",
+        headers=headers
+    )
+
+    # Combine JWT and base64url-encoded disclosures
+    return credential_jwt + "~" + "~".join(disclosures) + "~"
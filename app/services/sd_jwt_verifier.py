@@ -0,0 +1,312 @@
+"""
+Verification of SD-JWT VC presentations (LPID, EUCC and other SD-JWT VCs).
+
+A presentation is `<issuer JWT>~<disclosure>~...~<optional KB-JWT>`. Verifying it
+checks the issuer signature, that every disclosure's digest is referenced from
+an `_sd` array or `{"...": digest}` element, and, when present or required, the
+key-binding JWT against the holder key in `cnf`. The result contains the
+disclosed claims.
+
+Issuer keys are resolved by the JWKSResolver: our own issuer from the local
+KeyManager, other issuers listed in SD_JWT_TRUSTED_ISSUERS from their
+`/.well-known/jwt-vc-issuer` metadata. Resolved key sets are kept as parsed
+keys (key_manager.verification_key) for JWKS_CACHE_TTL_SECONDS, so a batch of
+presentations from the same issuer parses each key once. ES256 and EdDSA
+signatures are checked by key_manager.verify_jwt.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from jose import jwt
+from jose.exceptions import JOSEError
+
+from app.services.key_manager import jwk_thumbprint, verification_key, verify_jwt
+
+logger = logging.getLogger(__name__)
+
+JWKS_CACHE_TTL_SECONDS = int(os.getenv("JWKS_CACHE_TTL_SECONDS", "300"))
+# Minimum time between refetches triggered by an unknown kid
+JWKS_MIN_REFRESH_SECONDS = int(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+SD_JWT_TRUSTED_ISSUERS = [issuer.strip() for issuer in os.getenv("SD_JWT_TRUSTED_ISSUERS", "").split(",") if issuer.strip()]
+KB_JWT_MAX_AGE_SECONDS = int(os.getenv("KB_JWT_MAX_AGE_SECONDS", "300"))
+SUPPORTED_SIGNING_ALGORITHMS = ["ES256", "EdDSA"]
+
+
+class VerificationError(Exception):
+    pass
+
+
+def base64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def base64url_digest(data: bytes) -> str:
+    return base64.urlsafe_b64encode(hashlib.sha256(data).digest()).decode("utf-8").rstrip("=")
+
+
+class JWKSResolver:
+    """TTL-bound cache from issuer identifier to its parsed signing keys, by kid."""
+
+    def __init__(
+        self,
+        local_issuers: Optional[Dict[str, Callable[[], Dict[str, Any]]]] = None,
+        trusted_issuers: Optional[List[str]] = None,
+        ttl_seconds: int = JWKS_CACHE_TTL_SECONDS,
+        min_refresh_seconds: int = JWKS_MIN_REFRESH_SECONDS,
+    ):
+        # Issuer identifier -> function returning its JWKS without a network round trip
+        self.local_issuers = dict(local_issuers or {})
+        self.trusted_issuers = set(trusted_issuers if trusted_issuers is not None else SD_JWT_TRUSTED_ISSUERS)
+        self.ttl_seconds = ttl_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self._entries: Dict[str, Tuple[float, float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def get_key(self, issuer: str, kid: Optional[str]):
+        """Parsed key for `kid` (or the issuer's only key when there is no kid)."""
+        keys = self._keys(issuer, refresh=False)
+        key = self._select(keys, kid)
+        if key is None:
+            # Unknown kid: the issuer may have rotated keys, refetch (rate limited)
+            key = self._select(self._keys(issuer, refresh=True), kid)
+        if key is None:
+            raise VerificationError(f"No issuer key found for kid {kid!r}")
+        return key
+
+    def invalidate(self, issuer: Optional[str] = None) -> None:
+        with self._lock:
+            if issuer is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(issuer, None)
+
+    @staticmethod
+    def _select(keys: Dict[str, Any], kid: Optional[str]):
+        if kid is not None:
+            return keys.get(kid)
+        return next(iter(keys.values())) if len(keys) == 1 else None
+
+    def _keys(self, issuer: str, refresh: bool) -> Dict[str, Any]:
+        now = time.monotonic()
+        entry = self._entries.get(issuer)
+        if entry is not None and now < entry[0] and not (refresh and now >= entry[1]):
+            return entry[2]
+        with self._lock:
+            entry = self._entries.get(issuer)
+            if entry is not None and now < entry[0] and not (refresh and now >= entry[1]):
+                return entry[2]
+            keys = self._parse(self._fetch_jwks(issuer))
+            self._entries[issuer] = (now + self.ttl_seconds, now + self.min_refresh_seconds, keys)
+            return keys
+
+    def _fetch_jwks(self, issuer: str) -> Dict[str, Any]:
+        if issuer in self.local_issuers:
+            return self.local_issuers[issuer]()
+        if issuer not in self.trusted_issuers:
+            raise VerificationError(f"Untrusted issuer: {issuer}")
+        # SD-JWT VC issuer metadata: https://host/.well-known/jwt-vc-issuer/<path>
+        parts = urlsplit(issuer)
+        metadata_url = f"{parts.scheme}://{parts.netloc}/.well-known/jwt-vc-issuer{parts.path.rstrip('/')}"
+        try:
+            self.fetches += 1
+            response = requests.get(metadata_url, timeout=10)
+            response.raise_for_status()
+            metadata = response.json()
+            if "jwks" in metadata:
+                return metadata["jwks"]
+            response = requests.get(metadata["jwks_uri"], timeout=10)
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.error(f"Error resolving JWKS for issuer {issuer}: {str(e)}")
+            raise VerificationError(f"Could not resolve issuer keys for {issuer}")
+
+    @staticmethod
+    def _parse(jwks: Dict[str, Any]) -> Dict[str, Any]:
+        keys = {}
+        for index, public_jwk in enumerate(jwks.get("keys", [])):
+            algorithm = public_jwk.get("alg") or ("EdDSA" if public_jwk.get("kty") == "OKP" else "ES256")
+            if algorithm not in SUPPORTED_SIGNING_ALGORITHMS:
+                continue
+            try:
+                keys[public_jwk.get("kid", str(index))] = verification_key(public_jwk, algorithm)
+            except (JOSEError, KeyError, ValueError) as e:
+                logger.warning(f"Skipping unusable JWK {public_jwk.get('kid')}: {str(e)}")
+        return keys
+
+
+class PresentationVerifier:
+    def __init__(self, resolver: JWKSResolver):
+        self.resolver = resolver
+
+    def verify(
+        self,
+        presentation: str,
+        audience: Optional[str] = None,
+        nonce: Optional[str] = None,
+        require_key_binding: bool = False,
+        holder_keys: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Verify one presentation and return its disclosed claims. Raises
+        VerificationError. `holder_keys` memoises parsed holder keys across a batch.
+        """
+        parts = presentation.split("~")
+        if len(parts) < 2:
+            raise VerificationError("Not an SD-JWT: missing '~' separator")
+        issuer_jwt, disclosures, kb_jwt = parts[0], parts[1:-1], parts[-1]
+
+        payload = self._verify_issuer_jwt(issuer_jwt)
+        claims = self._disclose(payload, disclosures)
+
+        if kb_jwt:
+            self._verify_key_binding(kb_jwt, presentation[:len(presentation) - len(kb_jwt)], payload, audience, nonce, holder_keys)
+        elif require_key_binding:
+            raise VerificationError("Key binding JWT required")
+
+        return {"issuer": payload.get("iss"), "vct": payload.get("vct"), "key_binding": bool(kb_jwt), "claims": claims}
+
+    def _verify_issuer_jwt(self, issuer_jwt: str) -> Dict[str, Any]:
+        try:
+            header = jwt.get_unverified_header(issuer_jwt)
+            issuer = jwt.get_unverified_claims(issuer_jwt).get("iss")
+        except JOSEError as e:
+            raise VerificationError(f"Malformed issuer JWT: {str(e)}")
+        if header.get("alg") not in SUPPORTED_SIGNING_ALGORITHMS:
+            raise VerificationError(f"Unsupported issuer JWT algorithm: {header.get('alg')}")
+        if not issuer:
+            raise VerificationError("Issuer JWT has no iss claim")
+        key = self.resolver.get_key(issuer, header.get("kid"))
+        try:
+            payload = verify_jwt(issuer_jwt, key, header["alg"])
+        except (JOSEError, ValueError) as e:
+            raise VerificationError(f"Invalid issuer signature: {str(e)}")
+        if payload.get("_sd_alg", "sha-256") != "sha-256":
+            raise VerificationError(f"Unsupported _sd_alg: {payload.get('_sd_alg')}")
+        return payload
+
+    @staticmethod
+    def _disclose(payload: Dict[str, Any], disclosures: List[str]) -> Dict[str, Any]:
+        """Replace digests in the payload by the disclosed values; every disclosure must be referenced."""
+        by_digest: Dict[str, Tuple[str, List[Any]]] = {}
+        for disclosure in disclosures:
+            try:
+                raw = base64url_decode(disclosure)
+                content = json.loads(raw)
+            except ValueError:
+                raise VerificationError("Malformed disclosure")
+            if not isinstance(content, list) or len(content) not in (2, 3):
+                raise VerificationError("Malformed disclosure")
+            # SD-JWT digest over the encoded disclosure, and this issuer's digest over its JSON
+            for digest in {base64url_digest(disclosure.encode("ascii")), base64url_digest(raw)}:
+                if digest in by_digest:
+                    raise VerificationError("Duplicate disclosure")
+                by_digest[digest] = (disclosure, content)
+        used = set()
+
+        def disclosed(digest: str, length: int) -> Optional[List[Any]]:
+            entry = by_digest.get(digest)
+            if entry is None:
+                # Decoy digest or undisclosed claim
+                return None
+            disclosure, content = entry
+            if disclosure in used:
+                raise VerificationError("Disclosure referenced more than once")
+            if len(content) != length:
+                raise VerificationError("Disclosure does not match its position")
+            used.add(disclosure)
+            return content
+
+        def walk(value: Any) -> Any:
+            if isinstance(value, dict):
+                result = {key: walk(member) for key, member in value.items() if key not in ("_sd", "_sd_alg")}
+                for digest in value.get("_sd", []):
+                    content = disclosed(digest, 3)
+                    if content is None:
+                        continue
+                    name = content[1]
+                    if name in ("_sd", "...") or name in result:
+                        raise VerificationError(f"Invalid disclosed claim name: {name}")
+                    result[name] = walk(content[2])
+                return result
+            if isinstance(value, list):
+                result = []
+                for element in value:
+                    if isinstance(element, dict) and set(element) == {"..."}:
+                        content = disclosed(element["..."], 2)
+                        if content is not None:
+                            result.append(walk(content[1]))
+                    else:
+                        result.append(walk(element))
+                return result
+            return value
+
+        claims = walk(payload)
+        if len(used) != len(disclosures):
+            raise VerificationError("Disclosure not referenced by the credential")
+        return claims
+
+    @staticmethod
+    def _verify_key_binding(
+        kb_jwt: str,
+        sd_jwt: str,
+        payload: Dict[str, Any],
+        audience: Optional[str],
+        nonce: Optional[str],
+        holder_keys: Optional[Dict[str, Any]],
+    ) -> None:
+        holder_jwk = payload.get("cnf", {}).get("jwk")
+        if not holder_jwk:
+            raise VerificationError("Credential has no cnf.jwk for key binding")
+        try:
+            header = jwt.get_unverified_header(kb_jwt)
+            if header.get("typ") != "kb+jwt":
+                raise VerificationError("Key binding JWT must have typ kb+jwt")
+            algorithm = header.get("alg")
+            if algorithm not in SUPPORTED_SIGNING_ALGORITHMS:
+                raise VerificationError(f"Unsupported key binding algorithm: {algorithm}")
+            thumbprint = jwk_thumbprint(holder_jwk)
+            key = holder_keys.get(thumbprint) if holder_keys is not None else None
+            if key is None:
+                key = verification_key(holder_jwk, algorithm)
+                if holder_keys is not None:
+                    holder_keys[thumbprint] = key
+            claims = verify_jwt(kb_jwt, key, algorithm)
+        except (JOSEError, KeyError, ValueError) as e:
+            raise VerificationError(f"Invalid key binding JWT: {str(e)}")
+        if claims.get("sd_hash") != base64url_digest(sd_jwt.encode("ascii")):
+            raise VerificationError("Key binding JWT sd_hash does not match the presentation")
+        if audience is not None and claims.get("aud") != audience:
+            raise VerificationError("Key binding JWT audience mismatch")
+        if nonce is not None and claims.get("nonce") != nonce:
+            raise VerificationError("Key binding JWT nonce mismatch")
+        issued_at = claims.get("iat")
+        if not isinstance(issued_at, (int, float)) or abs(time.time() - issued_at) > KB_JWT_MAX_AGE_SECONDS:
+            raise VerificationError("Key binding JWT is not fresh")
+
+    def verify_many(self, presentations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Verify several presentations; one failure does not affect the others."""
+        holder_keys: Dict[str, Any] = {}
+        results = []
+        for item in presentations:
+            try:
+                result = self.verify(
+                    item["presentation"],
+                    audience=item.get("audience"),
+                    nonce=item.get("nonce"),
+                    require_key_binding=item.get("require_key_binding", False),
+                    holder_keys=holder_keys,
+                )
+                results.append({"valid": True, **result})
+            except VerificationError as e:
+                results.append({"valid": False, "error": str(e)})
+        return results
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from app.services import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Directory holding one JSON file per PID authentication session
+SESSION_DIR = Path("authentication-requests")
+
+# Maximum number of parsed session files kept in memory
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "1024"))
+
+# Session files are written compact unless pretty output is requested for debugging
+SESSION_FILE_PRETTY = os.getenv("SESSION_FILE_PRETTY", "false").lower() == "true"
+
+
+class SessionFileCache:
+    """
+    In-process LRU cache of parsed session files.
+
+    Entries are validated against the file's mtime and size on every lookup, so
+    writes from other processes are picked up. Writes from this process go
+    through `write_session_file`, which drops the entry and bumps a generation
+    counter so a concurrent read cannot re-insert stale data.
+    """
+
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, int, int, Dict[str, Any]]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+        """Return the cached data if it still matches the file's mtime and size."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size \
+                    and entry[2] == self._generations.get(session_id, 0):
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+            return None
+
+    def generation(self, session_id: str) -> int:
+        with self._lock:
+            return self._generations.get(session_id, 0)
+
+    def put(self, session_id: str, stat: os.stat_result, generation: int, data: Dict[str, Any]) -> None:
+        """Store parsed data unless the session was written since the read started."""
+        with self._lock:
+            if generation != self._generations.get(session_id, 0):
+                return
+            self._entries[session_id] = (stat.st_mtime_ns, stat.st_size, generation, data)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+            # Generations only matter while an entry may still be cached
+            if len(self._generations) > 4 * self.max_entries:
+                current = self._generations[session_id]
+                self._generations = {key: self._generations.get(key, 0) for key in self._entries}
+                self._generations[session_id] = current
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+session_cache = SessionFileCache()
+
+
+def session_file_path(session_id: str) -> Path:
+    return SESSION_DIR / f"{session_id}.json"
+
+
+def read_session_file(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retrieve request data from the session JSON file, served from the cache when
+    the file is unchanged.
+
+    The returned dict is shared with the cache and must not be mutated.
+    """
+    file_path = session_file_path(session_id)
+    try:
+        stat = file_path.stat()
+    except FileNotFoundError:
+        logger.warning(f"No data file found for session ID: {session_id} at {file_path}")
+        return None
+    except OSError as e:
+        logger.error(f"Error reading session data file {file_path}: {str(e)}")
+        return None
+
+    cached = session_cache.get(session_id, stat)
+    if cached is not None:
+        return cached
+
+    generation = session_cache.generation(session_id)
+    try:
+        with open(file_path, "rb") as f:
+            content = f.read()
+            # Stat the open file so the cached version matches what was read
+            stat = os.fstat(f.fileno())
+    except Exception as e:
+        logger.error(f"Error reading session data file {file_path}: {str(e)}")
+        return None
+
+    # Handle empty file case
+    if not content:
+        logger.warning(f"Session file {file_path} is empty.")
+        # Return a dict indicating the error state
+        return {"status": "error", "error": "Empty session file", "logs": []}
+    try:
+        data = json_codec.loads(content)
+    except json.JSONDecodeError as decode_err:
+        logger.error(f"Error decoding JSON from {file_path}: {decode_err}")
+        # Return a dict indicating the error state
+        return {"status": "error", "error": f"Corrupted session file: {decode_err}", "logs": []}
+
+    if stat.st_size == len(content):
+        session_cache.put(session_id, stat, generation, data)
+    return data
+
+
+def write_session_file(file_path: Path, data: Dict[str, Any]) -> None:
+    """Write session data to disk and invalidate the cached copy."""
+    file_path = Path(file_path)
+    session_cache.invalidate(file_path.stem)
+    try:
+        with open(file_path, "wb") as f:
+            f.write(json_codec.dumps(data, pretty=SESSION_FILE_PRETTY))
+    finally:
+        session_cache.invalidate(file_path.stem)
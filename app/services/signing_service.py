@@ -0,0 +1,209 @@
+"""
+Pool of worker processes that build and sign SD-JWTs off the request path.
+
+The request path only assembles the JWT header, the payload and the claims.
+Creating the salted disclosures, hashing them and the ES256 signature happen in
+a worker process, so issuance bursts do not compete with request handling for
+the GIL. Requests are queued and a dispatcher thread groups those arriving
+within SIGNING_BATCH_WINDOW_MS (up to SIGNING_MAX_BATCH) into one task per
+worker round trip.
+
+Workers are started with the "spawn" method (the app runs threads, so fork is
+unsafe) and receive the issuer's private keys once, in the pool initializer.
+They only import this module and app.services.sd_jwt_builder, neither of which
+builds the app or opens its stores.
+The pool is restarted when the issuer key set changes.
+
+Enabled with SIGNING_WORKERS > 0; with the default of 0, issuance signs inline.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+
+from app.services.key_manager import KeyManager
+
+logger = logging.getLogger(__name__)
+
+SIGNING_WORKERS = int(os.getenv("SIGNING_WORKERS", "0"))
+SIGNING_BATCH_WINDOW_MS = float(os.getenv("SIGNING_BATCH_WINDOW_MS", "2"))
+SIGNING_MAX_BATCH = int(os.getenv("SIGNING_MAX_BATCH", "32"))
+SIGNING_TIMEOUT_SECONDS = float(os.getenv("SIGNING_TIMEOUT_SECONDS", "10"))
+
+# (kid, JWT header, JWT payload with an empty `_sd`, claims, recursively concealed claim names)
+SigningTask = Tuple[str, Dict[str, Any], Dict[str, Any], Dict[str, Any], FrozenSet[str]]
+
+
+# --- Worker process side ---
+_worker_keys: Dict[str, Any] = {}
+
+
+def _init_worker(keys: List[Tuple[str, str, bytes]]) -> None:
+    from jose import jwk as jose_jwk
+
+    for kid, algorithm, pem in keys:
+        _worker_keys[kid] = jose_jwk.construct(pem, algorithm)
+
+
+def _sign_batch(tasks: List[SigningTask]) -> List[Tuple[bool, str]]:
+    from app.services.sd_jwt_builder import build_sd_jwt
+
+    results = []
+    for kid, headers, payload, claims, recursive_claims in tasks:
+        try:
+            results.append((True, build_sd_jwt(_worker_keys[kid], headers, payload, claims, recursive_claims)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {str(e)}"))
+    return results
+
+
+# --- Request process side ---
+class SigningError(Exception):
+    pass
+
+
+class SigningService:
+    def __init__(
+        self,
+        key_manager: KeyManager,
+        processes: int = SIGNING_WORKERS,
+        batch_window_ms: float = SIGNING_BATCH_WINDOW_MS,
+        max_batch: int = SIGNING_MAX_BATCH,
+        timeout_seconds: float = SIGNING_TIMEOUT_SECONDS,
+    ):
+        self.key_manager = key_manager
+        self.processes = processes
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.timeout_seconds = timeout_seconds
+        self._queue: "queue.Queue[Optional[Tuple[SigningTask, Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._key_version = -1
+        self._dispatcher: Optional[threading.Thread] = None
+        self.batches = 0
+        self.signed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            self._ensure_executor()
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="signing-dispatcher", daemon=True)
+                self._dispatcher.start()
+                atexit.register(self.shutdown)
+
+    def shutdown(self) -> None:
+        # The dispatcher takes the lock to submit, so join it without holding the lock
+        dispatcher = self._dispatcher
+        if dispatcher is not None:
+            self._queue.put(None)
+            dispatcher.join(timeout=self.timeout_seconds)
+            self._dispatcher = None
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def submit(self, task: SigningTask) -> Future:
+        if self._dispatcher is None:
+            self.start()
+        future: Future = Future()
+        self._queue.put((task, future))
+        return future
+
+    def sign_many(self, tasks: List[SigningTask]) -> List[str]:
+        """Sign the tasks (batched with any concurrent requests) and wait for the SD-JWTs."""
+        futures = [self.submit(task) for task in tasks]
+        return [future.result(timeout=self.timeout_seconds) for future in futures]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "batches": self.batches,
+            "signed": self.signed,
+            "queued": self._queue.qsize(),
+        }
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        # Called with the lock held
+        if self._executor is None or self._key_version != self.key_manager.version:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._key_version = self.key_manager.version
+            keys = [
+                (
+                    key.kid,
+                    key.algorithm,
+                    key.private_key.private_bytes(
+                        serialization.Encoding.PEM,
+                        serialization.PrivateFormat.PKCS8,
+                        serialization.NoEncryption(),
+                    ),
+                )
+                for key in self.key_manager.keys()
+            ]
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(keys,),
+            )
+            logger.info(f"Started {self.processes} signing worker processes")
+        return self._executor
+
+    def _next_batch(self) -> Optional[List[Tuple[SigningTask, Future]]]:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures = [future for _, future in batch]
+            try:
+                with self._lock:
+                    executor = self._ensure_executor()
+                result = executor.submit(_sign_batch, [task for task, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(SigningError(str(e)))
+                continue
+            self.batches += 1
+            result.add_done_callback(lambda done, futures=futures: self._resolve(done, futures))
+
+    def _resolve(self, done: Future, futures: List[Future]) -> None:
+        try:
+            results = done.result()
+        except Exception as e:
+            for future in futures:
+                future.set_exception(SigningError(f"Signing worker failed: {str(e)}"))
+            return
+        for future, (ok, value) in zip(futures, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(SigningError(value))
+        self.signed += len(results)
@@ -0,0 +1,304 @@
+"""
+Token Status List (draft-ietf-oauth-status-list) for issued credentials.
+
+Every credential gets a `status` reference: an index into a status list with
+one bit per credential (0 = valid, 1 = invalid/revoked). A list is a fixed-size
+bytearray, so a million credentials take 128 KiB of memory. The served status
+list token (`typ: statuslist+jwt`) carries the bitstring DEFLATE-compressed in
+ZLIB format.
+
+The bitstring is compressed in independent chunks, each ending with a full
+flush, so revoking a credential only recompresses the chunk holding its bit;
+the ZLIB stream is the concatenation of the cached chunks plus a trailer.
+Revocations are applied in batches (one SQLite transaction and one token
+re-signing per batch, however many bits change), and the token is only
+re-signed when a list has changed or the token is about to expire.
+
+Indexes are reserved from SQLite in blocks so issuance does not write per
+credential; indexes of a block left unused at shutdown are simply skipped.
+Indexes allocated for credentials that then failed to sign are released and
+handed out again by the same process.
+Processes sharing the database see each other's revocations through SQLite's
+data_version before serving a token.
+"""
+import base64
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from jose import jwt
+
+from app.services.key_manager import KeyManager
+
+logger = logging.getLogger(__name__)
+
+STATUS_LIST_DB_PATH = os.getenv("STATUS_LIST_DB_PATH", "status-lists.sqlite3")
+# Credentials per status list (a multiple of 8 * STATUS_LIST_CHUNK_BYTES)
+STATUS_LIST_SIZE = int(os.getenv("STATUS_LIST_SIZE", str(1 << 20)))
+STATUS_LIST_CHUNK_BYTES = int(os.getenv("STATUS_LIST_CHUNK_BYTES", "4096"))
+STATUS_LIST_RESERVE_BLOCK = int(os.getenv("STATUS_LIST_RESERVE_BLOCK", "1000"))
+# How long relying parties may cache a status list token (`ttl` and Cache-Control)
+STATUS_LIST_TTL_SECONDS = int(os.getenv("STATUS_LIST_TTL_SECONDS", "300"))
+# Validity of a signed status list token (`exp`)
+STATUS_LIST_TOKEN_LIFETIME_SECONDS = int(os.getenv("STATUS_LIST_TOKEN_LIFETIME_SECONDS", "86400"))
+
+STATUS_VALID = 0
+STATUS_INVALID = 1
+
+# Level 9 is an order of magnitude slower on sparse bitstrings for ~15% smaller lists
+COMPRESSION_LEVEL = 6
+ZLIB_HEADER = b"\x78\x9c"
+# Empty final stored block, closing the raw DEFLATE stream
+DEFLATE_FINAL_BLOCK = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15).flush(zlib.Z_FINISH)
+
+
+class StatusList:
+    """One-bit-per-entry bitstring with incrementally recompressed chunks."""
+
+    def __init__(self, list_id: int, size: int, chunk_bytes: int = STATUS_LIST_CHUNK_BYTES):
+        self.list_id = list_id
+        self.size = size
+        self.chunk_bytes = chunk_bytes
+        self.bits = bytearray((size + 7) // 8)
+        self._compressed: List[Optional[bytes]] = [None] * ((len(self.bits) + chunk_bytes - 1) // chunk_bytes)
+        # Incremented whenever a bit changes
+        self.version = 0
+
+    def get(self, index: int) -> int:
+        # Bit 0 of byte 0 is index 0 (least significant bit first)
+        return (self.bits[index >> 3] >> (index & 7)) & 1
+
+    def set(self, index: int, status: int) -> bool:
+        """Set a bit; returns whether it changed."""
+        if not 0 <= index < self.size:
+            raise IndexError(f"Status index {index} out of range")
+        byte, mask = index >> 3, 1 << (index & 7)
+        value = (self.bits[byte] | mask) if status else (self.bits[byte] & ~mask)
+        if value == self.bits[byte]:
+            return False
+        self.bits[byte] = value
+        self._compressed[byte // self.chunk_bytes] = None
+        self.version += 1
+        return True
+
+    def chunk(self, number: int) -> bytes:
+        return bytes(self.bits[number * self.chunk_bytes:(number + 1) * self.chunk_bytes])
+
+    @property
+    def chunks(self) -> int:
+        return len(self._compressed)
+
+    def load_chunk(self, number: int, data: bytes) -> None:
+        self.bits[number * self.chunk_bytes:number * self.chunk_bytes + len(data)] = data
+        self._compressed[number] = None
+        self.version += 1
+
+    def compressed(self) -> bytes:
+        """ZLIB (DEFLATE) stream of the bitstring, recompressing only changed chunks."""
+        for number, cached in enumerate(self._compressed):
+            if cached is None:
+                compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+                # A full flush ends the chunk on a byte boundary and resets the
+                # window, so chunks can be recompressed and concatenated independently
+                self._compressed[number] = compressor.compress(self.chunk(number)) + compressor.flush(zlib.Z_FULL_FLUSH)
+        return (
+            ZLIB_HEADER
+            + b"".join(self._compressed)
+            + DEFLATE_FINAL_BLOCK
+            + zlib.adler32(self.bits).to_bytes(4, "big")
+        )
+
+
+class StatusListService:
+    def __init__(
+        self,
+        key_manager: KeyManager,
+        issuer: str,
+        db_path: str = STATUS_LIST_DB_PATH,
+        list_size: int = STATUS_LIST_SIZE,
+        reserve_block: int = STATUS_LIST_RESERVE_BLOCK,
+        ttl_seconds: int = STATUS_LIST_TTL_SECONDS,
+        token_lifetime_seconds: int = STATUS_LIST_TOKEN_LIFETIME_SECONDS,
+    ):
+        self.key_manager = key_manager
+        self.issuer = issuer
+        self.list_size = list_size
+        self.reserve_block = reserve_block
+        self.ttl_seconds = ttl_seconds
+        self.token_lifetime_seconds = token_lifetime_seconds
+        self._lock = threading.Lock()
+        self._lists: Dict[int, StatusList] = {}
+        # Signed tokens by list id: (list version, expires_at, token, etag)
+        self._tokens: Dict[int, Tuple[int, float, bytes, str]] = {}
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS status_lists ("
+            "list_id INTEGER PRIMARY KEY, size INTEGER NOT NULL, reserved INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS status_list_chunks ("
+            "list_id INTEGER NOT NULL, chunk INTEGER NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (list_id, chunk)) WITHOUT ROWID"
+        )
+        self._current_list: Optional[int] = None
+        self._next_index = self._reserved_until = 0
+        # Allocated indexes whose credentials were never issued, reused first
+        self._released: List[Tuple[int, int]] = []
+        self._load()
+
+    def _load(self) -> None:
+        """Pick up lists and revocations written by this or another process."""
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        for list_id, size in self._db.execute("SELECT list_id, size FROM status_lists"):
+            if list_id not in self._lists:
+                self._lists[list_id] = StatusList(list_id, size)
+        persisted = set()
+        for list_id, chunk, data in self._db.execute("SELECT list_id, chunk, data FROM status_list_chunks"):
+            persisted.add((list_id, chunk))
+            status_list = self._lists.get(list_id)
+            if status_list is not None and status_list.chunk(chunk) != data:
+                status_list.load_chunk(chunk, data)
+        # Bits only set in memory by a rolled back revocation: chunks never written are all zero
+        for list_id, status_list in self._lists.items():
+            for chunk in range(status_list.chunks):
+                data = status_list.chunk(chunk)
+                if (list_id, chunk) not in persisted and data.count(0) != len(data):
+                    status_list.load_chunk(chunk, bytes(len(data)))
+
+    def _sync(self) -> None:
+        # data_version only changes when another connection commits. Read it under the
+        # lock: another thread may be inside a transaction on the shared connection
+        with self._lock:
+            if self._db.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                self._load()
+
+    # --- Issuance ---
+    def allocate(self, count: int = 1) -> List[Tuple[int, int]]:
+        """Reserve `count` (list_id, index) pairs for new credentials."""
+        allocated = []
+        with self._lock:
+            while self._released and len(allocated) < count:
+                allocated.append(self._released.pop())
+            while len(allocated) < count:
+                if self._next_index >= self._reserved_until:
+                    self._reserve()
+                take = min(count - len(allocated), self._reserved_until - self._next_index)
+                allocated.extend((self._current_list, index) for index in range(self._next_index, self._next_index + take))
+                self._next_index += take
+        return allocated
+
+    def release(self, entries: Iterable[Tuple[int, int]]) -> None:
+        """Return allocated indexes that no issued credential refers to."""
+        with self._lock:
+            self._released.extend(entries)
+
+    def _reserve(self) -> None:
+        """Reserve the next block of indexes, atomically across processes."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT list_id, size, reserved FROM status_lists ORDER BY list_id DESC LIMIT 1"
+            ).fetchone()
+            if row is None or row[2] >= row[1]:
+                # Current list is full: start a new one
+                row = ((row[0] if row else 0) + 1, self.list_size, 0)
+                self._db.execute("INSERT INTO status_lists (list_id, size, reserved) VALUES (?, ?, 0)", (row[0], row[1]))
+            list_id, size, reserved = row
+            reserved_until = min(reserved + self.reserve_block, size)
+            self._db.execute("UPDATE status_lists SET reserved = ? WHERE list_id = ?", (reserved_until, list_id))
+            self._db.execute("COMMIT")
+        except sqlite3.Error:
+            self._db.execute("ROLLBACK")
+            raise
+        if list_id not in self._lists:
+            self._lists[list_id] = StatusList(list_id, size)
+        self._current_list, self._next_index, self._reserved_until = list_id, reserved, reserved_until
+
+    # --- Revocation ---
+    def set_status(self, entries: Iterable[Tuple[int, int]], status: int = STATUS_INVALID) -> int:
+        """Apply a batch of status changes in one transaction; returns the number of bits that changed."""
+        entries = list(entries)
+        with self._lock:
+            # The write lock serialises revocations across processes; re-read their changes under it
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                    self._load()
+                for list_id, index in entries:
+                    if list_id not in self._lists:
+                        raise KeyError(f"Unknown status list {list_id}")
+                    if not 0 <= index < self._lists[list_id].size:
+                        raise IndexError(f"Status index {index} out of range")
+                changed = 0
+                changed_chunks = set()
+                for list_id, index in entries:
+                    status_list = self._lists[list_id]
+                    if status_list.set(index, status):
+                        changed += 1
+                        changed_chunks.add((list_id, index // 8 // status_list.chunk_bytes))
+                # Persist only the touched chunks
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO status_list_chunks (list_id, chunk, data) VALUES (?, ?, ?)",
+                    [(list_id, chunk, self._lists[list_id].chunk(chunk)) for list_id, chunk in changed_chunks],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                # Bits may already be set in memory: reload them from the database on next use
+                self._data_version = None
+                raise
+        return changed
+
+    def get_status(self, list_id: int, index: int) -> int:
+        self._sync()
+        return self._lists[list_id].get(index)
+
+    # --- Status list token ---
+    def token(self, list_id: int, uri: str) -> Tuple[bytes, str]:
+        """Signed status list token and its ETag, re-signed only when the list changed or nears expiry."""
+        self._sync()
+        status_list = self._lists.get(list_id)
+        if status_list is None:
+            raise KeyError(f"Unknown status list {list_id}")
+        now = time.time()
+        cached = self._tokens.get(list_id)
+        if cached is not None and cached[0] == status_list.version and now < cached[1] - self.ttl_seconds:
+            return cached[2], cached[3]
+        with self._lock:
+            version = status_list.version
+            compressed = status_list.compressed()
+        signing_key = self.key_manager.active_key
+        expires_at = int(now) + self.token_lifetime_seconds
+        token = jwt.encode(
+            claims={
+                "sub": uri,
+                "iss": self.issuer,
+                "iat": int(now),
+                "exp": expires_at,
+                "ttl": self.ttl_seconds,
+                "status_list": {
+                    "bits": 1,
+                    "lst": base64.urlsafe_b64encode(compressed).decode("utf-8").rstrip("=")
+                }
+            },
+            key=signing_key.jose_key,
+            algorithm=signing_key.algorithm,
+            headers={"typ": "statuslist+jwt", "kid": signing_key.kid}
+        ).encode("utf-8")
+        etag = '"' + hashlib.sha256(token).hexdigest()[:32] + '"'
+        self._tokens[list_id] = (version, expires_at, token, etag)
+        return token, etag
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lists": len(self._lists),
+            "current_list": self._current_list,
+            "next_index": self._next_index,
+            "memory_bytes": sum(len(status_list.bits) for status_list in self._lists.values()),
+        }
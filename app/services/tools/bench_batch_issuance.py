@@ -0,0 +1,72 @@
+"""
+Credentials per second for N holder keys issued one at a time (one
+generate_credential_jwt call, and so one KvK fetch, per credential) versus one
+generate_credential_jwts batch. The KvK API is replaced by a stub that sleeps
+KVK_LATENCY_SECONDS to stand in for the upstream round trip.
+
+Run from the repository root: python -m app.services.tools.bench_batch_issuance
+"""
+import logging
+import time
+
+from app.clients.kvk_bevoegdheden_rest_api import KVKBevoegdhedenAPI
+from app.services import mini_suomi
+from app.services.key_manager import KeyManager
+
+KVK_LATENCY_SECONDS = 0.05
+BATCH_SIZES = (1, 5, 20)
+ROUNDS = 5
+
+LPID = {
+    "data": {"id": "NLNHR.90000021", "legal_person_name": "Benchmark B.V."},
+    "metadata": {"issuer_id": "NLNHR", "issuing_authority_name": "Kamer van Koophandel", "issuing_country": "NL"},
+}
+COMPANY_CERTIFICATE = {
+    "data": {
+        "id": "NLNHR.90000021",
+        "registration_number": "90000021",
+        "legal_person_name": "Benchmark B.V.",
+        "legal_form": "Besloten Vennootschap",
+        "postal_address": "Kerkstraat 1 1234AB Amsterdam",
+        "date_of_registration": "01-02-2003",
+        "electronic_address": "info@example.com",
+        "authorized_persons": [
+            {"full_name": "Jan de Vries", "date_of_birth": "05-06-1970"},
+            {"full_name": "Piet Jansen", "date_of_birth": "07-08-1980"},
+        ],
+    },
+    "metadata": LPID["metadata"],
+}
+
+
+def stub_kvk(response):
+    def call(kvk_number):
+        time.sleep(KVK_LATENCY_SECONDS)
+        return response
+    return staticmethod(call)
+
+
+def credentials_per_second(issue, count):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        issue()
+    return count * ROUNDS / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    KVKBevoegdhedenAPI.get_lpid = stub_kvk(LPID)
+    KVKBevoegdhedenAPI.get_company_certificate = stub_kvk(COMPANY_CERTIFICATE)
+
+    for credential_type in ("LPIDSdJwt", "EUCCSdJwt"):
+        for count in BATCH_SIZES:
+            holder_jwks = [KeyManager.generate("ES256").active_key.public_jwk for _ in range(count)]
+            one_at_a_time = credentials_per_second(
+                lambda: [mini_suomi.generate_credential_jwt(credential_type, "90000021", jwk) for jwk in holder_jwks],
+                count,
+            )
+            batch = credentials_per_second(
+                lambda: mini_suomi.generate_credential_jwts([(credential_type, "90000021", jwk) for jwk in holder_jwks]),
+                count,
+            )
+            print(f"{credential_type} x{count:<3} one-at-a-time: {one_at_a_time:8.1f} cred/s   batch: {batch:8.1f} cred/s")
@@ -0,0 +1,72 @@
+"""
+How long credential requests hold a connection when some KvK lookups are slow,
+with deferral disabled and with a latency budget. Builds are simulated with a
+sleep: most take FAST_SECONDS, SLOW_SHARE of them SLOW_SECONDS. CLIENTS
+threads each make REQUESTS_PER_CLIENT requests, as wallets would; deferred
+requests poll at the interval they are given.
+
+Run from the repository root: python -m app.services.tools.bench_deferred_issuance
+"""
+import random
+import threading
+import time
+
+from app.services.deferred_issuance import ISSUED, DeferredIssuance
+
+CLIENTS = 32
+REQUESTS_PER_CLIENT = 10
+FAST_SECONDS = 0.05
+SLOW_SECONDS = 3.0
+SLOW_SHARE = 0.1
+BUDGETS_MS = (0, 500)
+
+
+def build(slow):
+    time.sleep(SLOW_SECONDS if slow else FAST_SECONDS)
+    return {"credential": "..."}
+
+
+def run(budget_ms):
+    service = DeferredIssuance(workers=CLIENTS, budget_ms=budget_ms)
+    held, completed = [], []
+    lock = threading.Lock()
+    random.seed(1)
+    plan = [[random.random() < SLOW_SHARE for _ in range(REQUESTS_PER_CLIENT)] for _ in range(CLIENTS)]
+
+    def client(requests):
+        for slow in requests:
+            start = time.perf_counter()
+            future, started_at = service.submit(build, slow)
+            try:
+                future.result(timeout=service.budget_seconds)
+                request_held = time.perf_counter() - start
+            except TimeoutError:
+                request_held = time.perf_counter() - start
+                transaction_id, interval = service.defer("token", future, started_at)
+                while True:
+                    time.sleep(interval)
+                    state, interval = service.poll(transaction_id, "token")
+                    if state == ISSUED:
+                        break
+            with lock:
+                held.append(request_held)
+                completed.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(requests,)) for requests in plan]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    held.sort()
+    completed.sort()
+    percentile = lambda values, p: values[min(len(values) - 1, int(len(values) * p))] * 1000
+    return (percentile(held, 0.5), percentile(held, 0.99), max(held) * 1000,
+            percentile(completed, 0.5), percentile(completed, 0.99), service.stats()["deferred"])
+
+
+if __name__ == "__main__":
+    for budget_ms in BUDGETS_MS:
+        held_p50, held_p99, held_max, done_p50, done_p99, deferred = run(budget_ms)
+        label = f"budget {budget_ms} ms" if budget_ms else "no deferral"
+        print(f"{label:16} request held p50 {held_p50:6.0f} ms  p99 {held_p99:6.0f} ms  max {held_max:6.0f} ms   "
+              f"credential ready p50 {done_p50:6.0f} ms  p99 {done_p99:6.0f} ms   {deferred} deferred")
@@ -0,0 +1,59 @@
+"""
+Compare the stdlib encoder (what JSONResponse and json.dump(indent=4) used) with
+app.services.json_codec for the payloads our routes return.
+
+Run from the repository root: python -m app.services.tools.bench_json_codec
+"""
+import json
+import timeit
+
+from app.routes import mini_suomi as mini_suomi_routes
+from app.services import json_codec
+from app.services.offer_store import offer_store
+
+ROUNDS = 20000
+
+
+def route_payload(response):
+    return json.loads(response.body)
+
+
+payloads = {
+    "GET /issuers/kvk/.well-known/openid-credential-issuer": route_payload(mini_suomi_routes.get_credential_issuer_metadata()),
+    "GET /issuers/kvk/.well-known/oauth-authorization-server": route_payload(mini_suomi_routes.get_oauth_server_metadata()),
+    "GET /credential_offer": route_payload(mini_suomi_routes.get_credential_offer(offer_store.create("LPIDSdJwt", "90000021")[0])),
+    "GET /issuers/kvk/jwks": route_payload(mini_suomi_routes.get_jwks()),
+    "POST /issuers/kvk/openid4vci/issue": {"credential": "eyJhbGciOiJFUzI1NiJ9." + "A" * 2400 + "~" + "~".join(["WyJzYWx0IiwiayIsInYiXQ"] * 10) + "~", "c_nonce": "xyz123"},
+    "GET /authentication-requests/{id} (session file)": {
+        "id": "5f1d7c8e-1111-2222-3333-444455556666",
+        "nonce": "0b3c6a1e-aaaa-bbbb-cccc-ddddeeeeffff",
+        "wallet_link": "eudi-openid4vp://?client_id=" + "x" * 400,
+        "timestamp": "2024-05-01T12:00:00.000000",
+        "status": "success",
+        "presentation_data": {"extracted_data": {"given_name": "Jan", "family_name": "Jansen", "birth_date": "1980-01-01"}},
+        "logs": [f"Log line {i}: waiting for wallet interaction and extracting data" for i in range(40)],
+    },
+}
+
+
+def stdlib_response(obj):
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+if __name__ == "__main__":
+    print(f"codec: {json_codec.CODEC_NAME}, {ROUNDS} encodes per payload")
+    print(f"{'route':58} {'stdlib us':>10} {'codec us':>10} {'speedup':>8}")
+    for route, payload in payloads.items():
+        baseline = timeit.timeit(lambda: stdlib_response(payload), number=ROUNDS) / ROUNDS * 1e6
+        codec = timeit.timeit(lambda: json_codec.dumps(payload), number=ROUNDS) / ROUNDS * 1e6
+        print(f"{route:58} {baseline:10.2f} {codec:10.2f} {baseline / codec:7.1f}x")
+
+    session = payloads["GET /authentication-requests/{id} (session file)"]
+    pretty = json.dumps(session, indent=4).encode()
+    compact = json_codec.dumps(session)
+    write_before = timeit.timeit(lambda: json.dumps(session, indent=4), number=ROUNDS) / ROUNDS * 1e6
+    read_before = timeit.timeit(lambda: json.loads(pretty), number=ROUNDS) / ROUNDS * 1e6
+    write_after = timeit.timeit(lambda: json_codec.dumps(session), number=ROUNDS) / ROUNDS * 1e6
+    read_after = timeit.timeit(lambda: json_codec.loads(compact), number=ROUNDS) / ROUNDS * 1e6
+    print(f"session file: {len(pretty)} -> {len(compact)} bytes, "
+          f"write {write_before:.2f} -> {write_after:.2f} us, read {read_before:.2f} -> {read_after:.2f} us")
@@ -0,0 +1,55 @@
+"""
+A portal page listing COMPANIES companies: one `/bevoegdheid/lpid/{kvk}` request
+per row against one `POST /bevoegdheid/lpid:batch` (and its NDJSON variant),
+through the app against the local stub of bench_kvk_client. The response cache
+is disabled so every number reaches the stub.
+
+Run from the repository root: python -m app.services.tools.bench_kvk_batch
+"""
+import logging
+import multiprocessing
+import time
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.clients import kvk_bevoegdheden_rest_api as client
+from app.services.tools.bench_kvk_client import serve_stub
+
+COMPANIES = 100
+ROUNDS = 5
+
+
+def per_row(test_client, numbers):
+    for kvk_nummer in numbers:
+        test_client.get(f"/bevoegdheid/lpid/{kvk_nummer}").raise_for_status()
+
+
+def batch(test_client, numbers):
+    test_client.post("/bevoegdheid/lpid:batch", json={"kvk_nummers": numbers}).raise_for_status()
+
+
+def streamed(test_client, numbers):
+    with test_client.stream("POST", "/bevoegdheid/lpid:batch?stream=true", json={"kvk_nummers": numbers}) as response:
+        for _ in response.iter_lines():
+            pass
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    port = multiprocessing.Value("i", 0)
+    stub = multiprocessing.Process(target=serve_stub, args=(port,), daemon=True)
+    stub.start()
+    while not port.value:
+        time.sleep(0.01)
+    client.BASE_URL = f"http://127.0.0.1:{port.value}"
+    client.kvk_response_cache.max_entries = 0
+    numbers = [str(90000000 + i) for i in range(COMPANIES)]
+    with TestClient(app) as test_client:
+        for name, run in (("one request per row", per_row), ("lpid:batch", batch), ("lpid:batch?stream=true", streamed)):
+            run(test_client, numbers)
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                run(test_client, numbers)
+            print(f"{name:<24}: {(time.perf_counter() - start) / ROUNDS * 1000:7.1f} ms per page of {COMPANIES}")
+    stub.terminate()
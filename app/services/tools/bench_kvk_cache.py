@@ -0,0 +1,107 @@
+"""
+Effect of the KvK response cache on portal-like traffic against the local stub
+of bench_kvk_client. USERS threads each make PAGE_VIEWS page views; a page view
+looks up the LPID and company certificate of one KvK number, LOOKUPS_PER_PAGE
+times each, with numbers drawn from a Zipf-like distribution over COMPANIES.
+Also measures a cold burst of BURST concurrent lookups of one number.
+
+Run from the repository root: python -m app.services.tools.bench_kvk_cache
+"""
+import logging
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+from app.clients.kvk_response_cache import KVK_CACHE_MAX_ENTRIES
+from app.services.tools.bench_kvk_client import serve_stub
+
+USERS = 16
+PAGE_VIEWS = 100
+LOOKUPS_PER_PAGE = 3
+COMPANIES = 2000
+BURST = 64
+
+upstream_calls = 0
+upstream_lock = threading.Lock()
+fetch_json = client._get_json
+
+
+def counting_get_json(endpoint, path, timeout):
+    global upstream_calls
+    with upstream_lock:
+        upstream_calls += 1
+    return fetch_json(endpoint, path, timeout)
+
+
+def page_views(seed):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(COMPANIES)]
+    return [str(90000000 + number) for number in rng.choices(range(COMPANIES), weights, k=PAGE_VIEWS)]
+
+
+def run(max_entries):
+    global upstream_calls
+    client.kvk_response_cache.clear()
+    client.kvk_response_cache.max_entries = max_entries
+    upstream_calls = 0
+    latencies = []
+
+    def user(seed):
+        for kvk_nummer in page_views(seed):
+            start = time.perf_counter()
+            for _ in range(LOOKUPS_PER_PAGE):
+                client.KVKBevoegdhedenAPI.get_lpid(kvk_nummer)
+                client.KVKBevoegdhedenAPI.get_company_certificate(kvk_nummer)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=USERS) as executor:
+        list(executor.map(user, range(USERS)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    name = f"cache {max_entries} entries" if max_entries else "no cache"
+    print(
+        f"{name:<20}: {USERS * PAGE_VIEWS / elapsed:6.0f} page views/s, "
+        f"p50 {statistics.median(latencies) * 1000:6.2f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms, "
+        f"{upstream_calls} upstream calls"
+    )
+
+
+def burst(max_entries):
+    global upstream_calls
+    client.kvk_response_cache.clear()
+    client.kvk_response_cache.max_entries = max_entries
+    upstream_calls = 0
+    barrier = threading.Barrier(BURST)
+
+    def lookup(_):
+        barrier.wait()
+        client.KVKBevoegdhedenAPI.get_lpid("90000021")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=BURST) as executor:
+        list(executor.map(lookup, range(BURST)))
+    name = "single-flight" if max_entries else "no cache"
+    print(f"burst of {BURST}, {name:<13}: {(time.perf_counter() - start) * 1000:6.1f} ms, {upstream_calls} upstream calls")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    port = multiprocessing.Value("i", 0)
+    stub = multiprocessing.Process(target=serve_stub, args=(port,), daemon=True)
+    stub.start()
+    while not port.value:
+        time.sleep(0.01)
+    client.BASE_URL = f"http://127.0.0.1:{port.value}"
+    client._get_json = counting_get_json
+    run(0)
+    run(KVK_CACHE_MAX_ENTRIES)
+    run(256)
+    burst(0)
+    burst(KVK_CACHE_MAX_ENTRIES)
+    print(client.kvk_response_cache.stats())
+    stub.terminate()
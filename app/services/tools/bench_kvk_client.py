@@ -0,0 +1,145 @@
+"""
+Throughput and latency of the KvK API clients against a local stub server: the
+previous client (a new `requests` connection per call) from worker threads and
+from an event loop (as the `async def` proxy routes called it, blocking the
+loop), the pooled sync facade from worker threads, and the async client from
+one event loop. The stub runs in
+its own process and answers every request with an LPID-sized JSON document
+after UPSTREAM_LATENCY_SECONDS (POSTs for KvK numbers ending in 0 with a 404).
+
+Run from the repository root: python -m app.services.tools.bench_kvk_client
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+
+CALLS = 2000
+CONCURRENCY = (1, 16, 64)
+UPSTREAM_LATENCY_SECONDS = 0.002
+BODY = json.dumps({
+    "naam": "Stub B.V.", "kvkNummer": "90000021", "rechtsvorm": "BeslotenVennootschap",
+    "adressen": [{"straatnaam": "Stubstraat", "huisnummer": 1, "postcode": "1234AB", "plaats": "Utrecht"}],
+}).encode()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # As production servers do; otherwise delayed ACKs stall every keep-alive response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(UPSTREAM_LATENCY_SECONDS)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(UPSTREAM_LATENCY_SECONDS)
+        if self.path.endswith("0"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stub(port):
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+
+def previous_get_lpid(kvk_nummer):
+    response = requests.get(f"{client.BASE_URL}/lpid/{kvk_nummer}")
+    response.raise_for_status()
+    return response.json()
+
+
+def run_threads(call, concurrency):
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        call("90000021")
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(CALLS)))
+    return time.perf_counter() - start, latencies
+
+
+async def blocking_get_lpid(kvk_nummer):
+    return previous_get_lpid(kvk_nummer)
+
+
+def run_async(call, concurrency):
+    latencies = []
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed():
+            async with semaphore:
+                start = time.perf_counter()
+                await call("90000021")
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(timed() for _ in range(CALLS)))
+        elapsed = time.perf_counter() - start
+        await client.kvk_api.aclose()
+        return elapsed
+
+    return asyncio.run(main()), latencies
+
+
+def report(name, concurrency, elapsed, latencies):
+    latencies.sort()
+    print(
+        f"{name:<22} concurrency {concurrency:>3}: {CALLS / elapsed:7.0f} req/s, "
+        f"p50 {statistics.median(latencies) * 1000:6.2f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    port = multiprocessing.Value("i", 0)
+    stub = multiprocessing.Process(target=serve_stub, args=(port,), daemon=True)
+    stub.start()
+    while not port.value:
+        time.sleep(0.01)
+    client.BASE_URL = f"http://127.0.0.1:{port.value}"
+    # Every call should reach the stub
+    client.kvk_response_cache.max_entries = 0
+    print(f"HTTP/2 available: {client.HTTP2_AVAILABLE} (the stub speaks HTTP/1.1)")
+    for concurrency in CONCURRENCY:
+        report("requests in threads", concurrency, *run_threads(previous_get_lpid, concurrency))
+        report("pooled sync facade", concurrency, *run_threads(client.KVKBevoegdhedenAPI.get_lpid, concurrency))
+        report("requests in event loop", concurrency, *run_async(blocking_get_lpid, concurrency))
+        report("async client", concurrency, *run_async(client.kvk_api.get_lpid, concurrency))
+    stub.terminate()
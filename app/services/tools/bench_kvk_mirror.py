@@ -0,0 +1,173 @@
+"""
+Local KvK mirror against a stub upstream (in its own process) that serves
+COMPANIES company certificates with two authorised persons each:
+
+- sync passes: a first pass filling an empty mirror, a pass with nothing
+  changed, and one after CHANGED_SHARE of the certificates changed upstream;
+  rows written per pass;
+- lookups: LPID + company certificate for LOOKUPS numbers from USERS threads,
+  from the upstream (response cache disabled) and from the mirror;
+- natural-person lookups: upstream POSTs versus the mirror's person index,
+  which answers them while the upstream's circuit breaker is open.
+
+Run from the repository root: python -m app.services.tools.bench_kvk_mirror
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+from app.clients.kvk_mirror import KVKMirror
+from app.clients.kvk_person_cache import NATURAL_PERSON_COMPANY_CERTIFICATE
+from app.clients.kvk_upstream_policy import OPEN, EndpointPolicy
+from app.services import kvk_mirror_sync
+from app.services.tools.bench_kvk_client import UPSTREAM_LATENCY_SECONDS, StubServer
+
+COMPANIES = 1000
+LOOKUPS = 4000
+PERSON_LOOKUPS = 2000
+USERS = 16
+CHANGED_SHARE = 0.05
+
+generation = multiprocessing.Value("i", 0)
+
+
+def certificate(kvk_nummer):
+    number = int(kvk_nummer) - 90000000
+    # Bumping the generation changes the legal name of every twentieth company
+    version = generation.value if number % int(1 / CHANGED_SHARE) == 0 else 0
+    return {
+        "data": {
+            "id": f"company-certificate-{kvk_nummer}",
+            "registration_number": kvk_nummer,
+            "legal_person_name": f"Stub {number} B.V. ({version})",
+            "legal_form": "BeslotenVennootschap",
+            "postal_address": "Stubstraat 1, 1234AB Utrecht",
+            "date_of_registration": "01-01-2020",
+            "electronic_address": f"info@stub{number}.nl",
+            "authorized_persons": [
+                {"full_name": f"Voornaam{number} Achternaam{number}", "date_of_birth": "01-01-1980"},
+                {"full_name": f"Voornaam{number % 100} Gedeeld", "date_of_birth": "02-02-1970"},
+            ],
+        },
+        "metadata": {"source": "stub"},
+    }
+
+
+class MirrorStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(UPSTREAM_LATENCY_SECONDS)
+        kind, kvk_nummer = self.path.strip("/").split("/")
+        if kind == "lpid":
+            self.reply({"data": {"id": f"lpid-{kvk_nummer}", "registration_number": kvk_nummer}})
+        else:
+            self.reply(certificate(kvk_nummer))
+
+    def do_POST(self):
+        # The upstream resolves a person across all companies it knows of
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(UPSTREAM_LATENCY_SECONDS)
+        number = int(payload["givenName"].removeprefix("Voornaam"))
+        self.reply([certificate(str(90000000 + number))])
+
+    def reply(self, document):
+        body = json.dumps(document).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    server = StubServer(("127.0.0.1", 0), MirrorStubHandler)
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+
+def timed_calls(call, arguments):
+    latencies = []
+
+    def timed(argument):
+        start = time.perf_counter()
+        call(argument)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=USERS) as executor:
+        list(executor.map(timed, arguments))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(arguments) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def report(name, result):
+    rate, p50, p99 = result
+    print(f"{name:<32}: {rate:7.0f}/s, p50 {p50 * 1000:6.2f} ms, p99 {p99 * 1000:6.2f} ms")
+
+
+def sync_pass(mirror, name):
+    start = time.perf_counter()
+    counts = asyncio.run(kvk_mirror_sync.sync_once(mirror))
+    written = counts["added"] + counts["changed"]
+    print(f"sync pass, {name:<21}: {(time.perf_counter() - start) * 1000:6.0f} ms, {written} of {2 * COMPANIES} records rewritten {counts}")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    port = multiprocessing.Value("i", 0)
+    stub = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+    stub.start()
+    while not port.value:
+        time.sleep(0.01)
+    client.BASE_URL = f"http://127.0.0.1:{port.value}"
+    client.kvk_response_cache.max_entries = 0
+    client.kvk_person_cache.max_entries = 0
+    numbers = [str(90000000 + number) for number in range(COMPANIES)]
+    kvk_mirror_sync.KVK_MIRROR_KVK_NUMBERS[:] = numbers
+
+    with tempfile.TemporaryDirectory() as directory:
+        mirror = KVKMirror(os.path.join(directory, "kvk-mirror.sqlite3"))
+        sync_pass(mirror, "empty mirror")
+        sync_pass(mirror, "nothing changed")
+        generation.value += 1
+        sync_pass(mirror, f"{CHANGED_SHARE:.0%} changed")
+
+        rng = random.Random(0)
+        lookups = rng.choices(numbers, k=LOOKUPS)
+        persons = [
+            (f"Voornaam{number}", f"Achternaam{number}", "1980-01-01") for number in rng.choices(range(COMPANIES), k=PERSON_LOOKUPS)
+        ]
+
+        def lookup(kvk_nummer):
+            client.KVKBevoegdhedenAPI.get_lpid(kvk_nummer)
+            client.KVKBevoegdhedenAPI.get_company_certificate(kvk_nummer)
+
+        def person_lookup(person):
+            assert client.KVKBevoegdhedenAPI.get_natural_person_company_certificate(*person)
+
+        client.kvk_mirror = None
+        report("lookups, upstream", timed_calls(lookup, lookups))
+        report("natural-person, upstream", timed_calls(person_lookup, persons))
+        client.kvk_mirror = mirror
+        report("lookups, mirror", timed_calls(lookup, lookups))
+        breaker = EndpointPolicy(NATURAL_PERSON_COMPANY_CERTIFICATE, breaker_reset_seconds=3600)
+        breaker.state, breaker._opened_at = OPEN, time.monotonic()
+        client.kvk_upstream.endpoints[NATURAL_PERSON_COMPANY_CERTIFICATE] = breaker
+        report("natural-person, breaker open", timed_calls(person_lookup, persons))
+        print(mirror.stats())
+    stub.terminate()
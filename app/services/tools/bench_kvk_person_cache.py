@@ -0,0 +1,87 @@
+"""
+Upstream signatory-rights checks with and without the personal-data cache, for
+PoR-decision-like traffic against the local stub of bench_kvk_client: USERS
+threads make CHECKS checks in total, drawn from a Zipf-like distribution over
+PERSONS (person, company) pairs. Every tenth company answers 404, which is
+cached as a negative result. The repeat rate is the share of checks whose
+fields were already seen; the upstream call volume should drop by about as much.
+
+Run from the repository root: python -m app.services.tools.bench_kvk_person_cache
+"""
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+from app.clients.kvk_person_cache import KVK_PERSON_CACHE_MAX_ENTRIES, kvk_person_cache
+from app.services.tools.bench_kvk_client import serve_stub
+
+USERS = 16
+CHECKS = 4000
+PERSONS = (500, 2000, 10000)
+
+upstream_calls = 0
+upstream_lock = threading.Lock()
+post_json = client._post_json
+
+
+def counting_post_json(endpoint, path, payload, timeout):
+    global upstream_calls
+    with upstream_lock:
+        upstream_calls += 1
+    return post_json(endpoint, path, payload, timeout)
+
+
+def workload(persons):
+    rng = random.Random(persons)
+    weights = [1 / (rank + 1) for rank in range(persons)]
+    return [
+        (str(90000000 + (number * 7) % 1000), f"Achternaam{number}", f"Voornaam{number}", "01-01-1980")
+        for number in rng.choices(range(persons), weights, k=CHECKS)
+    ]
+
+
+def run(checks, max_entries):
+    global upstream_calls
+    kvk_person_cache.clear()
+    kvk_person_cache.max_entries = max_entries
+    upstream_calls = 0
+
+    def check(fields):
+        try:
+            client.KVKBevoegdhedenAPI.check_signatory_right(*fields)
+        except httpx.HTTPStatusError:
+            pass
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=USERS) as executor:
+        list(executor.map(check, checks))
+    return time.perf_counter() - start, upstream_calls
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    port = multiprocessing.Value("i", 0)
+    stub = multiprocessing.Process(target=serve_stub, args=(port,), daemon=True)
+    stub.start()
+    while not port.value:
+        time.sleep(0.01)
+    client.BASE_URL = f"http://127.0.0.1:{port.value}"
+    client._post_json = counting_post_json
+    for persons in PERSONS:
+        checks = workload(persons)
+        repeat_rate = 1 - len(set(checks)) / len(checks)
+        uncached_seconds, uncached_calls = run(checks, 0)
+        cached_seconds, cached_calls = run(checks, KVK_PERSON_CACHE_MAX_ENTRIES)
+        print(
+            f"{persons:>6} pairs, repeat rate {repeat_rate:5.1%}: upstream calls {uncached_calls} -> {cached_calls} "
+            f"(-{1 - cached_calls / uncached_calls:5.1%}), {uncached_seconds * 1000:6.0f} ms -> {cached_seconds * 1000:5.0f} ms"
+        )
+    stats = kvk_person_cache.stats()["endpoints"]["signatory-rights"]
+    print(f"negative hits {stats['negative_hits']} of {stats['hits']} hits")
+    stub.terminate()
@@ -0,0 +1,146 @@
+"""
+KvK upstream failure handling against a misbehaving local stub (in its own
+process), through the sync facade with the response cache disabled:
+
+- tail latency: LPID answers take 2 ms, but TAIL_SHARE of them take
+  TAIL_SECONDS; p50/p99 with and without hedged requests;
+- flaky upstream: FLAKY_SHARE of company certificate requests get a 503;
+  success rate with and without retries, and how many retries the budget allowed;
+- hung upstream: requests that never get an answer; how long callers are held
+  before the read timeout and once the circuit breaker opens.
+
+Run from the repository root: python -m app.services.tools.bench_kvk_upstream
+"""
+import logging
+import multiprocessing
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+from app.clients.kvk_response_cache import COMPANY_CERTIFICATE, LPID
+from app.clients.kvk_upstream_policy import EndpointPolicy
+
+CALLS = 2000
+CONCURRENCY = 8
+LATENCY_SECONDS = 0.002
+TAIL_SHARE = 0.03
+TAIL_SECONDS = 0.1
+FLAKY_SHARE = 0.2
+HUNG_CALLS = 30
+HUNG_TIMEOUT_SECONDS = 0.5
+
+
+class MisbehavingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.startswith("/lpid/hung"):
+            time.sleep(60)
+        if self.path.startswith("/lpid/"):
+            time.sleep(TAIL_SECONDS if random.random() < TAIL_SHARE else LATENCY_SECONDS)
+        else:
+            time.sleep(LATENCY_SECONDS)
+        code = 503 if self.path.startswith("/company-certificate/") and random.random() < FLAKY_SHARE else 200
+        body = b'{"kvkNummer": "90000021"}'
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MisbehavingHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+
+def reset(endpoint, hedge=False, retry_attempts=0):
+    client.kvk_upstream.endpoints[endpoint] = EndpointPolicy(endpoint)
+    client.kvk_upstream.hedge = hedge
+    client.kvk_upstream.retry_attempts = retry_attempts
+    return client.kvk_upstream.endpoints[endpoint]
+
+
+def run(call):
+    latencies, failures = [], 0
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            call(i)
+            return time.perf_counter() - start
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        for latency in executor.map(timed, range(CALLS)):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    latencies.sort()
+    return latencies, failures
+
+
+def tail_latency(hedge):
+    policy = reset(LPID, hedge=hedge)
+    latencies, _ = run(lambda i: client.KVKBevoegdhedenAPI.get_lpid(str(i)))
+    stats = policy.stats()
+    print(
+        f"tail latency, hedging {'on ' if hedge else 'off'}: p50 {statistics.median(latencies) * 1000:6.2f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms, "
+        f"{stats['hedges']} hedges ({stats['hedges'] / CALLS:.1%} extra requests), {stats['hedge_wins']} won"
+    )
+
+
+def flaky(retry_attempts):
+    policy = reset(COMPANY_CERTIFICATE, retry_attempts=retry_attempts)
+    _, failures = run(lambda i: client.KVKBevoegdhedenAPI.get_company_certificate(str(i)))
+    stats = policy.stats()
+    print(
+        f"flaky upstream, {retry_attempts} retries: {1 - failures / CALLS:6.1%} succeeded, "
+        f"{stats['retries']} retries ({stats['retries'] / CALLS:.1%} extra requests), {stats['retries_denied']} denied by the budget"
+    )
+
+
+def hung():
+    policy = reset(LPID)
+    held = []
+    for i in range(HUNG_CALLS):
+        start = time.perf_counter()
+        try:
+            client.KVKBevoegdhedenAPI.get_lpid(f"hung{i}", timeout=HUNG_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+        held.append(time.perf_counter() - start)
+    print(
+        f"hung upstream: first call held {held[0] * 1000:.0f} ms, calls after the breaker opened "
+        f"held {max(held[-5:]) * 1000:.2f} ms at most; breaker {policy.state} after {policy.counters['failures']} failures"
+    )
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    port = multiprocessing.Value("i", 0)
+    stub = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+    stub.start()
+    while not port.value:
+        time.sleep(0.01)
+    client.BASE_URL = f"http://127.0.0.1:{port.value}"
+    client.kvk_response_cache.max_entries = 0
+    tail_latency(False)
+    tail_latency(True)
+    flaky(0)
+    flaky(2)
+    hung()
+    stub.terminate()
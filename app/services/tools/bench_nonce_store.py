@@ -0,0 +1,67 @@
+"""
+Expiring nonces with the timing wheel versus a dict scanned for expired
+entries, at a steady state of LIVE entries: one new nonce per simulated
+request, time advancing so that nonces live C_NONCE_TTL_SECONDS. Also the cost
+of NonceStore.issue + use (one proof) in memory. Reports the mean cost per
+request and the longest single expiry pass (the stall one request sees).
+
+Run from the repository root: python -m app.services.tools.bench_nonce_store
+"""
+import time
+
+from app.services.nonce_store import NonceStore, TimingWheel
+
+TTL_SECONDS = 300
+LIVE = (10000, 100000, 1000000)
+REQUESTS = 200000
+
+
+def wheel_expiry(live):
+    seconds_per_request = TTL_SECONDS / live
+    entries = {}
+    wheel = TimingWheel(now=0)
+    stall = 0.0
+    start = time.perf_counter()
+    for number in range(live + REQUESTS):
+        now = number * seconds_per_request
+        entries[number] = now + TTL_SECONDS
+        wheel.schedule(number, now + TTL_SECONDS)
+        pass_start = time.perf_counter()
+        for key in wheel.advance(now):
+            del entries[key]
+        stall = max(stall, time.perf_counter() - pass_start)
+    return (time.perf_counter() - start) / (live + REQUESTS) * 1e6, stall * 1000
+
+
+def scan_expiry(live):
+    # Purge by scanning the whole dict once per second of simulated time
+    seconds_per_request = TTL_SECONDS / live
+    entries = {}
+    next_scan = 1.0
+    stall = 0.0
+    start = time.perf_counter()
+    for number in range(live + REQUESTS):
+        now = number * seconds_per_request
+        entries[number] = now + TTL_SECONDS
+        if now >= next_scan:
+            pass_start = time.perf_counter()
+            for key in [key for key, expires_at in entries.items() if expires_at <= now]:
+                del entries[key]
+            stall = max(stall, time.perf_counter() - pass_start)
+            next_scan = now + 1.0
+    return (time.perf_counter() - start) / (live + REQUESTS) * 1e6, stall * 1000
+
+
+if __name__ == "__main__":
+    for live in LIVE:
+        wheel_us, wheel_stall_ms = wheel_expiry(live)
+        scan_us, scan_stall_ms = scan_expiry(live)
+        print(f"{live:8} live nonces: timing wheel {wheel_us:5.2f} us/request (max stall {wheel_stall_ms:6.2f} ms), "
+              f"scan once per second {scan_us:5.2f} us/request (max stall {scan_stall_ms:6.2f} ms)")
+
+    store = NonceStore(db_path="")
+    start = time.perf_counter()
+    for number in range(REQUESTS):
+        nonce, _ = store.issue("access-token")
+        store.use("access-token", nonce, str(number))
+    print(f"issue + use: {(time.perf_counter() - start) / REQUESTS * 1e6:.2f} us, {store.stats()}")
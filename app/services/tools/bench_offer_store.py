@@ -0,0 +1,45 @@
+"""
+Offer store lookups with a growing number of outstanding offers: creating an
+offer, fetching it by id and redeeming its pre-authorized code, in memory only
+and with the SQLite backend. Lookup cost should not depend on the number of
+outstanding offers.
+
+Run from the repository root: python -m app.services.tools.bench_offer_store
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from app.services.offer_store import OfferStore
+
+OUTSTANDING = (10000, 100000, 1000000)
+ROUNDS = 10000
+
+
+def per_call_us(function, arguments):
+    start = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return (time.perf_counter() - start) / len(arguments) * 1e6
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        for label, db_path in (("memory", ""), ("sqlite", os.path.join(directory, "credential-offers.sqlite3"))):
+            for outstanding in OUTSTANDING:
+                if db_path and os.path.exists(db_path):
+                    os.remove(db_path)
+                tracemalloc.start()
+                store = OfferStore(db_path=db_path)
+                start = time.perf_counter()
+                offers = [store.create("LPIDSdJwt", f"{number:08d}") for number in range(outstanding)]
+                create_us = (time.perf_counter() - start) / outstanding * 1e6
+                memory = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                sample = random.sample(offers, ROUNDS)
+                get_us = per_call_us(store.get_offer, [offer_id for offer_id, _ in sample])
+                redeem_us = per_call_us(store.redeem, [code for _, code in sample])
+                print(f"{label:6} {outstanding:8} offers: create {create_us:6.1f} us, get_offer {get_us:5.2f} us, "
+                      f"redeem {redeem_us:6.1f} us, {memory / outstanding:5.0f} bytes/offer in memory")
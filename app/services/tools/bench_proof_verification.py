@@ -0,0 +1,54 @@
+"""
+Proof-of-possession verification with and without the holder key cache: a
+batch of proofs signed by one wallet key, and proofs from a pool of returning
+wallets. Nonce bookkeeping is included (in-memory nonce store).
+
+Run from the repository root: python -m app.services.tools.bench_proof_verification
+"""
+import logging
+import random
+import time
+import uuid
+
+from jose import jwt
+
+from app.services.key_manager import KeyManager
+from app.services.nonce_store import NonceStore
+from app.services.proof_verifier import HolderKeyCache, ProofVerifier
+
+AUDIENCE = "https://kvk-issuance-service.nieuwlaar.com/mini-suomi/issuers/kvk"
+PROOFS = 5000
+WALLETS = 200
+
+
+def make_proofs(holders, nonce):
+    return [
+        jwt.encode(
+            {"aud": AUDIENCE, "iat": int(time.time()), "nonce": nonce, "jti": str(uuid.uuid4())},
+            holder.jose_key,
+            algorithm="ES256",
+            headers={"typ": "openid4vci-proof+jwt", "jwk": holder.public_jwk},
+        )
+        for holder in holders
+    ]
+
+
+def run(label, holders):
+    for cache_label, max_entries in (("no key cache", 0), ("key cache", 4096)):
+        nonce_store = NonceStore(db_path="")
+        verifier = ProofVerifier([AUDIENCE], nonce_store, HolderKeyCache(max_entries))
+        nonce, _ = nonce_store.issue("access-token")
+        proofs = make_proofs(holders, nonce)
+        start = time.perf_counter()
+        for proof_jwt in proofs:
+            verifier.verify(proof_jwt, "access-token")
+        elapsed_us = (time.perf_counter() - start) / len(proofs) * 1e6
+        print(f"{label:26} {cache_label:13} {elapsed_us:7.1f} us/proof   {verifier.key_cache.stats()['hit_ratio']:.2f} hit ratio")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    wallet = KeyManager.generate("ES256").active_key
+    run("one wallet, batch proofs", [wallet] * PROOFS)
+    wallets = [KeyManager.generate("ES256").active_key for _ in range(WALLETS)]
+    run(f"{WALLETS} returning wallets", [random.choice(wallets) for _ in range(PROOFS)])
@@ -0,0 +1,114 @@
+"""
+Flat (one disclosure per top-level claim) versus recursive disclosures for the
+EUCC credential: issuance cost and the size of presentations that reveal only
+part of the credential.
+
+Run from the repository root: python -m app.services.tools.bench_sd_jwt
+"""
+import base64
+import hashlib
+import json
+import logging
+import timeit
+from datetime import datetime
+
+from jose import jwt
+
+from app.services import mini_suomi
+from app.services.credential_templates import get_template
+from app.services.tools.bench_batch_issuance import COMPANY_CERTIFICATE
+
+ROUNDS = 500
+# Number of authorized persons on the company certificate
+REPRESENTATIVE_COUNTS = (2, 10, 40)
+
+# Claims revealed by each presentation; a path ending at a claim reveals it entirely
+PRESENTATIONS = {
+    "legal name": [("legalName",)],
+    "name + 1 representative's name": [
+        ("legalName",),
+        ("legalRepresentative", 0, "given_name"),
+        ("legalRepresentative", 0, "family_name"),
+    ],
+    "name + registered place": [("legalName",), ("registeredAddress", "post_name")],
+    "everything": None,
+}
+
+
+def decode(disclosure):
+    return json.loads(base64.urlsafe_b64decode(disclosure + "=" * (-len(disclosure) % 4)))
+
+
+def digest(disclosure):
+    # Same digest as create_disclosures: over the disclosure JSON
+    raw = base64.urlsafe_b64decode(disclosure + "=" * (-len(disclosure) % 4))
+    return base64.urlsafe_b64encode(hashlib.sha256(raw).digest()).decode().rstrip("=")
+
+
+def present(sd_jwt, paths):
+    """The issuer JWT plus the disclosures needed for `paths` (all with paths=None)."""
+    parts = sd_jwt.split("~")
+    if paths is None:
+        return sd_jwt
+    disclosures = {digest(disclosure): disclosure for disclosure in parts[1:] if disclosure}
+    revealed = []
+
+    def walk(value, paths):
+        reveal_all = any(len(path) == 0 for path in paths)
+        if isinstance(value, dict):
+            for sd_hash in value.get("_sd", []):
+                disclosure = disclosures[sd_hash]
+                _, name, member = decode(disclosure)
+                selected = [path[1:] for path in paths if path and path[0] == name]
+                if reveal_all or selected:
+                    revealed.append(disclosure)
+                    walk(member, [()] if reveal_all else selected)
+        elif isinstance(value, list):
+            for index, element in enumerate(value):
+                selected = [path[1:] for path in paths if path and path[0] == index]
+                if isinstance(element, dict) and "..." in element and (reveal_all or selected):
+                    disclosure = disclosures[element["..."]]
+                    revealed.append(disclosure)
+                    walk(decode(disclosure)[1], [()] if reveal_all else selected)
+
+    walk(jwt.get_unverified_claims(parts[0]), paths)
+    return "~".join([parts[0], *revealed]) + "~"
+
+
+def compare(claims, template, now):
+    signing_key = mini_suomi.issuer_key_manager.active_key
+    headers = mini_suomi.credential_headers(signing_key)
+    payload = mini_suomi.credential_payload("EUCCSdJwt", now)
+    for label, recursive_claims in (("flat", ()), ("recursive", template.recursive_claims)):
+        disclose_us = timeit.timeit(
+            lambda: mini_suomi.create_disclosures(claims, recursive_claims), number=ROUNDS
+        ) / ROUNDS * 1e6
+        issue_us = timeit.timeit(
+            lambda: mini_suomi.build_sd_jwt(signing_key.jose_key, headers, payload, claims, recursive_claims),
+            number=ROUNDS
+        ) / ROUNDS * 1e6
+        sd_jwt = mini_suomi.build_sd_jwt(signing_key.jose_key, headers, payload, claims, recursive_claims)
+        print(f"{label}: {sd_jwt.count('~') - 1} disclosures, create_disclosures {disclose_us:7.1f} us, "
+              f"disclosures + signing {issue_us:7.1f} us, issued SD-JWT {len(sd_jwt)} bytes")
+        for presentation, paths in PRESENTATIONS.items():
+            print(f"  presentation '{presentation}': {len(present(sd_jwt, paths))} bytes")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    template = get_template("EUCCSdJwt")
+    now = datetime.utcnow()
+
+    for representative_count in REPRESENTATIVE_COUNTS:
+        company_certificate = {
+            **COMPANY_CERTIFICATE,
+            "data": {
+                **COMPANY_CERTIFICATE["data"],
+                "authorized_persons": [
+                    {"full_name": f"Bestuurder{index} van Dijk", "date_of_birth": "05-06-1970"}
+                    for index in range(representative_count)
+                ],
+            },
+        }
+        print(f"--- {representative_count} legal representatives ---")
+        compare(template.build_claims(company_certificate, now), template, now)
@@ -0,0 +1,70 @@
+"""
+Throughput and latency of EUCC issuance with disclosures and signing done
+inline (SIGNING_WORKERS=0, the default) or by the signing worker pool at
+different sizes. CLIENTS threads issue one credential per call, as concurrent
+requests would; the KvK API is stubbed without latency.
+
+Run from the repository root: python -m app.services.tools.bench_signing_service
+"""
+import logging
+import os
+import statistics
+import threading
+import time
+
+from app.clients.kvk_bevoegdheden_rest_api import KVKBevoegdhedenAPI
+from app.services import mini_suomi
+from app.services.signing_service import SigningService
+from app.services.tools.bench_batch_issuance import COMPANY_CERTIFICATE, LPID
+
+CLIENTS = 16
+CALLS_PER_CLIENT = 100
+POOL_SIZES = (0, 1, 2, 4)
+BATCH_WINDOWS_MS = (0, 2)
+
+
+def run_clients():
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(CALLS_PER_CLIENT):
+            start = time.perf_counter()
+            mini_suomi.generate_credential_jwt("EUCCSdJwt", "90000021")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(CLIENTS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return len(latencies) / duration, statistics.median(latencies) * 1000, percentile(0.95), percentile(0.99)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    KVKBevoegdhedenAPI.get_lpid = staticmethod(lambda kvk_number: LPID)
+    KVKBevoegdhedenAPI.get_company_certificate = staticmethod(lambda kvk_number: COMPANY_CERTIFICATE)
+    print(f"{os.cpu_count()} CPUs, {CLIENTS} concurrent clients")
+
+    for processes in POOL_SIZES:
+        for batch_window_ms in (BATCH_WINDOWS_MS if processes else (None,)):
+            if processes:
+                mini_suomi.signing_service = SigningService(
+                    mini_suomi.issuer_key_manager, processes=processes, batch_window_ms=batch_window_ms
+                )
+                # Spawn the workers and warm them up outside the measurement
+                mini_suomi.generate_credential_jwt("EUCCSdJwt", "90000021")
+            label = f"{processes} workers, {batch_window_ms} ms window" if processes else "inline"
+            throughput, p50, p95, p99 = run_clients()
+            print(f"{label:26} {throughput:7.0f} cred/s   p50 {p50:6.1f} ms   p95 {p95:6.1f} ms   p99 {p99:6.1f} ms")
+            if mini_suomi.signing_service is not None:
+                print(f"{'':26} {mini_suomi.signing_service.stats()}")
+                mini_suomi.signing_service.shutdown()
+                mini_suomi.signing_service = None
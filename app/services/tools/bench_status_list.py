@@ -0,0 +1,71 @@
+"""
+Cost of serving a status list token for a list of STATUS_LIST_SIZE credentials
+after revoking a batch of them: recompressing the whole bitstring versus only
+the chunks holding changed bits, plus signing.
+
+Run from the repository root: python -m app.services.tools.bench_status_list
+"""
+import logging
+import os
+import random
+import tempfile
+import time
+import zlib
+
+from app.services import mini_suomi
+from app.services.status_list import COMPRESSION_LEVEL, STATUS_LIST_SIZE, StatusList, StatusListService
+
+ROUNDS = 20
+REVOCATION_BATCHES = (1, 100, 10000)
+# Share of credentials already revoked before measuring
+REVOKED_SHARE = 0.01
+
+
+def timed(function, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    random.seed(1)
+    status_list = StatusList(1, STATUS_LIST_SIZE)
+    for index in random.sample(range(STATUS_LIST_SIZE), int(STATUS_LIST_SIZE * REVOKED_SHARE)):
+        status_list.set(index, 1)
+    compressed = status_list.compressed()
+    assert zlib.decompress(compressed) == bytes(status_list.bits)
+    print(f"{STATUS_LIST_SIZE} entries, {len(status_list.bits)} bytes in memory, "
+          f"{len(compressed)} bytes compressed (single-stream zlib: {len(zlib.compress(status_list.bits, COMPRESSION_LEVEL))})")
+
+    for batch in REVOCATION_BATCHES:
+        def full():
+            for index in random.sample(range(STATUS_LIST_SIZE), batch):
+                status_list.set(index, 1)
+            zlib.compress(status_list.bits, COMPRESSION_LEVEL)
+
+        def incremental():
+            for index in random.sample(range(STATUS_LIST_SIZE), batch):
+                status_list.set(index, 1)
+            status_list.compressed()
+
+        print(f"revoke {batch:5}: full recompression {timed(full):7.2f} ms, incremental {timed(incremental):7.2f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        service = StatusListService(mini_suomi.issuer_key_manager, mini_suomi.CREDENTIAL_ISSUER,
+                                    db_path=os.path.join(directory, "status-lists.sqlite3"))
+        entries = service.allocate(10000)
+        list_id = entries[0][0]
+        uri = mini_suomi.status_list_uri(list_id)
+        service.token(list_id, uri)
+        print(f"allocate 1 index: {timed(lambda: service.allocate(1), rounds=10000) * 1000:.2f} us")
+        print(f"cached token: {timed(lambda: service.token(list_id, uri), rounds=1000) * 1000:.2f} us")
+        batch = iter(range(0, len(entries), 100))
+
+        def revoke_and_sign():
+            start = next(batch)
+            service.set_status(entries[start:start + 100])
+            service.token(list_id, uri)
+
+        print(f"revoke 100 + re-sign token: {timed(revoke_and_sign):.2f} ms")
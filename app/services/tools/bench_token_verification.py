@@ -0,0 +1,45 @@
+"""
+Throughput of /rdw-niscy/auth/validate and /rdw-niscy/user/profile with the
+verified-token cache disabled and enabled, measured in process with TestClient
+(same bearer token on every call, as sent by one UI session).
+
+Run from the repository root: python -m app.services.tools.bench_token_verification
+"""
+import logging
+import time
+import timeit
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.routes import rdw_niscy
+from app.services.token_cache import verified_token_cache, TOKEN_CACHE_MAX_ENTRIES
+
+REQUESTS = 2000
+VERIFY_CALLS = 50000
+
+
+def requests_per_second(client, path, headers):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.get(path, headers=headers)
+    return REQUESTS / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    client = TestClient(app)
+    token = rdw_niscy.create_access_token({
+        "sub": rdw_niscy.create_user_id("Jan", "Jansen", "1980-01-01"),
+        "given_name": "Jan",
+        "family_name": "Jansen",
+        "birth_date": "1980-01-01",
+    })
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for label, max_entries in (("no cache", 0), ("cache", TOKEN_CACHE_MAX_ENTRIES or 4096)):
+        verified_token_cache.max_entries = max_entries
+        verify_us = timeit.timeit(lambda: rdw_niscy.verify_token(token), number=VERIFY_CALLS) / VERIFY_CALLS * 1e6
+        print(f"{label:9} verify_token: {verify_us:6.2f} us/call")
+        for path in ("/rdw-niscy/auth/validate", "/rdw-niscy/user/profile"):
+            print(f"{label:9} {path}: {requests_per_second(client, path, headers):8.0f} req/s")
@@ -0,0 +1,44 @@
+"""
+Importing the app or its routes opens the SQLite stores; keep them out of the
+working directory while testing.
+"""
+import asyncio
+import os
+import tempfile
+
+import httpx
+import pytest
+
+_store_directory = tempfile.mkdtemp(prefix="app-tests-")
+for variable, file_name in (
+    ("OFFER_DB_PATH", "credential-offers.sqlite3"),
+    ("STATUS_LIST_DB_PATH", "status-lists.sqlite3"),
+):
+    os.environ.setdefault(variable, os.path.join(_store_directory, file_name))
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Stub KvK upstream answering LPID and company certificate lookups; yields the requested paths."""
+    # Imported here, after the store paths above are set
+    from app.clients import kvk_bevoegdheden_rest_api as client
+    from app.clients.kvk_response_cache import kvk_response_cache
+
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.path)
+        await asyncio.sleep(0.01)
+        kind, kvk_nummer = request.url.path.strip("/").split("/")
+        if kvk_nummer == "404":
+            return httpx.Response(404, json={"error": "not found"})
+        return httpx.Response(200, json={"data": {"id": f"{kind}-{kvk_nummer}"}})
+
+    options = client.client_options()
+    monkeypatch.setattr(
+        client, "client_options", lambda: {**options, "base_url": "https://kvk.test", "transport": httpx.MockTransport(handler)}
+    )
+    monkeypatch.setattr(client, "kvk_mirror", None)
+    kvk_response_cache.clear()
+    yield requests
+    kvk_response_cache.clear()
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+from app.services import browser_broker
+
+calls = []
+
+
+@browser_broker.brokered("test-start-flow")
+async def start_flow(session_id: str, background_tasks: BackgroundTasks):
+    background_tasks.add_task(calls.append, ("background", session_id))
+    calls.append(("start", session_id))
+    return {"session_id": session_id, "status": "started"}
+
+
+@browser_broker.brokered("test-missing-session")
+async def missing_session(session_id: str):
+    raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+
+
+@pytest.fixture
+def broker(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / "broker.sock")
+    server = browser_broker.BrowserBrokerServer(socket_path, browser_broker._BrokerRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(browser_broker, "BROKER_SOCKET", socket_path)
+    calls.clear()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+
+
+def test_runs_locally_without_a_broker(monkeypatch):
+    monkeypatch.setattr(browser_broker, "BROKER_SOCKET", None)
+    calls.clear()
+    background_tasks = BackgroundTasks()
+    result = asyncio.run(start_flow(session_id="local", background_tasks=background_tasks))
+    assert result == {"session_id": "local", "status": "started"}
+    # The route's own background tasks run after the response
+    assert calls == [("start", "local")] and len(background_tasks.tasks) == 1
+
+
+def test_calls_are_forwarded_with_broker_side_background_tasks(broker):
+    result = asyncio.run(start_flow(session_id="abc", background_tasks=BackgroundTasks()))
+    assert result == {"session_id": "abc", "status": "started"}
+    for _ in range(100):
+        if len(calls) == 2:
+            break
+        threading.Event().wait(0.01)
+    assert calls == [("start", "abc"), ("background", "abc")]
+
+
+def test_broker_errors_keep_their_status(broker):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(missing_session(session_id="gone"))
+    assert (error.value.status_code, error.value.detail) == (404, "Session gone not found")
+    with pytest.raises(HTTPException) as error:
+        browser_broker.call("no-such-operation")
+    assert error.value.status_code == 400
+
+
+def test_unreachable_broker_is_a_503(tmp_path, monkeypatch):
+    monkeypatch.setattr(browser_broker, "BROKER_SOCKET", str(tmp_path / "absent.sock"))
+    with pytest.raises(HTTPException) as error:
+        browser_broker.call("test-start-flow", session_id="abc")
+    assert error.value.status_code == 503
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from app.services.credential_templates import (
+    ClaimSpec,
+    credential_configurations_supported,
+    get_template,
+    kvk_date,
+    postal_address,
+)
+
+NOW = datetime(2026, 1, 2, 3, 4, 5)
+METADATA = {"issuer_id": "KVK", "issuing_authority_name": "Kamer van Koophandel", "issuing_country": "NL"}
+CERTIFICATE = {
+    "data": {
+        "id": "company-certificate-90000021",
+        "registration_number": "90000021",
+        "legal_person_name": "Stub B.V.",
+        "legal_form": "BeslotenVennootschap",
+        "postal_address": "Stubstraat 1 1234AB Utrecht",
+        "date_of_registration": "1-2-2020",
+        "electronic_address": "info@stub.nl",
+        "authorized_persons": [
+            {"full_name": "Jan Piet Jansen", "date_of_birth": "01-01-1980"},
+            {"full_name": "Anna de Vries", "date_of_birth": "31-12-1970"},
+        ],
+    },
+    "metadata": METADATA,
+}
+
+
+def test_transforms():
+    assert kvk_date("1-2-2020") == "2020-02-01T00:00:00.000000Z"
+    with pytest.raises(ValueError):
+        kvk_date("31-02-2020")
+    with pytest.raises(ValueError):
+        kvk_date("2020-02-01")
+    assert postal_address("Stubstraat 1 1234AB Utrecht") == {
+        "post_code": "1234AB", "post_name": "Utrecht", "thoroughfare": "Stubstraat 1 1234AB"
+    }
+
+
+def test_company_certificate_claims():
+    template = get_template("EUCCSdJwt")
+    claims = template.build_claims(CERTIFICATE, NOW)
+    assert claims["legalName"] == "Stub B.V."
+    assert claims["registrationDate"] == "2020-02-01T00:00:00.000000Z"
+    assert claims["legalRepresentative"] == [
+        {"role": "J", "legalEntityId": "90000021", "scopeOfRepresentation": "Jointly",
+         "family_name": "Jansen", "given_name": "Jan Piet", "birth_date": "1980-01-01T00:00:00.000000Z"},
+        {"role": "J", "legalEntityId": "90000021", "scopeOfRepresentation": "Jointly",
+         "family_name": "Vries", "given_name": "Anna de", "birth_date": "1970-12-31T00:00:00.000000Z"},
+    ]
+    assert claims["contactPoint"] == {"contactPage": "", "hasEmail": "info@stub.nl", "hasTelephone": ""}
+    assert claims["expiry_date"] == "2027-01-02T03:04:05.000000Z"
+    assert template.recursive_claims == {"registeredAddress", "postalAddress", "legalRepresentative", "contactPoint"}
+
+
+def test_lpid_claims():
+    claims = get_template("LPIDSdJwt").build_claims({"data": CERTIFICATE["data"], "metadata": METADATA}, NOW)
+    assert claims["legal_person_id"] == "company-certificate-90000021"
+    assert claims["authentic_source_name"] == "Kamer van Koophandel"
+    assert claims["issuance_date"] == "2026-01-02T03:04:05.000000Z"
+
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(ValueError, match="Unsupported credential type"):
+        get_template("PIDSdJwt")
+
+
+def test_claim_specs_without_an_accessor_cannot_be_created():
+    class Incomplete(ClaimSpec):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_issuer_metadata_is_generated_from_the_templates():
+    configurations = credential_configurations_supported()
+    assert set(configurations) == {"LPIDSdJwt", "EUCCSdJwt"}
+    assert {"path": ["legalName"], "display": [{"name": "Legal Name", "locale": "en-US"}]} in configurations["EUCCSdJwt"]["claims"]
+    assert "display" not in credential_configurations_supported(include_display=False)["LPIDSdJwt"]
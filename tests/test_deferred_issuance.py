@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.routes import mini_suomi as routes
+from app.services.deferred_issuance import FAILED, ISSUED, PENDING, UNKNOWN, DeferredIssuance
+from app.services.issuance_trace import IssuanceTrace
+
+CONTENT = {"credential": "header.payload.signature~"}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "deferred.sqlite3")
+
+
+def gated_build(release, result=CONTENT):
+    def build():
+        release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return build
+
+
+def poll_until_done(service, transaction_id, access_token):
+    # With a database the result is stored by the build's done-callback
+    deadline = time.monotonic() + 5
+    state, value = service.poll(transaction_id, access_token)
+    while state == PENDING and time.monotonic() < deadline:
+        time.sleep(0.01)
+        state, value = service.poll(transaction_id, access_token)
+    return state, value
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_result_is_handed_out_once_to_the_same_token(db_path, shared):
+    service = DeferredIssuance(workers=1, budget_ms=10, min_interval_seconds=1, db_path=db_path if shared else None)
+    release = threading.Event()
+    build, started_at = service.submit(gated_build(release))
+    transaction_id, interval = service.defer("token", build, started_at)
+    assert interval >= 1
+    assert service.poll(transaction_id, "token")[0] == PENDING
+    release.set()
+    assert service.poll(transaction_id, "other-token") == (UNKNOWN, None)
+    assert poll_until_done(service, transaction_id, "token") == (ISSUED, CONTENT)
+    assert service.poll(transaction_id, "token") == (UNKNOWN, None)
+
+
+def test_workers_sharing_the_database_answer_each_others_transactions(db_path):
+    building, polling = DeferredIssuance(workers=1, db_path=db_path), DeferredIssuance(workers=1, db_path=db_path)
+    release = threading.Event()
+    build, started_at = building.submit(gated_build(release))
+    transaction_id, _ = building.defer("token", build, started_at)
+    assert polling.poll(transaction_id, "token")[0] == PENDING
+    release.set()
+    assert poll_until_done(polling, transaction_id, "token") == (ISSUED, CONTENT)
+    assert building.poll(transaction_id, "token") == (UNKNOWN, None)
+
+
+def test_failed_builds_are_reported_across_workers(db_path):
+    building, polling = DeferredIssuance(workers=1, db_path=db_path), DeferredIssuance(workers=1, db_path=db_path)
+    release = threading.Event()
+    release.set()
+    build, started_at = building.submit(gated_build(release, ValueError("KvK lookup failed")))
+    build.exception(timeout=5)
+    transaction_id, _ = building.defer("token", build, started_at)
+    assert polling.poll(transaction_id, "token") == (FAILED, "KvK lookup failed")
+
+
+def test_expired_transactions_are_unknown(db_path):
+    service = DeferredIssuance(workers=1, result_ttl_seconds=0, db_path=db_path)
+    release = threading.Event()
+    release.set()
+    build, started_at = service.submit(gated_build(release))
+    transaction_id, _ = service.defer("token", build, started_at)
+    assert DeferredIssuance(workers=1, db_path=db_path).poll(transaction_id, "token") == (UNKNOWN, None)
+
+
+def test_deferred_trace_is_finished_when_the_build_is(monkeypatch):
+    release = threading.Event()
+    finished = []
+
+    def build_credential_response(issuance_requests, shape, trace):
+        release.wait(5)
+        trace.record("built")
+        return CONTENT
+
+    monkeypatch.setattr(routes, "build_credential_response", build_credential_response)
+    monkeypatch.setattr(routes.deferred_issuance, "budget_seconds", 0.01)
+    monkeypatch.setattr(routes.trace_recorder, "finish", lambda trace: finished.append([step["step"] for step in trace.to_dict()["steps"]]))
+    trace = IssuanceTrace("credential")
+    content, deferred = asyncio.run(routes.build_or_defer("token", [], "credential", trace))
+    assert content is None and deferred is not None
+    assert finished == []
+    release.set()
+    deadline = time.monotonic() + 5
+    while not finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert finished and finished[0][-2:] == ["deferred", "built"]
@@ -0,0 +1,43 @@
+import base64
+import json
+
+from app.services.issuance_trace import (
+    ISSUANCE_TRACE_HEADER,
+    REDACTED,
+    IssuanceTraceRecorder,
+    decode_disclosure,
+    redact_headers,
+    redact_jwk,
+    redact_jwt,
+)
+
+
+def test_private_material_is_redacted():
+    assert redact_jwk({"kty": "EC", "x": "x", "y": "y", "d": "secret"}) == {"kty": "EC", "x": "x", "y": "y", "d": REDACTED}
+    assert redact_jwk(None) is None
+    assert redact_headers({"Authorization": "Bearer token", "Accept": "*/*"}) == {"Authorization": REDACTED, "Accept": "*/*"}
+    assert redact_jwt("header.payload.signature") == f"header.payload.{REDACTED}"
+    assert redact_jwt("not-a-jwt") == REDACTED
+    disclosure = base64.urlsafe_b64encode(json.dumps(["salt", "legal_person_name", "Stub B.V."]).encode()).decode().rstrip("=")
+    assert decode_disclosure(disclosure) == [REDACTED, "legal_person_name", REDACTED]
+    element = base64.urlsafe_b64encode(json.dumps(["salt", "Jan Vries"]).encode()).decode().rstrip("=")
+    assert decode_disclosure(element) == [REDACTED, REDACTED]
+
+
+def test_modes_decide_which_requests_are_traced():
+    assert IssuanceTraceRecorder(mode="off").start("credential", {ISSUANCE_TRACE_HEADER: "1"}) is None
+    header = IssuanceTraceRecorder(mode="header")
+    assert header.start("credential", {}) is None
+    assert header.start("credential", {ISSUANCE_TRACE_HEADER: "1"}) is not None
+    assert IssuanceTraceRecorder(mode="always").start("credential", {}) is not None
+
+
+def test_finished_traces_are_kept_in_a_ring():
+    recorder = IssuanceTraceRecorder(mode="always", keep=2)
+    traces = [recorder.start(f"request-{number}", {}) for number in range(3)]
+    for trace in traces:
+        trace.record("fetched_sources", sources=[])
+        recorder.finish(trace)
+    assert recorder.get(traces[0].trace_id) is None
+    assert [trace["name"] for trace in recorder.latest()] == ["request-2", "request-1"]
+    assert [step["step"] for step in recorder.get(traces[2].trace_id)["steps"]] == ["fetched_sources", "done"]
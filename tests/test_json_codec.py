@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from app.services import json_codec
+
+DOCUMENT = {"naam": "Stichting Één", "aantal": 3, "lijst": [1.5, None, True], "geneste": {"a": []}}
+
+
+@pytest.fixture(params=["installed", "stdlib"])
+def codec(request, monkeypatch):
+    if request.param == "stdlib":
+        monkeypatch.setattr(json_codec, "orjson", None)
+    return json_codec
+
+
+def test_round_trip_is_compact_utf8(codec):
+    encoded = codec.dumps(DOCUMENT)
+    assert b"\n" not in encoded and b": " not in encoded
+    assert "Één".encode() in encoded
+    assert codec.loads(encoded) == DOCUMENT
+    assert codec.loads(encoded.decode()) == DOCUMENT
+
+
+def test_pretty_output(codec):
+    assert codec.dumps({"a": 1}, pretty=True) == b'{\n  "a": 1\n}'
+
+
+def test_values_the_fast_encoder_rejects_fall_back_to_the_stdlib(codec):
+    assert json.loads(codec.dumps({1: 2**70})) == {"1": 2**70}
+
+
+def test_invalid_input_raises_a_json_decode_error(codec):
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads(b"{")
+
+
+def test_stable_encoding_does_not_depend_on_the_codec():
+    assert json_codec.dumps_stable(["salt", "naam", "Één"]) == '["salt","naam","\\u00c9\\u00e9n"]'
+
+
+def test_responses_use_the_codec():
+    response = json_codec.CodecJSONResponse({"a": [1, 2]})
+    assert response.body == b'{"a":[1,2]}'
+    assert response.headers["content-type"] == "application/json"
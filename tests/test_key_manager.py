@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from app.routes.rdw_niscy import load_auth_keys
+from app.services.key_manager import KeyManager
+
+
+def write_pem(path, private_key):
+    path.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    return str(path)
+
+
+def test_rotation_keeps_previous_keys_for_verification():
+    manager = KeyManager.generate("ES256")
+    first = manager.active_key
+    version = manager.version
+    jwks = manager.jwks_json()
+    second = manager.rotate()
+    assert manager.active_key is second
+    assert manager.get_key(first.kid) is first
+    assert manager.version > version
+    assert manager.jwks_json() != jwks
+    assert [key["kid"] for key in json.loads(manager.jwks_json())["keys"]] == [first.kid, second.kid]
+    with pytest.raises(ValueError):
+        manager.retire(second.kid)
+    manager.retire(first.kid)
+    assert manager.get_key(first.kid) is None
+
+
+def test_pem_files_load_with_the_first_as_active_key(tmp_path):
+    old = write_pem(tmp_path / "old.pem", ed25519.Ed25519PrivateKey.generate())
+    new = write_pem(tmp_path / "new.pem", ed25519.Ed25519PrivateKey.generate())
+    manager = KeyManager.from_pem_files("EdDSA", [new, old])
+    assert len(manager.jwks()["keys"]) == 2
+    assert manager.active_key.public_jwk["crv"] == "Ed25519"
+    assert KeyManager.from_pem_files("EdDSA", [new]).active_key.kid == manager.active_key.kid
+
+
+def test_keys_must_match_the_algorithm(tmp_path):
+    with pytest.raises(ValueError):
+        KeyManager.from_pem_files("EdDSA", [write_pem(tmp_path / "ec.pem", ec.generate_private_key(ec.SECP256R1()))])
+
+
+def test_asymmetric_auth_tokens_need_shared_key_files(tmp_path):
+    assert load_auth_keys("HS256", []) is None
+    with pytest.raises(RuntimeError, match="JWT_SIGNING_KEY_FILES"):
+        load_auth_keys("ES256", [])
+    assert load_auth_keys("ES256", [], ephemeral=True).algorithm == "ES256"
+    key_file = write_pem(tmp_path / "auth.pem", ec.generate_private_key(ec.SECP256R1()))
+    # Every process loading the same file signs with the same key
+    assert load_auth_keys("ES256", [key_file]).active_key.kid == load_auth_keys("ES256", [key_file]).active_key.kid
+
+
+def test_issuer_keys_from_private_jwks_or_pem_files(tmp_path, monkeypatch):
+    from app.services import mini_suomi
+    from app.services.key_manager import base64url_encode, public_jwk
+
+    signing, previous = ec.generate_private_key(ec.SECP256R1()), ec.generate_private_key(ec.SECP256R1())
+    private_jwks = {"keys": [
+        {**public_jwk(key.public_key()), "kid": kid, "d": base64url_encode(key.private_numbers().private_value.to_bytes(32, "big"))}
+        for key, kid in ((signing, "current"), (previous, "previous"))
+    ]}
+    monkeypatch.setenv("ISSUER_PRIVATE_JWKS", json.dumps(private_jwks))
+    manager = mini_suomi.load_issuer_keys()
+    assert manager.active_key.kid == "current"
+    assert [key["kid"] for key in manager.jwks()["keys"]] == ["previous", "current"]
+    assert all("use" not in key and "d" not in key for key in manager.jwks()["keys"])
+
+    monkeypatch.delenv("ISSUER_PRIVATE_JWKS")
+    monkeypatch.setenv("ISSUER_KEY_FILES", f"{write_pem(tmp_path / 'a.pem', signing)}, {write_pem(tmp_path / 'b.pem', previous)}")
+    monkeypatch.setenv("ISSUER_KEY_IDS", "current")
+    manager = mini_suomi.load_issuer_keys()
+    assert manager.active_key.kid == "current"
+    assert manager.active_key.public_jwk["x"] == public_jwk(signing.public_key())["x"]
+    assert len(manager.jwks()["keys"]) == 2
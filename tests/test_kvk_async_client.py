@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+
+
+def test_one_pooled_client_per_event_loop(upstream):
+    api = client.AsyncKVKBevoegdhedenAPI()
+
+    async def lookup():
+        first = api.client()
+        await api.get_lpid("90000001")
+        assert api.client() is first
+        return first
+
+    first_loop_client = asyncio.run(lookup())
+    second_loop_client = asyncio.run(lookup())
+    assert first_loop_client is not second_loop_client
+
+
+def test_lookups_are_cached(upstream):
+    api = client.AsyncKVKBevoegdhedenAPI()
+
+    async def lookups():
+        return await asyncio.gather(*(api.get_company_certificate("90000001") for _ in range(4)))
+
+    assert asyncio.run(lookups()) == [{"data": {"id": "company-certificate-90000001"}}] * 4
+    assert upstream == ["/company-certificate/90000001"]
+
+
+def test_upstream_errors_are_raised(upstream):
+    api = client.AsyncKVKBevoegdhedenAPI()
+    assert asyncio.run(api.get_company_certificate("90000001")) == {"data": {"id": "company-certificate-90000001"}}
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(api.get_lpid("404"))
+    assert upstream == ["/company-certificate/90000001", "/lpid/404"]
+
+
+def test_lookup_many_runs_each_number_once_and_bounds_concurrency(upstream):
+    api = client.AsyncKVKBevoegdhedenAPI()
+    running = peak = 0
+
+    async def lookup(kvk_nummer):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await api.fetch_record(client.LPID, kvk_nummer)
+        finally:
+            running -= 1
+
+    async def collect():
+        return [item async for item in api.lookup_many(lookup, ["1", "2", "404", "1", "3", "4", "5"], concurrency=2)]
+
+    results = {kvk_nummer: (data, error) for kvk_nummer, data, error in asyncio.run(collect())}
+    assert set(results) == {"1", "2", "3", "4", "5", "404"}
+    assert sorted(upstream) == sorted(f"/lpid/{number}" for number in ("1", "2", "3", "4", "5", "404"))
+    assert peak == 2
+    assert results["1"] == ({"data": {"id": "lpid-1"}}, None)
+    assert isinstance(results["404"][1], httpx.HTTPStatusError)
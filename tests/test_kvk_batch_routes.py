@@ -0,0 +1,39 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.routes import kvk_bevoegdheid_rest_api as routes
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_batch_results_follow_the_request_order(client, upstream):
+    response = client.post("/bevoegdheid/lpid:batch", json={"kvk_nummers": ["3", "1", "404", "1"]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[:2] == [
+        {"kvk_nummer": "3", "data": {"data": {"id": "lpid-3"}}},
+        {"kvk_nummer": "1", "data": {"data": {"id": "lpid-1"}}},
+    ]
+    assert (results[2]["kvk_nummer"], results[2]["status_code"], len(results)) == ("404", 404, 3)
+    assert sorted(upstream) == ["/lpid/1", "/lpid/3", "/lpid/404"]
+
+
+def test_streamed_batches_are_ndjson(client, upstream):
+    response = client.post("/bevoegdheid/company-certificate:batch?stream=true", json={"kvk_nummers": ["1", "2"]})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["kvk_nummer"] for line in lines) == ["1", "2"]
+    assert all(line["data"]["data"]["id"].startswith("company-certificate-") for line in lines)
+
+
+def test_batch_size_is_limited(client, upstream, monkeypatch):
+    monkeypatch.setattr(routes, "MAX_BATCH_KVK_NUMBERS", 2)
+    response = client.post("/bevoegdheid/lpid:batch", json={"kvk_nummers": ["1", "2", "3"]})
+    assert response.status_code == 400
+    assert upstream == []
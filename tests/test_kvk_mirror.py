@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+from app.clients.kvk_mirror import ADDED, CHANGED, UNCHANGED, KVKMirror
+from app.clients.kvk_person_cache import kvk_person_cache
+from app.clients.kvk_response_cache import COMPANY_CERTIFICATE, LPID, kvk_response_cache
+from app.clients.kvk_upstream_policy import CircuitOpenError
+from app.services import kvk_mirror_sync
+
+
+def certificate(kvk_nummer, name="Stub B.V.", persons=(("Jan  de Vries", "01-02-1980"),)):
+    return {
+        "data": {
+            "registration_number": kvk_nummer,
+            "legal_person_name": name,
+            "authorized_persons": [{"full_name": full_name, "date_of_birth": born} for full_name, born in persons],
+        }
+    }
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    return KVKMirror(str(tmp_path / "kvk-mirror.sqlite3"), max_age_seconds=60)
+
+
+@pytest.fixture
+def mirrored_client(mirror, monkeypatch):
+    monkeypatch.setattr(client, "kvk_mirror", mirror)
+    kvk_response_cache.clear()
+    kvk_person_cache.clear()
+    yield mirror
+    kvk_response_cache.clear()
+    kvk_person_cache.clear()
+
+
+def test_put_only_rewrites_changed_records(mirror):
+    assert mirror.put(COMPANY_CERTIFICATE, "90000001", certificate("90000001")) == ADDED
+    assert mirror.put(COMPANY_CERTIFICATE, "90000001", certificate("90000001")) == UNCHANGED
+    assert mirror.put(COMPANY_CERTIFICATE, "90000001", certificate("90000001", name="Nieuw B.V.")) == CHANGED
+    assert mirror.get(COMPANY_CERTIFICATE, "90000001")["data"]["legal_person_name"] == "Nieuw B.V."
+
+
+def test_records_are_served_within_the_freshness_bound_only(mirror):
+    mirror.put(LPID, "90000001", {"id": "lpid"}, synced_at=time.time() - 61)
+    assert mirror.get(LPID, "90000001") is None
+    mirror.put(LPID, "90000001", {"id": "lpid"})
+    assert mirror.get(LPID, "90000001") == {"id": "lpid"}
+
+
+def test_person_index_follows_certificate_changes(mirror):
+    mirror.put(COMPANY_CERTIFICATE, "90000001", certificate("90000001"))
+    mirror.put(COMPANY_CERTIFICATE, "90000002", certificate("90000002"))
+    # Names are matched case- and whitespace-insensitively, birth dates as ISO dates
+    assert len(mirror.companies_for_person("jan de", "VRIES", "1980-02-01")) == 2
+    mirror.put(COMPANY_CERTIFICATE, "90000002", certificate("90000002", persons=(("Piet Jansen", "03-04-1970"),)))
+    mirror.delete(COMPANY_CERTIFICATE, "90000001")
+    assert mirror.companies_for_person("Jan de", "Vries", "1980-02-01") == []
+    assert [c["data"]["registration_number"] for c in mirror.companies_for_person("Piet", "Jansen", "1970-04-03")] == ["90000002"]
+
+
+def test_reads_are_written_through_and_served_from_the_mirror(mirrored_client, monkeypatch):
+    calls = []
+
+    def get_json(endpoint, path, timeout):
+        calls.append(path)
+        return certificate("90000001")
+
+    monkeypatch.setattr(client, "_get_json", get_json)
+    client.KVKBevoegdhedenAPI.get_company_certificate("90000001")
+    kvk_response_cache.clear()
+    assert client.KVKBevoegdhedenAPI.get_company_certificate("90000001") == certificate("90000001")
+    assert calls == ["/company-certificate/90000001"]
+
+
+def test_async_reads_use_the_mirror_off_the_event_loop(mirrored_client, monkeypatch):
+    threads = []
+    for method in ("get", "put"):
+        def recorded(*args, method=getattr(mirrored_client, method), **kwargs):
+            threads.append(threading.current_thread())
+            return method(*args, **kwargs)
+        monkeypatch.setattr(mirrored_client, method, recorded)
+
+    async def fetch_record(kind, kvk_nummer, timeout=None):
+        return certificate(kvk_nummer)
+
+    api = client.AsyncKVKBevoegdhedenAPI()
+    monkeypatch.setattr(api, "fetch_record", fetch_record)
+    assert asyncio.run(api.get_company_certificate("90000001")) == certificate("90000001")
+    kvk_response_cache.clear()
+    assert asyncio.run(api.get_company_certificate("90000001")) == certificate("90000001")
+    # get and put for the miss, get for the mirror hit
+    assert len(threads) == 3 and threading.main_thread() not in threads
+
+
+def test_natural_person_lookups_ask_the_upstream_first(mirrored_client, monkeypatch):
+    mirrored_client.put(COMPANY_CERTIFICATE, "90000001", certificate("90000001"))
+    mirrored_client.mark_complete(time.time())
+    monkeypatch.setattr(client, "_post_json", lambda endpoint, path, payload, timeout: {"upstream": True})
+    assert client.KVKBevoegdhedenAPI.get_natural_person_company_certificate("Jan de", "Vries", "1980-02-01") == {"upstream": True}
+
+
+def test_natural_person_lookups_fall_back_to_the_mirror_while_the_breaker_is_open(mirrored_client, monkeypatch):
+    def breaker_open(endpoint, path, payload, timeout):
+        raise CircuitOpenError("open")
+
+    monkeypatch.setattr(client, "_post_json", breaker_open)
+    mirrored_client.put(COMPANY_CERTIFICATE, "90000001", certificate("90000001"))
+    # Not before a sync pass completed
+    with pytest.raises(CircuitOpenError):
+        client.KVKBevoegdhedenAPI.get_natural_person_company_certificate("Jan de", "Vries", "1980-02-01")
+    mirrored_client.mark_complete(time.time())
+    companies = client.KVKBevoegdhedenAPI.get_natural_person_company_certificate("Jan de", "Vries", "1980-02-01")
+    assert [c["data"]["registration_number"] for c in companies] == ["90000001"]
+
+
+def test_sync_pass_applies_deltas_and_removals(mirror, monkeypatch):
+    monkeypatch.setattr(kvk_mirror_sync, "KVK_MIRROR_KVK_NUMBERS", ["90000001", "90000002"])
+    removed = {"90000002"}
+
+    async def fetch_record(kind, kvk_nummer, timeout=None):
+        if kvk_nummer in removed:
+            request = httpx.Request("GET", f"http://kvk.test/{kind}/{kvk_nummer}")
+            raise httpx.HTTPStatusError("gone", request=request, response=httpx.Response(404, request=request))
+        return certificate(kvk_nummer)
+
+    monkeypatch.setattr(kvk_mirror_sync.sync_api, "fetch_record", fetch_record)
+    mirror.put(COMPANY_CERTIFICATE, "90000002", certificate("90000002"))
+    counts = asyncio.run(kvk_mirror_sync.sync_once(mirror))
+    assert counts == {"added": 2, "changed": 0, "unchanged": 0, "removed": 2, "failed": 0}
+    assert mirror.get(COMPANY_CERTIFICATE, "90000002") is None
+    assert mirror.complete()
+    counts = asyncio.run(kvk_mirror_sync.sync_once(mirror))
+    assert counts["unchanged"] == 2 and counts["added"] == 0
+
+
+def test_only_one_process_holds_the_sync_lock(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "kvk-mirror.sqlite3")
+    other_process = open(f"{db_path}.sync-lock", "a")
+    kvk_mirror_sync.fcntl.flock(other_process, kvk_mirror_sync.fcntl.LOCK_EX | kvk_mirror_sync.fcntl.LOCK_NB)
+    monkeypatch.setattr(kvk_mirror_sync, "_sync_lock_file", None)
+    assert not kvk_mirror_sync.acquire_sync_lock(db_path)
+    other_process.close()
+    assert kvk_mirror_sync.acquire_sync_lock(db_path)
+    other_process = open(f"{db_path}.sync-lock", "a")
+    with pytest.raises(BlockingIOError):
+        kvk_mirror_sync.fcntl.flock(other_process, kvk_mirror_sync.fcntl.LOCK_EX | kvk_mirror_sync.fcntl.LOCK_NB)
+    other_process.close()
+    kvk_mirror_sync._sync_lock_file.close()
@@ -0,0 +1,71 @@
+import hashlib
+import hmac
+import json
+
+import httpx
+import pytest
+
+from app.clients import kvk_bevoegdheden_rest_api as client
+from app.clients import kvk_person_cache as person_cache
+from app.clients.kvk_person_cache import invalidate_signatory_right, kvk_person_cache, signatory_rights_key
+
+PERSON = ("90000021", "Vries", "Jan", "01-02-1980", "de")
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+
+    def post_json(endpoint, path, payload, timeout):
+        calls.append(payload)
+        if payload.get("geslachtsnaam") == "Onbekend":
+            request = httpx.Request("POST", f"https://kvk.test{path}", json=payload)
+            raise httpx.HTTPStatusError("Not Found", request=request, response=httpx.Response(404, request=request))
+        return {"heeftBevoegdheid": True}
+
+    monkeypatch.setattr(client, "_post_json", post_json)
+    kvk_person_cache.clear()
+    yield calls
+    kvk_person_cache.clear()
+
+
+def test_keys_are_salted_digests_of_the_fields():
+    key = signatory_rights_key(*PERSON)
+    assert key == hmac.new(person_cache._salt, json.dumps(list(PERSON)).encode(), hashlib.sha256).hexdigest()
+    assert key == signatory_rights_key(*PERSON)
+    # Field boundaries are kept: moving a character between fields changes the key
+    assert signatory_rights_key("90000021", "Vries", "Jan", "01-02-1980", "d") != signatory_rights_key("90000021", "Vriesd", "Jan", "01-02-1980", "")
+
+
+def test_salt_differs_per_process(monkeypatch):
+    key = signatory_rights_key(*PERSON)
+    monkeypatch.setattr(person_cache, "_salt", b"another process")
+    assert signatory_rights_key(*PERSON) != key
+
+
+def test_signatory_rights_are_cached_until_invalidated(upstream):
+    assert client.KVKBevoegdhedenAPI.check_signatory_right(*PERSON) == {"heeftBevoegdheid": True}
+    client.KVKBevoegdhedenAPI.check_signatory_right(*PERSON)
+    assert len(upstream) == 1
+    invalidate_signatory_right(*PERSON)
+    client.KVKBevoegdhedenAPI.check_signatory_right(*PERSON)
+    assert len(upstream) == 2
+
+
+def test_not_found_is_cached_as_a_negative_result(upstream):
+    unknown = ("90000021", "Onbekend", "Jan", "01-02-1980")
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError) as raised:
+            client.KVKBevoegdhedenAPI.check_signatory_right(*unknown)
+    assert len(upstream) == 1
+    # The cached error keeps the status, not the request body with the personal data
+    assert raised.value.response.status_code == 404
+    assert raised.value.request.content == b""
+    assert kvk_person_cache.stats()["endpoints"][person_cache.SIGNATORY_RIGHTS]["negative_hits"] == 1
+
+
+def test_negative_results():
+    assert person_cache.is_negative_result([], None)
+    assert person_cache.is_negative_result(None, None)
+    assert not person_cache.is_negative_result([{"data": {}}], None)
+    assert not person_cache.is_negative_result(None, httpx.ConnectError("down"))
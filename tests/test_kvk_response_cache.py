@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+
+from app.clients.kvk_response_cache import LPID, KVKResponseCache
+
+
+def counting_fetch(values, calls, gate=None):
+    def fetch():
+        calls.append(time.monotonic())
+        if gate is not None:
+            gate.wait(5)
+        value = values[min(len(calls), len(values)) - 1]
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return fetch
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_fresh_entries_are_served_from_the_cache():
+    cache = KVKResponseCache(ttl_seconds={LPID: 60})
+    calls = []
+    fetch = counting_fetch(["v1", "v2"], calls)
+    assert cache.get(LPID, "90000021", fetch) == "v1"
+    assert cache.get(LPID, "90000021", fetch) == "v1"
+    assert len(calls) == 1
+    assert cache.stats()["endpoints"][LPID]["hits"] == 1
+
+
+def test_stale_entries_are_served_while_one_refresh_runs():
+    cache = KVKResponseCache(ttl_seconds={LPID: 0}, stale_seconds=60)
+    calls = []
+    fetch = counting_fetch(["v1", "v2"], calls)
+    assert cache.get(LPID, "90000021", fetch) == "v1"
+    assert cache.get(LPID, "90000021", fetch) == "v1"
+    wait_for(lambda: not cache.stats()["inflight"])
+    assert cache.get(LPID, "90000021", fetch) == "v2"
+    assert cache.stats()["endpoints"][LPID]["refreshes"] >= 1
+
+
+def test_a_failed_refresh_keeps_the_stale_copy():
+    cache = KVKResponseCache(ttl_seconds={LPID: 0}, stale_seconds=60, refresh_retry_seconds=60)
+    calls = []
+    fetch = counting_fetch(["v1", RuntimeError("upstream down")], calls)
+    cache.get(LPID, "90000021", fetch)
+    assert cache.get(LPID, "90000021", fetch) == "v1"
+    wait_for(lambda: cache.stats()["endpoints"][LPID]["refresh_failures"] == 1)
+    # Not retried before refresh_retry_seconds
+    assert cache.get(LPID, "90000021", fetch) == "v1"
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_share_one_fetch_and_its_error():
+    cache = KVKResponseCache(ttl_seconds={LPID: 60})
+    gate, calls, results = threading.Event(), [], []
+    fetch = counting_fetch([RuntimeError("upstream down"), "v2"], calls, gate)
+
+    def lookup():
+        try:
+            results.append(cache.get(LPID, "90000021", fetch))
+        except RuntimeError as e:
+            results.append(str(e))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: cache.stats()["endpoints"][LPID]["coalesced"] == 7)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["upstream down"] * 8 and len(calls) == 1
+    # Errors are not cached
+    assert cache.get(LPID, "90000021", fetch) == "v2"
+
+
+def test_async_callers_are_coalesced():
+    cache = KVKResponseCache(ttl_seconds={LPID: 60})
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "v1"
+
+    async def lookups():
+        return await asyncio.gather(*(cache.aget(LPID, "90000021", fetch) for _ in range(5)))
+
+    assert asyncio.run(lookups()) == ["v1"] * 5
+    assert len(calls) == 1
+
+
+def test_least_recently_used_entries_are_evicted_and_invalidation_refetches():
+    cache = KVKResponseCache(ttl_seconds={LPID: 60}, max_entries=2)
+    for number in ("1", "2", "3"):
+        cache.get(LPID, number, lambda number=number: number)
+    assert cache.stats()["evictions"] == 1
+    cache.invalidate(LPID, "3")
+    assert cache.get(LPID, "3", lambda: "refetched") == "refetched"
+
+
+def test_disabled_cache_always_fetches():
+    cache = KVKResponseCache(ttl_seconds={LPID: 60}, max_entries=0)
+    calls = []
+    fetch = counting_fetch(["v1", "v2"], calls)
+    assert (cache.get(LPID, "1", fetch), cache.get(LPID, "1", fetch)) == ("v1", "v2")
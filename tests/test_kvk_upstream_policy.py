@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.clients.kvk_upstream_policy import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, EndpointPolicy, UpstreamPolicy
+
+
+def status_error(status_code):
+    request = httpx.Request("GET", "http://kvk.test/lpid/1")
+    return httpx.HTTPStatusError("upstream error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def upstream(retry_attempts=0, reset_seconds=0.05):
+    policy = UpstreamPolicy(["lpid"], retry_attempts=retry_attempts)
+    policy.endpoints["lpid"] = EndpointPolicy("lpid", breaker_min_requests=2, breaker_reset_seconds=reset_seconds)
+    return policy, policy.endpoints["lpid"]
+
+
+def failing(status_code):
+    def send():
+        raise status_error(status_code)
+    return send
+
+
+def test_retries_a_503_and_returns_the_next_answer():
+    policy, endpoint = upstream(retry_attempts=2)
+    answers = iter([failing(503), lambda: "ok"])
+    assert policy.call("lpid", lambda: next(answers)()) == "ok"
+    assert endpoint.counters["retries"] == 1
+
+
+def test_client_errors_are_not_retried_and_do_not_open_the_breaker():
+    policy, endpoint = upstream(retry_attempts=2)
+    for _ in range(5):
+        with pytest.raises(httpx.HTTPStatusError):
+            policy.call("lpid", failing(404))
+    assert endpoint.counters["retries"] == 0
+    assert endpoint.state == CLOSED
+
+
+def test_breaker_opens_fails_fast_and_closes_after_a_successful_probe():
+    policy, endpoint = upstream()
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            policy.call("lpid", failing(500))
+    assert endpoint.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        policy.call("lpid", lambda: "not called")
+    time.sleep(0.06)
+    assert policy.call("lpid", lambda: "ok") == "ok"
+    assert endpoint.state == CLOSED
+
+
+def test_cancelled_probe_frees_the_half_open_slot():
+    policy, endpoint = upstream()
+    for _ in range(2):
+        endpoint.record(None, True)
+    time.sleep(0.06)
+
+    async def probe_then_call():
+        hung = asyncio.Event()
+        probe = asyncio.ensure_future(policy.acall("lpid", hung.wait))
+        await asyncio.sleep(0.01)
+        assert endpoint.state == HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def answer():
+            return "ok"
+        return await policy.acall("lpid", answer)
+
+    assert asyncio.run(probe_then_call()) == "ok"
+    assert endpoint.state == CLOSED
+
+
+def test_probe_that_never_reports_back_gives_up_its_slot():
+    _, endpoint = upstream()
+    for _ in range(2):
+        endpoint.record(None, True)
+    time.sleep(0.06)
+    assert endpoint.allow()
+    assert not endpoint.allow()
+    time.sleep(0.06)
+    assert endpoint.allow()
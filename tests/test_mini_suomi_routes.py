@@ -0,0 +1,102 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi.testclient import TestClient
+
+from app import app
+from app.routes import mini_suomi as routes
+from app.services import mini_suomi
+from app.services.key_manager import public_jwk
+from app.services.nonce_store import nonce_store
+from app.services.offer_store import offer_store
+from app.services.proof_verifier import PROOF_TYPE
+
+OFFER_PATH = "/mini-suomi/issuers/kvk/openid4vci/issue/LPIDSdJwt/90000021"
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_offer_creation_is_disabled_without_an_admin_token(client, monkeypatch):
+    monkeypatch.setattr(routes, "CREDENTIAL_OFFER_ADMIN_TOKEN", None)
+    assert client.post(OFFER_PATH).status_code == 403
+
+
+def test_offer_creation_requires_the_admin_token(client, monkeypatch):
+    monkeypatch.setattr(routes, "CREDENTIAL_OFFER_ADMIN_TOKEN", "secret")
+    assert client.get(OFFER_PATH).status_code == 405
+    assert client.post(OFFER_PATH, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.post(OFFER_PATH, headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.json()["credential_offer_uri"].startswith("openid-credential-offer://")
+
+
+def test_credential_endpoint_rejects_unknown_access_tokens(client):
+    response = client.post(
+        "/mini-suomi/issuers/kvk/openid4vci/issue",
+        json={"types": ["LPIDSdJwt"]},
+        headers={"Authorization": "Bearer unknown"},
+    )
+    assert response.status_code == 401
+    assert response.json() == {"error": "invalid_token"}
+
+
+LPID_SOURCE = {
+    "data": {"id": "lpid-90000021", "legal_person_name": "Stub B.V."},
+    "metadata": {"issuer_id": "KVK", "issuing_authority_name": "Kamer van Koophandel", "issuing_country": "NL"},
+}
+
+
+def holder_proof(access_token, holder_key):
+    nonce, _ = nonce_store.issue(access_token)
+    return jwt.encode(
+        {"aud": mini_suomi.CREDENTIAL_ISSUER, "iat": int(time.time()), "nonce": nonce},
+        holder_key,
+        algorithm="ES256",
+        headers={"typ": PROOF_TYPE, "jwk": public_jwk(holder_key.public_key())},
+    )
+
+
+def test_batch_credential_binds_one_credential_per_proof(client, monkeypatch):
+    monkeypatch.setattr(mini_suomi, "fetch_credential_source", lambda credential_type, kvk_number: LPID_SOURCE)
+    monkeypatch.setattr(routes.deferred_issuance, "budget_seconds", None)
+    access_token, _ = offer_store.redeem(offer_store.create("LPIDSdJwt", "90000021")[1])
+    holder_keys = [ec.generate_private_key(ec.SECP256R1()) for _ in range(3)]
+    response = client.post(
+        "/mini-suomi/issuers/kvk/openid4vci/batch_credential",
+        json={"credential_requests": [
+            {"types": ["LPIDSdJwt"], "proofs": {"jwt": [holder_proof(access_token, key) for key in holder_keys[:2]]}},
+            {"types": ["LPIDSdJwt"], "proof": {"proof_type": "jwt", "jwt": holder_proof(access_token, holder_keys[2])}},
+        ]},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["c_nonce"]
+    credentials = [item["credential"] for item in body["credential_responses"]]
+    bound_keys = [jwt.decode(credential.split("~")[0], options={"verify_signature": False})["cnf"]["jwk"] for credential in credentials]
+    assert [key["x"] for key in bound_keys] == [public_jwk(key.public_key())["x"] for key in holder_keys]
+
+
+def test_batch_credential_rejects_other_credential_types_and_oversized_batches(client, monkeypatch):
+    access_token, _ = offer_store.redeem(offer_store.create("LPIDSdJwt", "90000021")[1])
+    headers = {"Authorization": f"Bearer {access_token}"}
+    path = "/mini-suomi/issuers/kvk/openid4vci/batch_credential"
+    response = client.post(path, json={"credential_requests": [{"types": ["EUCCSdJwt"]}]}, headers=headers)
+    assert (response.status_code, response.json()["error"]) == (403, "insufficient_scope")
+    monkeypatch.setattr(routes, "MAX_BATCH_CREDENTIALS", 1)
+    response = client.post(path, json={"credential_requests": [{"types": ["LPIDSdJwt"]}] * 2}, headers=headers)
+    assert (response.status_code, response.json()["error"]) == (400, "invalid_request")
+
+
+def test_issuance_traces_require_the_admin_token(client, monkeypatch):
+    path = "/mini-suomi/debug/issuance-traces"
+    monkeypatch.setattr(routes, "ISSUANCE_TRACE_ADMIN_TOKEN", None)
+    assert client.get(path).status_code == 403
+    monkeypatch.setattr(routes, "ISSUANCE_TRACE_ADMIN_TOKEN", "secret")
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer secret"}).status_code == 200
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from app.services.nonce_store import NonceError, NonceStore, TimingWheel
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "nonces.sqlite3")
+
+
+def test_timing_wheel_expires_keys_on_time_across_levels():
+    wheel = TimingWheel(tick_seconds=1, slots=8, levels=2, now=0)
+    for key, expires_at in (("soon", 3), ("later", 20), ("far", 60)):
+        wheel.schedule(key, expires_at)
+    assert wheel.advance(2) == []
+    assert wheel.advance(3) == ["soon"]
+    assert wheel.advance(19) == []
+    assert wheel.advance(20) == ["later"]
+    assert wheel.advance(1000) == ["far"]
+    assert len(wheel) == 0
+
+
+def test_pop_earliest_takes_the_keys_closest_to_expiry():
+    wheel = TimingWheel(tick_seconds=1, slots=8, levels=2, now=0)
+    wheel.schedule("late", 30)
+    wheel.schedule("early", 5)
+    assert wheel.pop_earliest() == ["early"]
+    assert wheel.pop_earliest() == ["late"]
+    assert wheel.pop_earliest() == []
+
+
+def test_a_proof_is_accepted_once_per_nonce():
+    store = NonceStore(db_path=None)
+    nonce, expires_in = store.issue("token")
+    assert expires_in == store.ttl_seconds
+    store.use("token", nonce, "proof-1")
+    with pytest.raises(NonceError) as error:
+        store.use("token", nonce, "proof-1")
+    assert error.value.error == "invalid_proof"
+    store.use("token", nonce, "proof-2")
+    assert store.stats()["replays"] == 1
+
+
+@pytest.mark.parametrize("nonce_for", ["other-token", None])
+def test_nonces_are_bound_to_their_access_token(nonce_for):
+    store = NonceStore(db_path=None)
+    nonce = store.issue(nonce_for)[0] if nonce_for else None
+    with pytest.raises(NonceError) as error:
+        store.use("token", nonce, "proof-1")
+    assert error.value.error == "invalid_nonce"
+
+
+def test_expired_nonces_are_rejected():
+    store = NonceStore(db_path=None, ttl_seconds=0)
+    nonce, _ = store.issue("token")
+    with pytest.raises(NonceError):
+        store.use("token", nonce, "proof-1")
+
+
+def test_eviction_never_allows_a_replay():
+    store = NonceStore(db_path=None, max_entries=4)
+    nonce, _ = store.issue("token")
+    store.use("token", nonce, "proof-1")
+    for _ in range(10):
+        store.issue("token")
+    assert store.stats()["evictions"] > 0
+    # The used proof was evicted together with its nonce
+    with pytest.raises(NonceError) as error:
+        store.use("token", nonce, "proof-1")
+    assert error.value.error == "invalid_nonce"
+
+
+def test_processes_sharing_the_database_detect_replays(db_path):
+    minting, first, second = (NonceStore(db_path=db_path) for _ in range(3))
+    nonce, _ = minting.issue("token")
+    first.use("token", nonce, "proof-1")
+    with pytest.raises(NonceError) as error:
+        second.use("token", nonce, "proof-1")
+    assert error.value.error == "invalid_proof"
+
+
+def test_concurrent_use_of_the_shared_connection(db_path):
+    store = NonceStore(db_path=db_path)
+    errors = []
+
+    def use():
+        try:
+            for number in range(50):
+                nonce, _ = store.issue("token")
+                store.use("token", nonce, f"proof-{number}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from app.services.offer_store import OfferStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "credential-offers.sqlite3")
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_code_is_redeemed_once(db_path, shared):
+    store = OfferStore(db_path=db_path if shared else None)
+    offer_id, code = store.create("LPIDSdJwt", "90000021")
+    assert store.get_offer(offer_id) == (code, "LPIDSdJwt", "90000021", store.get_offer(offer_id)[3])
+    access_token, grant = store.redeem(code)
+    assert grant[:2] == ("LPIDSdJwt", "90000021")
+    assert store.get_grant(access_token) == grant
+    assert store.redeem(code) is None
+    assert store.get_offer(offer_id) is None
+
+
+def test_processes_sharing_the_database_see_each_others_offers_and_redemptions(db_path):
+    first, second = OfferStore(db_path=db_path), OfferStore(db_path=db_path)
+    offer_id, code = first.create("LPIDSdJwt", "90000021")
+    assert first.get_offer(offer_id) is not None
+    assert second.get_offer(offer_id) is not None
+    access_token, grant = second.redeem(code)
+    # The first process still has its local copy, but the offer is gone
+    assert first.get_offer(offer_id) is None
+    assert first.redeem(code) is None
+    assert first.get_grant(access_token) == grant
+
+
+def test_expired_offers_cannot_be_redeemed(db_path):
+    store = OfferStore(db_path=db_path, offer_ttl_seconds=-1)
+    offer_id, code = store.create("LPIDSdJwt", "90000021")
+    assert store.get_offer(offer_id) is None
+    assert store.redeem(code) is None
+
+
+def test_concurrent_use_of_the_shared_connection(db_path):
+    store = OfferStore(db_path=db_path)
+    errors = []
+
+    def issue():
+        try:
+            for _ in range(50):
+                offer_id, code = store.create("LPIDSdJwt", "90000021")
+                assert store.get_offer(offer_id) is not None
+                access_token, _ = store.redeem(code)
+                assert store.get_grant(access_token) is not None
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=issue) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
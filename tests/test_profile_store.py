@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from app.services.profile_store import ProfileStore
+
+USER_ID = "5f2b" * 16
+CLAIMS = {"given_name": "Jan", "family_name": "Jansen", "birth_date": "1980-01-01"}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "user-profiles.sqlite3")
+
+
+def test_in_memory_by_default_and_opened_on_first_use():
+    store = ProfileStore(None, max_age_seconds=60)
+    assert store._db is None
+    assert store.get(USER_ID) is None
+    store.put(USER_ID, *CLAIMS.values())
+    assert store.get(USER_ID) == CLAIMS
+    store.delete(USER_ID)
+    assert store.get(USER_ID) is None
+
+
+def test_a_shared_file_needs_the_salt(db_path):
+    with pytest.raises(RuntimeError, match="PROFILE_STORE_SALT"):
+        ProfileStore(db_path, max_age_seconds=60)
+
+
+def test_rows_hold_no_personal_data_in_the_clear(db_path):
+    ProfileStore(db_path, max_age_seconds=60, salt="secret").put(USER_ID, *CLAIMS.values())
+    dump = "\n".join(sqlite3.connect(db_path).iterdump())
+    for value in (USER_ID, *CLAIMS.values()):
+        assert value not in dump
+    # Another worker with the same secret reads it; a different secret does not
+    assert ProfileStore(db_path, max_age_seconds=60, salt="secret").get(USER_ID) == CLAIMS
+    assert ProfileStore(db_path, max_age_seconds=60, salt="other").get(USER_ID) is None
+
+
+def test_expired_and_least_recently_used_profiles_are_dropped():
+    store = ProfileStore(None, max_age_seconds=60, max_entries=2)
+    for number in range(3):
+        store.put(f"user-{number}", *CLAIMS.values())
+    # Trimming runs every max(1, max_entries // 100) writes
+    assert sum(store.get(f"user-{number}") is not None for number in range(3)) == 2
+    expired = ProfileStore(None, max_age_seconds=-1)
+    expired.put(USER_ID, *CLAIMS.values())
+    assert expired.get(USER_ID) is None
@@ -0,0 +1,65 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from app.services.key_manager import public_jwk
+from app.services.nonce_store import NonceStore
+from app.services.proof_verifier import PROOF_TYPE, ProofError, ProofVerifier
+
+AUDIENCE = "https://issuer.test"
+ACCESS_TOKEN = "access-token"
+
+
+@pytest.fixture
+def nonce_store():
+    return NonceStore(db_path=None)
+
+
+@pytest.fixture
+def verifier(nonce_store):
+    return ProofVerifier([AUDIENCE], nonce_store)
+
+
+def proof(private_key, algorithm, nonce, header_jwk=None, **claims):
+    header = {"typ": PROOF_TYPE, "jwk": header_jwk or public_jwk(private_key.public_key())}
+    claims = {"aud": AUDIENCE, "iat": int(time.time()), "nonce": nonce, **claims}
+    return jwt.encode(claims, private_key, algorithm=algorithm, headers=header)
+
+
+@pytest.mark.parametrize("private_key, algorithm", [
+    (ec.generate_private_key(ec.SECP256R1()), "ES256"),
+    (ed25519.Ed25519PrivateKey.generate(), "EdDSA"),
+])
+def test_accepts_a_valid_proof_once(verifier, nonce_store, private_key, algorithm):
+    nonce, _ = nonce_store.issue(ACCESS_TOKEN)
+    proof_jwt = proof(private_key, algorithm, nonce, jti="proof-1")
+    assert verifier.verify(proof_jwt, ACCESS_TOKEN) == public_jwk(private_key.public_key())
+    with pytest.raises(ProofError, match="already used"):
+        verifier.verify(proof_jwt, ACCESS_TOKEN)
+
+
+def test_rejects_an_eddsa_proof_signed_by_another_key(verifier, nonce_store):
+    nonce, _ = nonce_store.issue(ACCESS_TOKEN)
+    header_jwk = public_jwk(ed25519.Ed25519PrivateKey.generate().public_key())
+    proof_jwt = proof(ed25519.Ed25519PrivateKey.generate(), "EdDSA", nonce, header_jwk=header_jwk)
+    with pytest.raises(ProofError, match="Invalid proof signature"):
+        verifier.verify(proof_jwt, ACCESS_TOKEN)
+
+
+def test_rejects_an_eddsa_header_with_an_ec_key(verifier, nonce_store):
+    nonce, _ = nonce_store.issue(ACCESS_TOKEN)
+    header_jwk = public_jwk(ec.generate_private_key(ec.SECP256R1()).public_key())
+    proof_jwt = proof(ed25519.Ed25519PrivateKey.generate(), "EdDSA", nonce, header_jwk=header_jwk)
+    with pytest.raises(ProofError, match="Invalid proof signature"):
+        verifier.verify(proof_jwt, ACCESS_TOKEN)
+
+
+def test_rejects_a_stale_proof_and_another_audience(verifier, nonce_store):
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    nonce, _ = nonce_store.issue(ACCESS_TOKEN)
+    with pytest.raises(ProofError, match="not fresh"):
+        verifier.verify(proof(private_key, "EdDSA", nonce, iat=int(time.time()) - 3600), ACCESS_TOKEN)
+    with pytest.raises(ProofError, match="audience"):
+        verifier.verify(proof(private_key, "EdDSA", nonce, aud="https://other.test"), ACCESS_TOKEN)
@@ -0,0 +1,55 @@
+import time
+
+from app.services.revocation_store import BloomFilter, RevocationStore
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    keys = [f"jti-{number}" for number in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{number}" in bloom for number in range(10000))
+    assert false_positives < 50
+
+
+def test_revocations_last_until_the_token_expires():
+    store = RevocationStore(db_path=None, bucket_seconds=1)
+    now = int(time.time())
+    store.revoke("live", now + 60)
+    store.revoke("already-expired", now - 1)
+    assert store.is_revoked("live")
+    assert not store.is_revoked("already-expired")
+    assert not store.is_revoked("never-revoked")
+    assert len(store) == 1
+
+
+def test_expired_buckets_are_purged():
+    store = RevocationStore(db_path=None, bucket_seconds=1)
+    store.revoke("short", time.time() + 0.5)
+    store.revoke("long", time.time() + 60)
+    time.sleep(2.1)
+    assert not store.is_revoked("short")
+    assert store.is_revoked("long")
+    assert len(store) == 1
+
+
+def test_the_bloom_filter_grows_with_the_live_set():
+    store = RevocationStore(db_path=None, bloom_capacity=8)
+    for number in range(100):
+        store.revoke(f"jti-{number}", int(time.time()) + 60)
+    assert store.bloom_capacity >= 100
+    assert all(store.is_revoked(f"jti-{number}") for number in range(100))
+
+
+def test_processes_sharing_the_database_see_each_others_revocations(tmp_path):
+    db_path = str(tmp_path / "revocations.sqlite3")
+    first = RevocationStore(db_path=db_path, sync_interval=0)
+    first.revoke("jti-1", int(time.time()) + 60)
+    # A process started later loads the revocations made before it
+    assert RevocationStore(db_path=db_path, sync_interval=0).is_revoked("jti-1")
+    delayed = RevocationStore(db_path=db_path, sync_interval=3600)
+    delayed.is_revoked("jti-1")
+    first.revoke("jti-2", int(time.time()) + 60)
+    # Until its next sync, a process only knows what it had loaded
+    assert not delayed.is_revoked("jti-2")
@@ -0,0 +1,52 @@
+import hashlib
+import json
+
+from app.services.key_manager import base64url_decode, base64url_encode
+from app.services.sd_jwt_builder import SALT_BYTES, create_disclosures, generate_salts
+
+CLAIMS = {
+    "legalName": "Stub B.V.",
+    "contactPoint": {"hasEmail": "info@stub.nl", "hasTelephone": ""},
+    "legalRepresentative": [{"given_name": "Jan"}, {"given_name": "Anna"}],
+}
+
+
+def reveal(disclosures, sd_hashes):
+    """Rebuild the claims from the `_sd` digests, as a verifier holding every disclosure would."""
+    by_digest = {
+        base64url_encode(hashlib.sha256(base64url_decode(disclosure)).digest()): json.loads(base64url_decode(disclosure))
+        for disclosure in disclosures
+    }
+
+    def resolve(value):
+        if isinstance(value, dict) and "_sd" in value:
+            return {name: resolve(member) for name, member in (by_digest[digest][1:] for digest in value["_sd"])}
+        if isinstance(value, list):
+            return [
+                resolve(by_digest[element["..."]][1]) if isinstance(element, dict) and "..." in element else resolve(element)
+                for element in value
+            ]
+        return value
+
+    return {name: resolve(value) for name, value in (by_digest[digest][1:] for digest in sd_hashes)}
+
+
+def test_salts_are_distinct_and_sized():
+    salts = generate_salts(100)
+    assert len(set(salts)) == 100
+    assert all(len(base64url_decode(salt)) == SALT_BYTES for salt in salts)
+
+
+def test_top_level_claims_are_one_disclosure_each():
+    disclosures, sd_hashes = create_disclosures(CLAIMS)
+    assert len(disclosures) == len(sd_hashes) == 3
+    assert reveal(disclosures, sd_hashes) == CLAIMS
+
+
+def test_recursive_claims_conceal_members_and_elements():
+    disclosures, sd_hashes = create_disclosures(CLAIMS, {"contactPoint", "legalRepresentative"})
+    # 3 claims, 2 contact members, 2 representatives with 1 member each
+    assert len(disclosures) == 3 + 2 + 2 + 2
+    assert len(sd_hashes) == 3
+    assert reveal(disclosures, sd_hashes) == CLAIMS
+    assert len({json.loads(base64url_decode(disclosure))[0] for disclosure in disclosures}) == len(disclosures)
@@ -0,0 +1,68 @@
+import base64
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from app.services.key_manager import public_jwk
+from app.services.sd_jwt_verifier import JWKSResolver, PresentationVerifier, VerificationError, base64url_digest
+
+ISSUER = "https://issuer.test"
+
+
+def disclosure(name, value):
+    return base64.urlsafe_b64encode(json.dumps(["salt", name, value]).encode()).decode().rstrip("=")
+
+
+def presentation(issuer_key, algorithm, holder_key=None, holder_algorithm="EdDSA", **claims):
+    disclosed = disclosure("legal_person_name", "Stub B.V.")
+    payload = {"iss": ISSUER, "vct": "LPID", "_sd": [base64url_digest(disclosed.encode())], **claims}
+    if holder_key is not None:
+        payload["cnf"] = {"jwk": public_jwk(holder_key.public_key())}
+    sd_jwt = f"{jwt.encode(payload, issuer_key, algorithm=algorithm, headers={'kid': 'issuer-key'})}~{disclosed}~"
+    if holder_key is None:
+        return sd_jwt
+    kb_claims = {"iat": int(time.time()), "aud": "verifier", "nonce": "n-1", "sd_hash": base64url_digest(sd_jwt.encode())}
+    return sd_jwt + jwt.encode(kb_claims, holder_key, algorithm=holder_algorithm, headers={"typ": "kb+jwt"})
+
+
+def verifier_for(issuer_key, algorithm):
+    jwks = {"keys": [{**public_jwk(issuer_key.public_key()), "alg": algorithm, "kid": "issuer-key"}]}
+    return PresentationVerifier(JWKSResolver(local_issuers={ISSUER: lambda: jwks}, trusted_issuers=[]))
+
+
+@pytest.mark.parametrize("issuer_key, algorithm", [
+    (ec.generate_private_key(ec.SECP256R1()), "ES256"),
+    (ed25519.Ed25519PrivateKey.generate(), "EdDSA"),
+])
+def test_verifies_issuer_signature_and_discloses_claims(issuer_key, algorithm):
+    result = verifier_for(issuer_key, algorithm).verify(presentation(issuer_key, algorithm))
+    assert result["claims"]["legal_person_name"] == "Stub B.V."
+    assert not result["key_binding"]
+
+
+def test_verifies_an_eddsa_key_binding_jwt():
+    issuer_key, holder_key = ed25519.Ed25519PrivateKey.generate(), ed25519.Ed25519PrivateKey.generate()
+    verifier = verifier_for(issuer_key, "EdDSA")
+    result = verifier.verify(presentation(issuer_key, "EdDSA", holder_key), audience="verifier", nonce="n-1", require_key_binding=True)
+    assert result["key_binding"]
+    with pytest.raises(VerificationError, match="nonce"):
+        verifier.verify(presentation(issuer_key, "EdDSA", holder_key), audience="verifier", nonce="n-2")
+
+
+def test_rejects_a_key_binding_jwt_signed_by_another_key():
+    issuer_key, holder_key = ed25519.Ed25519PrivateKey.generate(), ed25519.Ed25519PrivateKey.generate()
+    sd_jwt, _, _ = presentation(issuer_key, "EdDSA", holder_key).rpartition("~")
+    forged = presentation(issuer_key, "EdDSA", ed25519.Ed25519PrivateKey.generate()).rpartition("~")[2]
+    with pytest.raises(VerificationError, match="Invalid key binding JWT"):
+        verifier_for(issuer_key, "EdDSA").verify(f"{sd_jwt}~{forged}")
+
+
+def test_rejects_an_expired_eddsa_issuer_jwt_and_a_forged_signature():
+    issuer_key = ed25519.Ed25519PrivateKey.generate()
+    with pytest.raises(VerificationError, match="expired"):
+        verifier_for(issuer_key, "EdDSA").verify(presentation(issuer_key, "EdDSA", exp=int(time.time()) - 10))
+    with pytest.raises(VerificationError, match="Invalid issuer signature"):
+        verifier_for(issuer_key, "EdDSA").verify(presentation(ed25519.Ed25519PrivateKey.generate(), "EdDSA"))
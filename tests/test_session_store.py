@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from app.services import session_store
+from app.services.session_store import SessionFileCache, read_session_file, write_session_file
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_DIR", tmp_path)
+    monkeypatch.setattr(session_store, "session_cache", SessionFileCache(max_entries=2))
+    return tmp_path
+
+
+def test_unchanged_files_are_served_from_the_cache(sessions):
+    write_session_file(sessions / "a.json", {"status": "pending"})
+    first = read_session_file("a")
+    assert first == {"status": "pending"}
+    assert read_session_file("a") is first
+    assert session_store.session_cache.stats()["hits"] == 1
+
+
+def test_writes_from_this_and_other_processes_are_picked_up(sessions):
+    path = sessions / "a.json"
+    write_session_file(path, {"status": "pending"})
+    read_session_file("a")
+    write_session_file(path, {"status": "done"})
+    assert read_session_file("a") == {"status": "done"}
+    # Another process rewrites the file: mtime and size no longer match the cached entry
+    path.write_bytes(b'{"status": "failed", "error": "timeout"}')
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert read_session_file("a") == {"status": "failed", "error": "timeout"}
+
+
+def test_a_read_racing_a_write_does_not_cache_stale_data():
+    cache = SessionFileCache()
+    generation = cache.generation("a")
+    stat = os.stat(__file__)
+    cache.invalidate("a")
+    cache.put("a", stat, generation, {"status": "stale"})
+    assert cache.get("a", stat) is None
+
+
+def test_least_recently_used_sessions_are_evicted(sessions):
+    for name in "abc":
+        write_session_file(sessions / f"{name}.json", {"name": name})
+        read_session_file(name)
+    assert session_store.session_cache.stats()["evictions"] == 1
+
+
+def test_missing_empty_and_corrupt_files(sessions):
+    assert read_session_file("missing") is None
+    (sessions / "empty.json").write_bytes(b"")
+    assert read_session_file("empty")["error"] == "Empty session file"
+    (sessions / "corrupt.json").write_bytes(b"{")
+    assert read_session_file("corrupt")["error"].startswith("Corrupted session file")
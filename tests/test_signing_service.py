@@ -0,0 +1,64 @@
+import hashlib
+import json
+import subprocess
+import sys
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from app.services.key_manager import KeyManager, base64url_decode, base64url_encode
+from app.services.signing_service import SigningService
+
+CLAIMS = {"legal_person_name": "Stub B.V.", "legal_representatives": [{"full_name": "A"}, {"full_name": "B"}]}
+
+
+def decode_disclosure(disclosure):
+    return json.loads(base64url_decode(disclosure))
+
+
+def digest(disclosure):
+    # Over the disclosure JSON, as create_disclosures hashes it
+    return base64url_encode(hashlib.sha256(base64url_decode(disclosure)).digest())
+
+
+def test_worker_imports_do_not_build_the_app():
+    # What a spawned signing worker imports: the pickled function's module and the builder
+    code = (
+        "import sys, app.services.signing_service, app.services.sd_jwt_builder; "
+        "print(sorted(name for name in sys.modules if name in ('app.main', 'app.services.mini_suomi', 'app.routes')))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_app_is_built_on_access():
+    from app import app
+    from app.main import app as main_app
+
+    assert app is main_app
+
+
+def test_workers_sign_batches():
+    key_manager = KeyManager.generate("ES256")
+    signing_key = key_manager.active_key
+    service = SigningService(key_manager, processes=1, batch_window_ms=20)
+    headers = {"alg": "ES256", "typ": "vc+sd-jwt", "kid": signing_key.kid}
+    try:
+        credentials = service.sign_many([
+            (signing_key.kid, headers, {"iss": "https://issuer.test", "_sd": [], "n": n}, CLAIMS, frozenset({"legal_representatives"}))
+            for n in range(3)
+        ])
+    finally:
+        service.shutdown()
+    assert service.signed == 3
+    public_key = signing_key.private_key.public_key()
+    assert isinstance(public_key, ec.EllipticCurvePublicKey)
+    for n, credential in enumerate(credentials):
+        issuer_jwt, *disclosures, last = credential.split("~")
+        assert last == ""
+        payload = jwt.decode(issuer_jwt, public_key, algorithms=["ES256"])
+        assert payload["n"] == n
+        # One disclosure per claim plus one per representative element and member
+        assert len(disclosures) == 2 + 2 + 2
+        top_level = [disclosure for disclosure in disclosures if digest(disclosure) in payload["_sd"]]
+        assert sorted(decode_disclosure(disclosure)[1] for disclosure in top_level) == sorted(CLAIMS)
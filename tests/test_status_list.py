@@ -0,0 +1,106 @@
+import base64
+import threading
+import zlib
+
+import jwt
+import pytest
+
+from app.services.key_manager import KeyManager
+from app.services.status_list import STATUS_INVALID, STATUS_VALID, StatusList, StatusListService
+
+ISSUER = "https://issuer.test"
+URI = "https://issuer.test/status/1"
+
+
+@pytest.fixture
+def key_manager():
+    return KeyManager.generate("ES256")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "status-lists.sqlite3")
+
+
+def service(key_manager, db_path, **options):
+    return StatusListService(key_manager, ISSUER, db_path=db_path, list_size=1 << 16, reserve_block=10, **options)
+
+
+def listed_bits(token, key_manager):
+    claims = jwt.decode(token, key_manager.active_key.public_key, algorithms=["ES256"])
+    lst = claims["status_list"]["lst"]
+    return zlib.decompress(base64.urlsafe_b64decode(lst + "=" * (-len(lst) % 4)))
+
+
+class FailingWrites:
+    """Connection stand-in whose batch writes fail, as a full disk would."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, *args):
+        return self.db.execute(*args)
+
+    def executemany(self, *args):
+        raise OSError("disk full")
+
+
+def test_chunked_compression_matches_the_bitstring():
+    status_list = StatusList(1, 1 << 16, chunk_bytes=1024)
+    for index in (0, 7, 8191, 8192, 40000, (1 << 16) - 1):
+        status_list.set(index, STATUS_INVALID)
+    assert zlib.decompress(status_list.compressed()) == bytes(status_list.bits)
+    status_list.set(40000, STATUS_VALID)
+    assert zlib.decompress(status_list.compressed()) == bytes(status_list.bits)
+
+
+def test_processes_reserve_disjoint_indexes(key_manager, db_path):
+    first, second = service(key_manager, db_path), service(key_manager, db_path)
+    allocated = first.allocate(15) + second.allocate(15) + first.allocate(5)
+    assert len(set(allocated)) == len(allocated) == 35
+
+
+def test_released_indexes_are_reused(key_manager, db_path):
+    statuses = service(key_manager, db_path)
+    first = statuses.allocate(3)
+    statuses.release(first)
+    assert sorted(statuses.allocate(3)) == sorted(first)
+    assert not set(statuses.allocate(3)) & set(first)
+
+
+def test_revocations_reach_other_processes_and_their_tokens(key_manager, db_path):
+    revoking, serving = service(key_manager, db_path), service(key_manager, db_path)
+    list_id, index = revoking.allocate()[0]
+    serving._sync()
+    token, etag = serving.token(list_id, URI)
+    assert revoking.set_status([(list_id, index)]) == 1
+    assert serving.get_status(list_id, index) == STATUS_INVALID
+    revoked_token, revoked_etag = serving.token(list_id, URI)
+    assert revoked_etag != etag
+    assert listed_bits(revoked_token, key_manager)[index // 8] >> (index % 8) & 1
+
+
+def test_failed_revocation_leaves_no_bits_behind(key_manager, db_path):
+    statuses = service(key_manager, db_path)
+    list_id, index = statuses.allocate()[0]
+    db = statuses._db
+    statuses._db = FailingWrites(db)
+    with pytest.raises(OSError):
+        statuses.set_status([(list_id, index)])
+    statuses._db = db
+    assert statuses.get_status(list_id, index) == STATUS_VALID
+    assert statuses.set_status([(list_id, index)]) == 1
+
+
+def test_reads_wait_for_a_transaction_on_the_shared_connection(key_manager, db_path):
+    statuses = service(key_manager, db_path)
+    list_id, index = statuses.allocate()[0]
+    results = []
+    reader = threading.Thread(target=lambda: results.append(statuses.get_status(list_id, index)))
+    # As set_status holds it for its BEGIN IMMEDIATE ... COMMIT
+    with statuses._lock:
+        reader.start()
+        reader.join(0.2)
+        assert reader.is_alive()
+    reader.join()
+    assert results == [STATUS_VALID]
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from app.routes import rdw_niscy
+from app.services.revocation_store import RevocationStore
+from app.services.token_cache import VerifiedTokenCache
+
+
+def test_entries_never_outlive_the_token():
+    cache = VerifiedTokenCache(max_entries=10, ttl_seconds=300)
+    cache.put("live", {"sub": "a"}, exp=int(time.time()) + 60)
+    cache.put("expired", {"sub": "b"}, exp=int(time.time()) - 1)
+    assert cache.get("live") == {"sub": "a"}
+    assert cache.get("expired") is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_least_recently_used_tokens_are_evicted():
+    cache = VerifiedTokenCache(max_entries=2)
+    cache.put("first", 1, exp=None)
+    cache.put("second", 2, exp=None)
+    cache.get("first")
+    cache.put("third", 3, exp=None)
+    assert cache.get("second") is None
+    assert (cache.get("first"), cache.get("third")) == (1, 3)
+    cache.invalidate("first")
+    assert cache.get("first") is None
+
+
+def test_disabled_cache_keeps_nothing():
+    cache = VerifiedTokenCache(max_entries=0)
+    cache.put("token", 1, exp=None)
+    assert cache.get("token") is None
+
+
+def test_logouts_reach_other_workers_through_a_shared_revocation_store(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "revocations.sqlite3")
+    serving = RevocationStore(db_path=db_path, sync_interval=0)
+    monkeypatch.setattr(rdw_niscy, "revocation_store", serving)
+    monkeypatch.setattr(rdw_niscy, "verified_token_cache", VerifiedTokenCache())
+    token = rdw_niscy.create_access_token({"sub": "user"})
+    assert rdw_niscy.verify_token(token).sub == "user"
+    assert rdw_niscy.verified_token_cache.stats()["entries"] == 1
+
+    # The logout lands on another worker sharing the revocation database
+    jti = jwt.decode(token, options={"verify_signature": False})["jti"]
+    RevocationStore(db_path=db_path, sync_interval=0).revoke(jti, int(time.time()) + 60)
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(rdw_niscy.get_current_user(token))
+    assert rejected.value.status_code == 401
+    assert rdw_niscy.verified_token_cache.get(token) is None